@@ -1,35 +1,96 @@
-import json
-import os
 import uuid
 from datetime import datetime, timedelta
 
+import codec
+import config
+import forecast
+from backends import pluggable
+from indexes import CardSchedule, TextIndex, paginate
+from store import JsonStore
+
 ANKI_FILE = "anki.json"
+TOMBSTONE_LIMIT = 1000  # Deleted card ids kept for get_card_changes(); older deletions force a full resync
+
+_schedule = None
+
+def _get_schedule(data):
+    """Returns the review schedule for a deck, rebuilding it if the deck was (re)loaded."""
+    global _schedule
+    if _schedule is None or _schedule.data is not data:
+        _schedule = CardSchedule(data)
+    return _schedule
+
+_card_search = None  # (deck, TextIndex over front/back), built on the first search and kept current by the mutators
+
+def _index_card(data, card):
+    if _card_search is not None and _card_search[0] is data:
+        _card_search[1].set(card["id"], card["front"], card["back"])
+
+def _unindex_card(data, card):
+    if _card_search is not None and _card_search[0] is data:
+        _card_search[1].remove(card["id"])
+
+# Each change moves the deck's revision on and stamps the cards it touched with it; deleted ids are kept in
+# deleted_cards as [revision, id] pairs. deleted_floor is the newest revision whose deletions were dropped.
+
+def _next_revision(data):
+    data["revision"] = data.get("revision", 0) + 1
+
+def _touch(data, card):
+    card["revision"] = data["revision"]
 
+def _add_tombstone(data, card_id):
+    deleted = data.setdefault("deleted_cards", [])
+    deleted.append([data["revision"], card_id])
+    if len(deleted) > TOMBSTONE_LIMIT:
+        dropped = len(deleted) - TOMBSTONE_LIMIT
+        data["deleted_floor"] = deleted[dropped - 1][0]
+        del deleted[:dropped]
+
+# Mutators below load, change and save the deck inside _store.writing(), so concurrent ones can't drop each other
+_store = JsonStore(ANKI_FILE, lambda: {"cards": []}, on_load=_get_schedule,
+                   schema=codec.Deck if config.VALIDATE_SCHEMA else None)
+
+@pluggable
 def load_anki_data():
-    """Loads flashcard data from JSON file."""
-    if not os.path.exists(ANKI_FILE):
-        return {"cards": []}
-    try:
-        with open(ANKI_FILE, 'r') as file:
-            return json.load(file)
-    except json.JSONDecodeError:
-        print(f"Error decoding JSON from {ANKI_FILE}. Returning empty card list.")
-        return {"cards": []}
+    """Loads flashcard data, served from the in-memory cache unless the file changed on disk.
 
+    The returned document is shared with the cache: treat it as read-only, or pass it to save_anki_data().
+    Other threads may be changing it, so prefer the functions below, which read it under the store's lock.
+    """
+    return _store.load()
+
+@pluggable
 def save_anki_data(data):
     """Saves flashcard data to JSON file."""
-    with open(ANKI_FILE, 'w') as file:
-        json.dump(data, file, indent=4)
+    global _schedule, _card_search
+    with _store.writing() as current:
+        _schedule = _card_search = None  # The caller may have changed anything
+        # Past both, so saving an older copy still moves the revision forward (the page cache relies on it)
+        data["revision"] = max(data.get("revision", 0), current.get("revision", 0))
+        _next_revision(data)
+        for card in data["cards"]:
+            _touch(data, card)
+        data["deleted_floor"] = data["revision"]  # Deletions can't be told apart, so synced clients start over
+        _get_schedule(data)
+        _store.save(data)
 
-def create_card(front, back, reverse=False):
-    """Creates a new flashcard and its reverse if specified."""
-    data = load_anki_data()
-    today = datetime.now().strftime("%Y-%m-%d")
-    
-    # Create main card
-    card_id = uuid.uuid4().hex
-    new_card = {
-        "id": card_id,
+@pluggable
+def invalidate_cache():
+    """Forces the next read to re-parse the JSON file."""
+    _store.invalidate()
+
+@pluggable
+def batch():
+    """Groups several mutations into a single write of the JSON file.
+
+    Usage: `with batch(): ...` - every save inside the block is flushed once when it exits.
+    """
+    return _store.batch()
+
+def _new_card(front, back, reverse, today):
+    return {
+        "id": uuid.uuid4().hex,
         "front": front,
         "back": back,
         "reverse": reverse,
@@ -39,123 +100,267 @@ def create_card(front, back, reverse=False):
         "review_date": today,
         "created_date": today
     }
-    data["cards"].append(new_card)
-    
-    # Create reverse card if requested
-    if reverse:
-        reverse_id = uuid.uuid4().hex
-        reverse_card = {
-            "id": reverse_id,
-            "front": back,
-            "back": front,
-            "reverse": False,  # Don't mark the reverse card as reverse
-            "easiness_factor": 2.5,
-            "interval": 1,
-            "repetitions": 0,
-            "review_date": today,
-            "created_date": today
-        }
-        data["cards"].append(reverse_card)
-    
-    save_anki_data(data)
-    return card_id
 
+def _add_reverse_card(data, schedule, card, today):
+    """Creates the reverse of a card and links the two through pair_id."""
+    reverse_card = _new_card(card["back"], card["front"], False, today)  # Don't mark the reverse card as reverse
+    reverse_card["pair_id"] = card["id"]
+    card["pair_id"] = reverse_card["id"]
+    data["cards"].append(reverse_card)
+    _touch(data, card)
+    _touch(data, reverse_card)
+    schedule.add(reverse_card)
+    _index_card(data, reverse_card)
+
+def _remove_card(data, schedule, card):
+    schedule.remove(card)  # Also takes it out of data["cards"]
+    _unindex_card(data, card)
+    _add_tombstone(data, card["id"])
+
+@pluggable
+def create_card(front, back, reverse=False):
+    """Creates a new flashcard and its reverse if specified."""
+    with _store.writing() as data:
+        schedule = _get_schedule(data)
+        today = datetime.now().strftime("%Y-%m-%d")
+        
+        # Create main card
+        _next_revision(data)
+        new_card = _new_card(front, back, reverse, today)
+        _touch(data, new_card)
+        data["cards"].append(new_card)
+        schedule.add(new_card)
+        _index_card(data, new_card)
+        
+        # Create reverse card if requested
+        if reverse:
+            _add_reverse_card(data, schedule, new_card, today)
+        
+        _store.save(data)
+        return new_card["id"]
+
+@pluggable
 def get_card(card_id):
     """Retrieves a specific flashcard by ID."""
-    data = load_anki_data()
-    return next((card for card in data["cards"] if card["id"] == card_id), None)
+    with _store.reading() as data:
+        return _get_schedule(data).cards_by_id.get(card_id)
+
+@pluggable
+def list_cards(offset=0, limit=None, include_reverse=True):
+    """Returns a page of the deck in deck order. include_reverse=False leaves out cards flagged reverse."""
+    with _store.reading() as data:
+        cards = data["cards"]
+        if not include_reverse:
+            cards = (card for card in cards if not card.get("reverse"))
+        return list(paginate(cards, offset, limit))
+
+@pluggable
+def search_cards(query, limit=50):
+    """Returns up to limit cards whose front or back contains every word of the query, in deck order.
+
+    The last word also matches as a prefix.
+    """
+    global _card_search
+    with _store.reading() as data:
+        if _card_search is None or _card_search[0] is not data:
+            # Readers hold the lock, so the deck can't change while this is built
+            text_index = TextIndex()
+            text_index.add_many((card["id"], card["front"], card["back"]) for card in data["cards"])
+            _card_search = (data, text_index)
+        cards_by_id = _get_schedule(data).cards_by_id
+        return [cards_by_id[card_id] for card_id in _card_search[1].search(query, limit)]
+
+@pluggable
+def get_card_revision():
+    """Returns the deck's revision, a counter that moves on with every change."""
+    with _store.reading() as data:
+        return data.get("revision", 0)
 
+@pluggable
+def get_card_changes(since=0):
+    """Returns what changed in the deck after revision `since`, for clients keeping a synced copy.
+
+    Result: {"revision": current revision, "full": bool, "cards": [...], "deleted": [card ids]}. Apply the
+    deletions first, then the cards. "full" means the cards are the whole deck and the copy should be replaced;
+    that happens for since=0 and when deletions older than the last TOMBSTONE_LIMIT were forgotten.
+    """
+    with _store.reading() as data:
+        revision = data.get("revision", 0)
+        full = since <= 0 or since < data.get("deleted_floor", 0)
+        if full:
+            cards, deleted = [dict(card) for card in data["cards"]], []
+        elif since >= revision:
+            cards, deleted = [], []
+        else:
+            cards = [dict(card) for card in data["cards"] if card.get("revision", 0) > since]
+            deleted = [card_id for card_revision, card_id in data.get("deleted_cards", ()) if card_revision > since]
+        return {"revision": revision, "full": full, "cards": cards, "deleted": deleted}
+
+@pluggable
 def update_card(card_id, front, back, reverse=False):
     """Updates an existing flashcard."""
-    data = load_anki_data()
-    card = next((card for card in data["cards"] if card["id"] == card_id), None)
-    
-    if card:
-        # Check if this was previously a reverse card
-        was_reverse = card.get("reverse", False)
+    with _store.writing() as data:
+        schedule = _get_schedule(data)
+        card = schedule.cards_by_id.get(card_id)
         
-        # Update the card
-        card["front"] = front
-        card["back"] = back
-        card["reverse"] = reverse
-        
-        # Handle the reverse card
-        reverse_card = None
-        if was_reverse:
-            # Find the existing reverse card (if any)
-            for c in data["cards"]:
-                if c["front"] == card["back"] and c["back"] == card["front"]:
-                    reverse_card = c
-                    break
-        
-        if reverse and not was_reverse:
-            # Create a new reverse card
-            create_card(back, front, False)
-        elif not reverse and was_reverse and reverse_card:
-            # Remove the reverse card
-            data["cards"] = [c for c in data["cards"] if c["id"] != reverse_card["id"]]
-        elif reverse and was_reverse and reverse_card:
-            # Update existing reverse card
-            reverse_card["front"] = back
-            reverse_card["back"] = front
-        
-        save_anki_data(data)
+        if card:
+            # Check if this was previously a reverse card
+            was_reverse = card.get("reverse", False)
+            reverse_card = schedule.partner(card) if was_reverse else None
+            
+            # Update the card
+            _next_revision(data)
+            _touch(data, card)
+            card["front"] = front
+            card["back"] = back
+            card["reverse"] = reverse
+            _index_card(data, card)
+            
+            if reverse and not reverse_card:
+                # Create a new reverse card
+                _add_reverse_card(data, schedule, card, datetime.now().strftime("%Y-%m-%d"))
+            elif not reverse and reverse_card:
+                # Remove the reverse card
+                _remove_card(data, schedule, reverse_card)
+                card.pop("pair_id", None)
+            elif reverse and reverse_card:
+                # Update existing reverse card
+                reverse_card["front"] = back
+                reverse_card["back"] = front
+                _touch(data, reverse_card)
+                _index_card(data, reverse_card)
+            
+            _store.save(data)
 
+@pluggable
 def delete_card(card_id):
     """Deletes a flashcard and its reverse if it exists."""
-    data = load_anki_data()
-    card = next((card for card in data["cards"] if card["id"] == card_id), None)
-    
-    if card:
-        # Remove the card
-        data["cards"] = [c for c in data["cards"] if c["id"] != card_id]
-        
-        # If this is a card with a reverse, remove the reverse too
-        if card.get("reverse", False):
-            for c in list(data["cards"]):
-                if c["front"] == card["back"] and c["back"] == card["front"]:
-                    data["cards"] = [x for x in data["cards"] if x["id"] != c["id"]]
+    with _store.writing() as data:
+        schedule = _get_schedule(data)
+        card = schedule.cards_by_id.get(card_id)
         
-        save_anki_data(data)
+        if card:
+            _next_revision(data)
+            partner = schedule.partner(card)
+            
+            if partner and card.get("reverse", False):
+                # This card owns the pair, so its reverse goes too; the later one first keeps the other's position valid
+                for doomed in sorted((card, partner), key=schedule.position, reverse=True):
+                    _remove_card(data, schedule, doomed)
+            else:
+                _remove_card(data, schedule, card)
+                if partner:
+                    # Deleting the reverse side leaves the main card without one
+                    partner.pop("pair_id", None)
+                    partner["reverse"] = False
+                    _touch(data, partner)
+            
+            _store.save(data)
+
+@pluggable
+def migrate_reverse_pairs():
+    """Links existing reverse cards to their main card through pair_id and saves the deck.
 
+    Returns how many pairs are linked. Loading a deck infers the links in memory anyway; this persists them.
+    """
+    with _store.writing() as data:
+        _get_schedule(data)  # Building the schedule infers the missing links
+        linked = sum(1 for card in data["cards"] if card.get("reverse") and card.get("pair_id"))
+        _next_revision(data)
+        for card in data["cards"]:
+            if card.get("pair_id"):
+                _touch(data, card)
+        _store.save(data)
+        return linked
+
+@pluggable
 def get_due_cards():
-    """Returns all cards due for review."""
-    data = load_anki_data()
+    """Returns all cards due for review, most overdue first."""
     today = datetime.now().strftime("%Y-%m-%d")
+    with _store.reading() as data:
+        return _get_schedule(data).due(today)
+
+@pluggable
+def get_review_forecast(days=forecast.DEFAULT_DAYS, today=None, ratings=forecast.DEFAULT_RATINGS):
+    """Forecasts the reviews due over the next `days` days; see forecast.review_forecast for the result."""
+    with _store.reading() as data:
+        cards = data["cards"]
+        columns = ([card.get("review_date") for card in cards], [card.get("interval") for card in cards],
+                   [card.get("easiness_factor") for card in cards], [card.get("repetitions") for card in cards])
+    return forecast.review_forecast(*columns, today=today, days=days, ratings=ratings)
+
+def apply_sm2(card, rating, reviewed_at=None):
+    """Updates a card dict in place using the SM2 algorithm."""
+    if rating < 3:
+        # If rating is less than 3, reset repetitions
+        card["repetitions"] = 0
+        card["interval"] = 1
+    else:
+        # Calculate new interval
+        if card["repetitions"] == 0:
+            card["interval"] = 1
+        elif card["repetitions"] == 1:
+            card["interval"] = 6
+        else:
+            card["interval"] = round(card["interval"] * card["easiness_factor"])
+        
+        # Increment repetition counter
+        card["repetitions"] += 1
     
-    due_cards = [card for card in data["cards"] 
-                if card["review_date"] <= today]
+    # Update easiness factor
+    card["easiness_factor"] = max(1.3, card["easiness_factor"] + (0.1 - (5 - rating) * (0.08 + (5 - rating) * 0.02)))
     
-    return due_cards
+    # Calculate next review date
+    next_date = (reviewed_at or datetime.now()) + timedelta(days=card["interval"])
+    card["review_date"] = next_date.strftime("%Y-%m-%d")
 
+@pluggable
 def process_card_review(card_id, rating):
     """Processes a card review using the SM2 algorithm."""
-    data = load_anki_data()
-    card = next((card for card in data["cards"] if card["id"] == card_id), None)
-    
-    if card:
-        # Apply SM2 algorithm
-        if rating < 3:
-            # If rating is less than 3, reset repetitions
-            card["repetitions"] = 0
-            card["interval"] = 1
-        else:
-            # Calculate new interval
-            if card["repetitions"] == 0:
-                card["interval"] = 1
-            elif card["repetitions"] == 1:
-                card["interval"] = 6
-            else:
-                card["interval"] = round(card["interval"] * card["easiness_factor"])
-            
-            # Increment repetition counter
-            card["repetitions"] += 1
-        
-        # Update easiness factor
-        card["easiness_factor"] = max(1.3, card["easiness_factor"] + (0.1 - (5 - rating) * (0.08 + (5 - rating) * 0.02)))
+    with _store.writing() as data:
+        schedule = _get_schedule(data)
+        card = schedule.cards_by_id.get(card_id)
         
-        # Calculate next review date
-        next_date = datetime.now() + timedelta(days=card["interval"])
-        card["review_date"] = next_date.strftime("%Y-%m-%d")
-        
-        save_anki_data(data)
\ No newline at end of file
+        if card:
+            _next_revision(data)
+            _touch(data, card)
+            old_review_date = card["review_date"]
+            apply_sm2(card, rating)
+            schedule.reschedule(card, old_review_date)
+            _store.save(data)
+
+def parse_reviewed_at(value):
+    """Accepts a datetime, an ISO 8601 string or None (meaning now) and returns a naive local datetime."""
+    if value is None:
+        return datetime.now()
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value
+
+@pluggable
+def process_card_reviews(reviews):
+    """Applies a batch of (card_id, rating, reviewed_at) reviews in order and saves the deck once.
+
+    reviewed_at may be a datetime, an ISO 8601 string or None for now. Unknown card ids are skipped.
+    Returns the number of reviews applied.
+    """
+    # Parse everything up front so a bad timestamp can't leave the cached deck half updated
+    reviews = [(card_id, rating, parse_reviewed_at(reviewed_at)) for card_id, rating, reviewed_at in reviews]
+    with _store.writing() as data:
+        schedule = _get_schedule(data)
+        applied = 0
+        for card_id, rating, reviewed_at in reviews:
+            card = schedule.cards_by_id.get(card_id)
+            if card:
+                if not applied:
+                    _next_revision(data)
+                _touch(data, card)
+                old_review_date = card["review_date"]
+                apply_sm2(card, rating, reviewed_at)
+                schedule.reschedule(card, old_review_date)
+                applied += 1
+        if applied:
+            _store.save(data)
+        return applied
@@ -0,0 +1,287 @@
+"""Versioned JSON API under /api/v1, over the same data_handler/anki functions as the HTML pages.
+
+Every GET carries an ETag made from the revision of the store it reads (projects or flashcards) and answers a
+matching If-None-Match with 304 before loading anything, so a client polling unchanged data costs one revision
+lookup. GET /projects?since=<revision> and GET /cards?since=<revision> return only what changed after that
+revision (see data_handler.get_changes and anki.get_card_changes); the current one is in the X-Revision header.
+"""
+from datetime import datetime
+
+from flask import Blueprint, current_app, jsonify, request, url_for
+
+import config
+import data_handler
+
+try:
+    import anki
+except ImportError:
+    anki = None
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+PROJECT_FIELDS = ('title', 'description', 'status', 'start_date', 'target_completion_date', 'actual_completion_date')
+TASK_FIELDS = ('description', 'additional_info', 'status', 'start_date', 'target_completion_date',
+               'actual_completion_date')
+
+
+def _error(message, status):
+    return jsonify(error=message), status
+
+
+def _conditional(etag, revision, build):
+    """Returns build()'s result as JSON tagged with etag, or an empty 304 if the client already has that tag.
+
+    The revision is read before build() runs, so a write landing in between only makes the next poll refetch.
+    """
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    response.headers['X-Revision'] = str(revision)
+    response.cache_control.no_cache = True  # Clients may keep responses but must revalidate them
+    return response
+
+
+def _project_etag():
+    revision = data_handler.get_revision()
+    return f"p{revision}", revision
+
+
+def _card_etag():
+    revision = anki.get_card_revision()
+    return f"c{revision}", revision
+
+
+def _since():
+    """Returns ?since= as an int, None if absent. Raises ValueError if it isn't a number."""
+    since = request.args.get('since')
+    return None if since is None else int(since)
+
+
+def _page():
+    """Returns the (offset, limit) requested through ?offset= and ?limit=."""
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', config.PAGE_SIZE, type=int), 1), config.MAX_PAGE_SIZE)
+    return offset, limit
+
+
+def _body(required=()):
+    """Returns the request's JSON object, or None if it isn't one or lacks a required field."""
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or any(body.get(field) in (None, '') for field in required):
+        return None
+    return body
+
+
+# --- Projects, tasks and updates ---
+
+@api.route('/projects')
+def list_projects():
+    """Projects in a ?category= (paged like the HTML list), or with ?since= everything changed after a revision."""
+    try:
+        since = _since()
+    except ValueError:
+        return _error("since must be a revision number.", 400)
+    etag, revision = _project_etag()
+    if since is not None:
+        return _conditional(etag, revision, lambda: data_handler.get_changes(since))
+
+    category = request.args.get('category', 'active')
+    sort_by = request.args.get('sort_by')
+    order = request.args.get('order', 'asc')
+    offset, limit = _page()
+    return _conditional(etag, revision, lambda: {
+        'revision': revision,
+        'projects': data_handler.get_projects_by_category(category, sort_by, order, offset=offset, limit=limit),
+    })
+
+
+@api.route('/projects', methods=['POST'])
+def create_project():
+    body = _body(required=('title', 'start_date'))
+    if body is None:
+        return _error("Expected a JSON object with at least title and start_date.", 400)
+    project_id = data_handler.create_project(body['title'], body.get('description', ''), body['start_date'],
+                                             body.get('target_completion_date'), body.get('status', 'active'))
+    return jsonify(id=project_id), 201, {'Location': url_for('.get_project', project_id=project_id)}
+
+
+@api.route('/projects/<project_id>')
+def get_project(project_id):
+    """One project with all its tasks (or those with ?task_status=) and updates."""
+    etag, revision = _project_etag()
+    if request.if_none_match.contains_weak(etag):
+        return _conditional(etag, revision, None)
+    project = data_handler.get_project(project_id, task_status=request.args.get('task_status'))
+    if not project:
+        return _error("Project not found.", 404)
+    return _conditional(etag, revision, lambda: project)
+
+
+@api.route('/projects/<project_id>', methods=['PATCH'])
+def update_project(project_id):
+    """Changes the given PROJECT_FIELDS and leaves the rest (updates are edited through their own routes)."""
+    body = _body()
+    if body is None:
+        return _error("Expected a JSON object.", 400)
+    project = data_handler.query_project(project_id, fields=PROJECT_FIELDS + ('updates',))
+    if not project:
+        return _error("Project not found.", 404)
+    fields = {field: body.get(field, project.get(field)) for field in PROJECT_FIELDS}
+    data_handler.update_project(project_id, fields['title'], fields['description'], fields['status'],
+                                fields['start_date'], fields['target_completion_date'],
+                                fields['actual_completion_date'], project['updates'])
+    return jsonify(data_handler.get_project(project_id, task_status=None))
+
+
+@api.route('/tasks')
+def list_tasks():
+    """Tasks across projects, filtered by ?project_status= and ?task_status= (both repeatable) and paged."""
+    etag, revision = _project_etag()
+    sort_by = request.args.get('sort_by', 'due_date')
+    order = request.args.get('order', 'asc')
+    project_statuses = request.args.getlist('project_status') or None
+    task_statuses = request.args.getlist('task_status') or None
+    offset, limit = _page()
+    return _conditional(etag, revision, lambda: {
+        'revision': revision,
+        'tasks': data_handler.get_all_tasks(sort_by, order, project_statuses, task_statuses,
+                                            offset=offset, limit=limit),
+    })
+
+
+@api.route('/projects/<project_id>/tasks', methods=['POST'])
+def create_task(project_id):
+    body = _body(required=('description',))
+    if body is None:
+        return _error("Expected a JSON object with at least a description.", 400)
+    task_id = data_handler.create_task(project_id, body['description'], body.get('additional_info', ''),
+                                       body.get('start_date'), body.get('target_completion_date'),
+                                       body.get('actual_completion_date'), body.get('status', 'active'))
+    if task_id is None:
+        return _error("Project not found.", 404)
+    return jsonify(id=task_id), 201
+
+
+@api.route('/projects/<project_id>/tasks/<task_id>', methods=['PATCH'])
+def update_task(project_id, task_id):
+    body = _body()
+    if body is None:
+        return _error("Expected a JSON object.", 400)
+    project = data_handler.query_project(project_id, fields=('tasks',))
+    task = next((t for t in project['tasks'] if t['id'] == task_id), None) if project else None
+    if not task:
+        return _error("Task not found.", 404)
+    fields = {field: body.get(field, task.get(field)) for field in TASK_FIELDS}
+    data_handler.update_task(project_id, task_id, fields['description'], fields['additional_info'], fields['status'],
+                             fields['start_date'], fields['target_completion_date'], fields['actual_completion_date'])
+    return jsonify({**task, **fields})
+
+
+@api.route('/projects/<project_id>/updates', methods=['POST'])
+def add_update(project_id):
+    body = _body(required=('description',))
+    if body is None:
+        return _error("Expected a JSON object with a description.", 400)
+    if not data_handler.project_exists(project_id):
+        return _error("Project not found.", 404)
+    data_handler.add_project_update(project_id, body['description'])
+    return '', 204
+
+
+@api.route('/projects/<project_id>/updates/<update_id>', methods=['DELETE'])
+def delete_update(project_id, update_id):
+    if not data_handler.project_exists(project_id):
+        return _error("Project not found.", 404)
+    data_handler.delete_project_update(project_id, update_id)
+    return '', 204
+
+
+# --- Flashcards ---
+
+@api.before_request
+def require_anki():
+    if anki is None and request.path.startswith(f"{api.url_prefix}/cards"):
+        return _error("Flashcards are disabled because the anki module could not be found.", 404)
+
+
+@api.route('/cards')
+def list_cards():
+    """A page of the deck, or with ?since= what changed after a revision."""
+    try:
+        since = _since()
+    except ValueError:
+        return _error("since must be a revision number.", 400)
+    etag, revision = _card_etag()
+    if since is not None:
+        return _conditional(etag, revision, lambda: anki.get_card_changes(since))
+    offset, limit = _page()
+    # The deck's card dicts are shared with its cache, so they are copied before serializing outside the lock
+    return _conditional(etag, revision, lambda: {
+        'revision': revision, 'cards': [dict(card) for card in anki.list_cards(offset, limit)]})
+
+
+@api.route('/cards/due')
+def due_cards():
+    etag, revision = _card_etag()
+    today = datetime.now().strftime("%Y-%m-%d")
+    # Cards fall due as days pass without any write, so the day is part of the tag
+    return _conditional(f"{etag}-{today}", revision, lambda: {
+        'revision': revision, 'cards': [dict(card) for card in anki.get_due_cards()]})
+
+
+@api.route('/cards', methods=['POST'])
+def create_card():
+    body = _body(required=('front', 'back'))
+    if body is None:
+        return _error("Expected a JSON object with front and back.", 400)
+    card_id = anki.create_card(body['front'], body['back'], bool(body.get('reverse', False)))
+    return jsonify(id=card_id), 201, {'Location': url_for('.get_card', card_id=card_id)}
+
+
+@api.route('/cards/<card_id>')
+def get_card(card_id):
+    etag, revision = _card_etag()
+    if request.if_none_match.contains_weak(etag):
+        return _conditional(etag, revision, None)
+    card = anki.get_card(card_id)
+    if not card:
+        return _error("Card not found.", 404)
+    return _conditional(etag, revision, lambda: dict(card))
+
+
+@api.route('/cards/<card_id>', methods=['PATCH'])
+def update_card(card_id):
+    body = _body()
+    if body is None:
+        return _error("Expected a JSON object.", 400)
+    card = anki.get_card(card_id)
+    if not card:
+        return _error("Card not found.", 404)
+    anki.update_card(card_id, body.get('front', card['front']), body.get('back', card['back']),
+                     bool(body.get('reverse', card.get('reverse', False))))
+    return jsonify(dict(anki.get_card(card_id)))
+
+
+@api.route('/cards/<card_id>', methods=['DELETE'])
+def delete_card(card_id):
+    if not anki.get_card(card_id):
+        return _error("Card not found.", 404)
+    anki.delete_card(card_id)
+    return '', 204
+
+
+@api.route('/cards/<card_id>/review', methods=['POST'])
+def review_card(card_id):
+    body = _body(required=('rating',))
+    try:
+        rating = int(body['rating'])
+    except (TypeError, ValueError):
+        return _error("Expected a JSON object with a rating between 0 and 5.", 400)
+    if not 0 <= rating <= 5:
+        return _error("Ratings must be between 0 and 5.", 400)
+    if not anki.get_card(card_id):
+        return _error("Card not found.", 404)
+    anki.process_card_review(card_id, rating)
+    return jsonify(dict(anki.get_card(card_id)))
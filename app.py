@@ -1,20 +1,25 @@
-from flask import Flask, render_template, request, redirect, url_for, abort, session
+from flask import Flask, render_template, stream_template, request, redirect, url_for, abort, session, jsonify, Response
 import os
-from operator import itemgetter
+import config
+import metrics
 from datetime import datetime, timedelta
 from data_handler import (
-    get_project, get_projects_by_category, create_project, update_project,
+    query_project, project_exists, get_projects_by_category, create_project, update_project,
     create_task, update_task, get_all_tasks, add_project_update, delete_project_update,
-    load_data  # Assuming load_data is in data_handler.py
+    get_completion_calendar, search, get_revision
 )
 import utils  # Import the utils module
+import assets
+from api import api
+from page_cache import PageCache
 
 # --- Anki Imports ---
 # Assuming these functions exist in an 'anki.py' file or similar module
 try:
     from anki import (
-        load_anki_data, save_anki_data, create_card, get_card, update_card,
-        delete_card, get_due_cards, process_card_review
+        load_anki_data, save_anki_data, create_card, get_card, list_cards, update_card,
+        delete_card, get_due_cards, process_card_review, process_card_reviews, search_cards, get_card_revision,
+        get_review_forecast
     )
     anki_enabled = True
 except ImportError:
@@ -25,10 +30,15 @@ except ImportError:
     def save_anki_data(data): pass
     def create_card(f, b, r): pass
     def get_card(id): return None
+    def list_cards(offset=0, limit=None, include_reverse=True): return []
     def update_card(id, f, b, r): pass
     def delete_card(id): pass
     def get_due_cards(): return []
     def process_card_review(id, r): pass
+    def process_card_reviews(reviews): return 0
+    def search_cards(query, limit=50): return []
+    def get_card_revision(): return 0
+    def get_review_forecast(days=30, today=None): return {"days": [], "overdue": 0, "cards": 0, "engine": None}
 # --- End Anki Imports ---
 
 
@@ -37,13 +47,63 @@ app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'your_default_secret_key')
 
 STATIC_FOLDER = os.path.join(app.root_path, 'static')
 
+# What project_detail.html and edit_project.html show of a project
+PROJECT_PAGE_FIELDS = ('id', 'title', 'description', 'status', 'start_date', 'target_completion_date',
+                       'actual_completion_date', 'updates', 'tasks')
+
+app.register_blueprint(api)  # JSON API under /api/v1
+if config.METRICS_ENABLED:
+    metrics.init_app(app)
+
+# Stylesheets get fingerprinted, precompressed /assets URLs; the themes are prepared now rather than on first view
+asset_registry = assets.init_app(app, STATIC_FOLDER, utils.inject_css_files(STATIC_FOLDER)['css_files'])
+page_cache = PageCache(config.PAGE_CACHE_BYTES)
+
+
+def page_version():
+    """What cached pages depend on besides their URL and theme: the data revisions and the stylesheets on offer."""
+    css_files = utils.inject_css_files(STATIC_FOLDER)['css_files']
+    return get_revision(), get_card_revision(), asset_registry.fingerprints(css_files + ['favicon.png'])
+
 
 @app.context_processor
 def inject_css_and_static_folder():
-    """Injects CSS files and STATIC_FOLDER into the template context."""
+    """Injects the themes and STATIC_FOLDER into the template context."""
     return {**utils.inject_css_files(STATIC_FOLDER), 'STATIC_FOLDER': STATIC_FOLDER}
 
 
+def render_page(template, **context):
+    """Renders a template, streaming it out as it renders when PROJECT_TRACKER_STREAM is on."""
+    if config.STREAM_TEMPLATES:
+        return stream_template(template, **context)
+    return render_template(template, **context)
+
+
+def page_args():
+    """Returns the (page, per_page) requested through ?page= (1-based) and ?per_page=."""
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', config.PAGE_SIZE, type=int), 1), config.MAX_PAGE_SIZE)
+    return page, per_page
+
+
+def make_pager(page, per_page, items):
+    """Drops the extra item fetched to detect a next page and returns the pager for _pager.html."""
+    has_next = len(items) > per_page
+    del items[per_page:]
+    args = {**request.view_args, **request.args.to_dict(flat=False)}
+    def link(number):
+        return url_for(request.endpoint, **{**args, 'page': number})
+    return {'page': page, 'prev_url': link(page - 1) if page > 1 else None,
+            'next_url': link(page + 1) if has_next else None}
+
+
+if config.METRICS_ENABLED:
+    @app.route('/metrics')
+    def metrics_page():
+        """Serves the request, template and storage metrics for Prometheus."""
+        return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
 @app.route('/set_style', methods=['POST'])
 def set_style_route():
     """Route to set the selected stylesheet in the session."""
@@ -68,41 +128,25 @@ def add_project():
 
 
 @app.route("/project/<project_id>")
+@page_cache.page(page_version)
 def view_project(project_id):
     """Displays the details of a specific project."""
-    project = get_project(project_id, task_status='active')
-    if project:
-        sort_by = request.args.get('sort_by', 'due_date')
-        order = request.args.get('order', 'asc')
-        selected_task_statuses = request.args.getlist('task_status')
-
-        # Sort tasks based on parameters
-        if sort_by == 'due_date':
-            project['tasks'].sort(key=lambda x: x.get('target_completion_date', '') or '9999-12-31', reverse=(order == 'desc'))
-
-        # If other statuses are selected, override the default filtering
-        if selected_task_statuses:
-            # Reload project data to get *all* tasks before filtering
-            all_project_tasks = get_project(project_id)['tasks']
-            project['tasks'] = [task for task in all_project_tasks if task['status'] in selected_task_statuses]
-            # Re-sort after filtering if needed
-            if sort_by == 'due_date':
-                project['tasks'].sort(key=lambda x: x.get('target_completion_date', '') or '9999-12-31', reverse=(order == 'desc'))
-
-        else:
-            selected_task_statuses = ['active'] # Set default for template rendering
-
-        return render_template("project_detail.html", project_id=project_id, project=project, sort_by=sort_by,
-                               order=order, selected_task_statuses=selected_task_statuses)
-    else:
+    sort_by = request.args.get('sort_by', 'due_date')
+    order = request.args.get('order', 'asc')
+    selected_task_statuses = request.args.getlist('task_status') or ['active']
+
+    # Filtered and sorted in the data layer, in one pass
+    project = query_project(project_id, selected_task_statuses, sort_by, order, PROJECT_PAGE_FIELDS)
+    if not project:
         abort(404)
+    return render_template("project_detail.html", project_id=project_id, project=project, sort_by=sort_by,
+                           order=order, selected_task_statuses=selected_task_statuses)
 
 
 @app.route("/add_task/<project_id>", methods=["POST"])
 def add_task(project_id):
     """Handles adding a new task to a specific project."""
-    project = get_project(project_id)
-    if project:
+    if project_exists(project_id):
         description = request.form["description"]
         additional_info = request.form.get("additional_info", "")
         start_date = request.form.get("start_date")
@@ -119,39 +163,35 @@ def add_task(project_id):
 @app.route("/", defaults={"category": "active"}) # Make project list the default home page
 @app.route("/projects", defaults={"category": "active"})
 @app.route("/projects/<category>")
+@page_cache.page(page_version)
 def list_projects_by_category(category):
     """Lists projects, optionally filtered by category."""
     valid_categories = ["active", "on hold", "complete", "archived", "ongoing"]
     if category not in valid_categories:
         return redirect(url_for("list_projects_by_category", category="active"))
 
-    projects = get_projects_by_category(category)
-
     sort_by = request.args.get('sort_by', 'next_task_due_date')
     sort_order = request.args.get('order', 'asc')
+    page, per_page = page_args()
 
-    if sort_by == 'start_date':
-        projects.sort(key=itemgetter('start_date'), reverse=(sort_order == 'desc'))
-    elif sort_by == 'target_completion_date':
-        projects.sort(key=lambda p: p.get('target_completion_date') or '9999-12-31', reverse=(sort_order == 'desc'))
-    elif sort_by == 'next_task_due_date':
-        projects.sort(key=lambda p: p.get('next_task_due_date', '9999-12-31'), reverse=(sort_order == 'desc'))
+    # Sorted by the data layer so only one page of projects is copied
+    projects = get_projects_by_category(category, sort_by, sort_order, offset=(page - 1) * per_page, limit=per_page + 1)
+    pager = make_pager(page, per_page, projects)
 
-    return render_template("projects.html", projects=projects, current_category=category, categories=valid_categories,
-                           sort_by=sort_by, sort_order=sort_order)
+    return render_page("projects.html", projects=projects, current_category=category, categories=valid_categories,
+                       sort_by=sort_by, sort_order=sort_order, pager=pager)
 
 
 @app.route('/project/<project_id>/edit', methods=['GET', 'POST'])
 def edit_project(project_id):
     """Displays the form to edit a project and handles updating the project."""
-    project = get_project(project_id)
-    if not project:
-        abort(404)
-
     sort_by = request.args.get('sort_by', 'start_date')
     order = request.args.get('order', 'asc')
 
     if request.method == "POST":
+        project = query_project(project_id, fields=('updates',))
+        if not project:
+            abort(404)
         title = request.form["title"]
         description = request.form.get("description", "")
         status = request.form["status"]
@@ -180,15 +220,10 @@ def edit_project(project_id):
         return redirect(url_for("view_project", project_id=project_id))
 
     else:
-        # Sorting tasks for display within the edit form
-        tasks = project.get('tasks', [])
-        if sort_by == 'start_date':
-            tasks.sort(key=lambda x: x.get('start_date', '') or '9999-12-31', reverse=(order == 'desc'))
-        elif sort_by == 'status':
-            status_order = {'active': 0, 'on hold': 1, 'complete': 2, 'archived': 3, 'ongoing': 4}
-            tasks.sort(key=lambda x: status_order.get(x.get('status'), 999), reverse=(order == 'desc'))
-        project['tasks'] = tasks # Update the project dict with sorted tasks
-
+        # The edit form lists the active tasks, sorted by start date or status
+        project = query_project(project_id, ['active'], sort_by, order, PROJECT_PAGE_FIELDS)
+        if not project:
+            abort(404)
         return render_template('edit_project.html', project=project, sort_by=sort_by, order=order,
                                show_delete_buttons=True)
 
@@ -196,11 +231,11 @@ def edit_project(project_id):
 @app.route("/edit_task/<project_id>/<task_id>", methods=["GET", "POST"])
 def edit_task(project_id, task_id):
     """Displays the form to edit a specific task and handles updating the task."""
-    project = get_project(project_id)
+    project = query_project(project_id, fields=('tasks',))
     if not project:
         abort(404)
 
-    task = next((t for t in project.get('tasks', []) if t['id'] == task_id), None)
+    task = next((t for t in project['tasks'] if t['id'] == task_id), None)
     if not task:
         abort(404)
 
@@ -219,6 +254,7 @@ def edit_task(project_id, task_id):
 
 
 @app.route('/tasks')
+@page_cache.page(page_version)
 def list_all_tasks():
     """Lists all tasks with optional sorting and filtering."""
     sort_by = request.args.get('sort_by', 'due_date')
@@ -226,18 +262,21 @@ def list_all_tasks():
     selected_project_statuses = request.args.getlist('project_status') or ['active', 'ongoing']
     selected_task_statuses = request.args.getlist('task_status') or ['active']
 
-    tasks = get_all_tasks(sort_by, order, selected_project_statuses, selected_task_statuses)
+    page, per_page = page_args()
+
+    tasks = get_all_tasks(sort_by, order, selected_project_statuses, selected_task_statuses,
+                          offset=(page - 1) * per_page, limit=per_page + 1)
+    pager = make_pager(page, per_page, tasks)
 
-    return render_template('tasks.html', tasks=tasks, sort_by=sort_by, order=order,
-                           selected_project_statuses=selected_project_statuses,
-                           selected_task_statuses=selected_task_statuses)
+    return render_page('tasks.html', tasks=tasks, sort_by=sort_by, order=order,
+                       selected_project_statuses=selected_project_statuses,
+                       selected_task_statuses=selected_task_statuses, pager=pager)
 
 
 @app.route("/project/<project_id>/add_update", methods=["POST"])
 def add_update(project_id):
     """Adds a new update to the specified project."""
-    project = get_project(project_id)
-    if project:
+    if project_exists(project_id):
         update_text = request.form.get("update_text")
         if update_text:
             add_project_update(project_id, update_text)
@@ -250,8 +289,7 @@ def add_update(project_id):
 @app.route("/project/<project_id>/delete_update/<update_id>", methods=["POST"])
 def delete_update(project_id, update_id):
     """Deletes the specified update from the project."""
-    project = get_project(project_id)
-    if project:
+    if project_exists(project_id):
         delete_project_update(project_id, update_id)
          # Redirect back to the edit page after deleting an update
         return redirect(url_for("edit_project", project_id=project_id))
@@ -260,57 +298,36 @@ def delete_update(project_id, update_id):
 
 
 @app.route("/calendar")
+@page_cache.page(page_version)
 def productivity_calendar():
     """Displays productivity heatmap calendar"""
+    today = datetime.today().date()
+    num_weeks = 53
     try:
-        data = load_data()
-        completion_dates = []
-
-        # Get all completion dates from projects and tasks
-        for project in data.get('projects', []):
-            if project.get('actual_completion_date'):
-                completion_dates.append(project['actual_completion_date'])
-            for task in project.get('tasks', []):
-                if task.get('actual_completion_date'):
-                    completion_dates.append(task['actual_completion_date'])
-
-        # Create date counts dictionary
-        date_counts = {}
-        for date_str in completion_dates:
-            try:
-                date = datetime.strptime(date_str, '%Y-%m-%d').date()
-                date_counts[date] = date_counts.get(date, 0) + 1
-            except (ValueError, TypeError):
-                print(f"Warning: Skipping invalid date format in calendar: {date_str}")
-                continue # Skip invalid dates
-
-        # Generate calendar dates (53 weeks)
-        today = datetime.today().date()
-        num_weeks = 53
-        total_days = num_weeks * 7
-        start_date = today - timedelta(days=total_days - 1)
-
-        calendar_dates = [start_date + timedelta(days=i) for i in range(total_days)]
-
-        if not calendar_dates: # Should not happen with the logic above, but defensive check
-             calendar_dates = [today]
-
+        # Dense (date, count) pairs for the whole window, read from the maintained completion histogram
+        calendar_days = get_completion_calendar(num_weeks=num_weeks, today=today)
     except Exception as e:
         print(f"Error generating calendar data: {e}")
-        # Provide defaults in case of error loading data or processing dates
-        date_counts = {}
-        today = datetime.today().date()
-        num_weeks = 53
-        total_days = num_weeks * 7
-        start_date = today - timedelta(days=total_days - 1)
-        calendar_dates = [start_date + timedelta(days=i) for i in range(total_days)]
-
+        # Provide an empty calendar in case of error loading data
+        start_date = today - timedelta(days=num_weeks * 7 - 1)
+        calendar_days = [(start_date + timedelta(days=i), 0) for i in range(num_weeks * 7)]
 
     return render_template("calendar.html",
-                           date_counts=date_counts,
-                           calendar_dates=calendar_dates,
+                           calendar_days=calendar_days,
                            today=today)
 
+
+@app.route("/search")
+@page_cache.page(page_version)
+def search_page():
+    """Searches projects, tasks, project updates and flashcards for every word of ?q=."""
+    query = request.args.get('q', '').strip()
+    results, cards = [], []
+    if query:
+        results = search(query)
+        cards = search_cards(query)
+    return render_template("search.html", query=query, results=results, cards=cards)
+
 # --- End Project Management Routes ---
 
 
@@ -344,14 +361,52 @@ if anki_enabled:
             return redirect(url_for("anki_review")) # Redirect back on error
 
 
+    @app.route("/anki/review_batch", methods=["POST"])
+    def review_batch():
+        """Processes a batch of flashcard reviews queued by the review page, saving the deck once."""
+        payload = request.get_json(force=True, silent=True) or {}
+        try:
+            reviews = [(review["card_id"], int(review["rating"]), review.get("reviewed_at"))
+                       for review in payload.get("reviews", [])]
+        except (KeyError, TypeError, ValueError, AttributeError):
+            return jsonify(error="Malformed review batch."), 400
+        if any(not 0 <= rating <= 5 for _, rating, _ in reviews):
+            return jsonify(error="Ratings must be between 0 and 5."), 400
+
+        try:
+            processed = process_card_reviews(reviews)
+            return jsonify(processed=processed)
+        except ValueError:
+            # Raised for unparseable reviewed_at timestamps
+            return jsonify(error="Malformed review timestamp."), 400
+        except Exception as e:
+            print(f"Error processing Anki review batch: {e}")
+            return jsonify(error="Could not save reviews."), 500
+
+
+    @app.route("/anki/forecast")
+    @page_cache.page(page_version)
+    def anki_forecast():
+        """Shows how many cards come due each day and the review load SM2 projects from them."""
+        days = request.args.get('days', 30, type=int)
+        try:
+            forecast = get_review_forecast(days)
+            return render_template("anki_forecast.html", forecast=forecast)
+        except Exception as e:
+            print(f"Error forecasting Anki reviews: {e}")
+            return render_template("anki_forecast.html", forecast=None, error="Could not load card data.")
+
+
     @app.route("/anki/manage")
+    @page_cache.page(page_version)
     def manage_cards():
-        """Lists all flashcards for management."""
+        """Lists the flashcards for management, a page at a time."""
         try:
-            # Make sure load_anki_data returns a dict with a 'cards' key
-            data = load_anki_data()
-            cards = data.get("cards", [])
-            return render_template("edit_anki.html", cards=cards, mode='list') # Add mode for template logic
+            page, per_page = page_args()
+            # Reverse-flagged cards aren't listed (see edit_anki.html), so leave them out before paging
+            cards = list_cards(offset=(page - 1) * per_page, limit=per_page + 1, include_reverse=False)
+            pager = make_pager(page, per_page, cards)
+            return render_page("edit_anki.html", cards=cards, mode='list', pager=pager) # Add mode for template logic
         except Exception as e:
             print(f"Error loading Anki data for management: {e}")
             return render_template("edit_anki.html", cards=[], mode='list', error="Could not load card data.")
@@ -415,6 +470,7 @@ else:
     # Optional: Add routes that inform the user Anki is disabled if they try to access /anki/*
     @app.route("/anki")
     @app.route("/anki/manage")
+    @app.route("/anki/forecast")
     @app.route("/anki/add")
     @app.route("/anki/edit/<card_id>")
     def anki_disabled(*args, **kwargs):
@@ -432,4 +488,5 @@ if __name__ == "__main__":
     # Example: if anki_enabled and anki.ANKI_DATA_FILE and not os.path.exists(anki.ANKI_DATA_FILE):
     #     anki.save_anki_data({"cards": []}) # Create empty Anki file
 
+    # Development server with the reloader and debugger; use serve.py for anything else
     app.run(debug=True)
\ No newline at end of file
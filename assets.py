@@ -0,0 +1,193 @@
+"""Fingerprinted, precompressed static assets and compressed HTML responses.
+
+Templates link static files through asset_url(file), which points at /assets/<name>.<hash><ext>, the hash
+covering the file's contents. Such a URL always means the same bytes, so it is served with a year-long
+immutable Cache-Control and browsers stop revalidating stylesheets on every navigation. Text assets are
+compressed once, at the highest level, when they are fingerprinted (every theme at start-up), with gzip and,
+when the brotli package is installed, brotli; each request gets the variant its Accept-Encoding prefers.
+
+HTML responses of at least COMPRESS_MIN_BYTES are compressed the same way per request (see compress_response).
+Streamed pages are gzipped chunk by chunk, so they still reach the browser while they render.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+import time
+import zlib
+
+from flask import Response, abort, request, url_for
+from werkzeug.security import safe_join
+
+import config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)  # In order of preference when the client accepts several
+ASSET_MAX_AGE = 365 * 24 * 3600
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+# Per-response settings: fast enough to be worth it on every page, unlike the highest levels used for assets
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def compress(body, encoding, best=False):
+    """Compresses bytes with 'br' or 'gzip'; best=True trades time for size, for content compressed once."""
+    if encoding == 'br':
+        return brotli.compress(body, quality=11 if best else BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=9 if best else GZIP_LEVEL, mtime=0)
+
+
+def html_encoding(size):
+    """Returns the encoding to send an HTML body of `size` bytes in for the current request, or None."""
+    if not config.COMPRESS_HTML or size < config.COMPRESS_MIN_BYTES:
+        return None
+    return request.accept_encodings.best_match(ENCODINGS)
+
+
+class AssetRegistry:
+    """Fingerprints and compressed variants of the files in a static folder.
+
+    A file is fingerprinted on first use and again whenever it changes, which is checked at most every
+    `check_interval` seconds. Each asset is a dict with the `file`, its fingerprinted `url_name`, `mimetype`,
+    `etag` and `variants` (encoding -> bytes, None for the uncompressed file). The version a change replaced
+    stays servable, so pages rendered just before it keep working; older ones are dropped.
+    """
+
+    def __init__(self, folder, check_interval=config.THEME_CHECK_INTERVAL):
+        self.folder = folder
+        self.check_interval = check_interval
+        self._by_file = {}  # file -> current asset
+        self._by_url = {}  # url_name -> asset, for the current and previous version of each file
+        self._lock = threading.Lock()
+
+    def get(self, file):
+        """Returns the current asset for a file in the folder, or None if there is no such file."""
+        asset = self._by_file.get(file)
+        now = time.monotonic()
+        if asset is not None and now - asset['checked'] < self.check_interval:
+            return asset
+        path = safe_join(self.folder, file)
+        try:
+            stat = os.stat(path) if path else None
+        except OSError:
+            stat = None
+        if stat is None:
+            with self._lock:
+                removed = self._by_file.pop(file, None)
+                if removed is not None:
+                    self._by_url.pop(removed['url_name'], None)
+                    self._by_url.pop(removed['previous'], None)
+            return None
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if asset is None or asset['signature'] != signature:
+            return self._build(file, path, signature, now)
+        asset['checked'] = now
+        return asset
+
+    def _build(self, file, path, signature, now):
+        with open(path, 'rb') as f:
+            content = f.read()
+        digest = hashlib.sha256(content).hexdigest()[:12]
+        name, extension = os.path.splitext(file)
+        mimetype = mimetypes.guess_type(file)[0] or 'application/octet-stream'
+        variants = {None: content}
+        if mimetype.startswith(COMPRESSIBLE_TYPES):
+            for encoding in ENCODINGS:
+                compressed = compress(content, encoding, best=True)
+                if len(compressed) < len(content):
+                    variants[encoding] = compressed
+        asset = {'file': file, 'url_name': f"{name}.{digest}{extension}", 'mimetype': mimetype, 'etag': digest,
+                 'variants': variants, 'signature': signature, 'checked': now, 'previous': None}
+        with self._lock:
+            replaced = self._by_file.get(file)
+            if replaced is not None:
+                if replaced['url_name'] == asset['url_name']:  # Touched but unchanged
+                    asset['previous'] = replaced['previous']
+                else:
+                    self._by_url.pop(replaced['previous'], None)
+                    asset['previous'] = replaced['url_name']
+            self._by_file[file] = asset
+            self._by_url[asset['url_name']] = asset
+        return asset
+
+    def by_url_name(self, url_name):
+        return self._by_url.get(url_name)
+
+    def fingerprints(self, files):
+        """Returns the fingerprinted names of files (None for missing ones), for cache keys."""
+        return tuple(asset['url_name'] if asset else None for asset in map(self.get, files))
+
+    def url(self, file):
+        """The fingerprinted URL of a static file, or its plain /static URL if it can't be read."""
+        asset = self.get(file)
+        if asset is None:
+            return url_for('static', filename=file)
+        return url_for('asset', url_name=asset['url_name'])
+
+    def serve(self, url_name):
+        """Answers a request for a fingerprinted asset."""
+        asset = self.by_url_name(url_name)
+        if asset is None:
+            abort(404)
+        encodings = [encoding for encoding in ENCODINGS if encoding in asset['variants']]
+        encoding = request.accept_encodings.best_match(encodings) if encodings else None
+        response = Response(asset['variants'][encoding], mimetype=asset['mimetype'])
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if len(asset['variants']) > 1:
+            response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = f"public, max-age={ASSET_MAX_AGE}, immutable"
+        response.set_etag(f"{asset['etag']}-{encoding}" if encoding else asset['etag'])
+        return response.make_conditional(request)
+
+
+def _gzip_stream(chunks):
+    """Gzips a streamed body, flushing after every chunk so the browser can render as it arrives."""
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: with the gzip header and trailer
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode() if isinstance(chunk, str) else chunk)
+        yield data + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def compress_response(response):
+    """after_request hook compressing HTML for clients that accept it."""
+    if (response.status_code != 200 or response.mimetype != 'text/html' or response.direct_passthrough
+            or not config.COMPRESS_HTML):
+        return response
+    response.vary.add('Accept-Encoding')
+    if 'Content-Encoding' in response.headers:  # Already compressed, by the page cache
+        return response
+    if response.is_streamed:
+        # The size isn't known up front, and brotli has no cheap per-chunk flush, so streams are always gzipped
+        if request.accept_encodings.best_match(('gzip',)):
+            response.response = _gzip_stream(response.response)
+            response.headers['Content-Encoding'] = 'gzip'
+            response.headers.pop('Content-Length', None)
+        return response
+    body = response.get_data()
+    encoding = html_encoding(len(body))
+    if encoding:
+        response.set_data(compress(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_app(app, folder, files=()):
+    """Serves the folder's assets under /assets, adds asset_url() to templates and compresses HTML responses.
+
+    `files` are fingerprinted and compressed right away, so the first page doesn't pay for it. Returns the
+    AssetRegistry.
+    """
+    registry = AssetRegistry(folder)
+    app.add_url_rule('/assets/<path:url_name>', 'asset', registry.serve)
+    app.add_template_global(registry.url, 'asset_url')
+    app.after_request(compress_response)
+    for file in files:
+        registry.get(file)
+    return registry
@@ -0,0 +1,42 @@
+import functools
+
+import config
+import metrics
+
+_BACKENDS = ('json', 'sqlite', 'sharded')
+if config.STORAGE_BACKEND not in _BACKENDS:
+    raise ValueError(f"Unknown storage backend {config.STORAGE_BACKEND!r}, expected one of {_BACKENDS}")
+
+_backend = None
+
+def get_backend():
+    """Returns the configured non-JSON backend, creating it on first use, or None for the JSON files."""
+    global _backend
+    if _backend is None and config.STORAGE_BACKEND == 'sqlite':
+        from sqlite_backend import SqliteBackend
+        _backend = SqliteBackend(config.SQLITE_FILE)
+    elif _backend is None and config.STORAGE_BACKEND == 'sharded':
+        from sharded_backend import ShardedBackend
+        _backend = ShardedBackend(config.SHARD_DIR)
+    return _backend
+
+def pluggable(func):
+    """Routes a data access function to the method of the same name on the configured backend.
+
+    With the default JSON backend the function itself is called, as it is for functions the configured backend
+    doesn't implement (the sharded backend leaves the flashcards in anki.json). Unless PROJECT_TRACKER_METRICS=0, every call
+    is also timed into metrics.DATA_CALL_SECONDS.
+    """
+    name = func.__name__
+    if config.STORAGE_BACKEND == 'json':
+        call = func
+    else:
+        @functools.wraps(func)
+        def call(*args, **kwargs):
+            method = getattr(get_backend(), name, None)
+            if method is None:
+                return func(*args, **kwargs)
+            return method(*args, **kwargs)
+    if config.METRICS_ENABLED:
+        return metrics.timed(metrics.DATA_CALL_SECONDS, call, name)
+    return call
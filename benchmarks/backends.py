@@ -0,0 +1,83 @@
+"""Compares the JSON, SQLite and sharded storage backends on the same synthetic dataset.
+
+Usage: python -m benchmarks.backends [--projects N] [--tasks N] [--updates N] [--cards N] [--repeat N]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+# The module-level functions must be the JSON implementations regardless of the caller's environment
+os.environ['PROJECT_TRACKER_BACKEND'] = 'json'
+
+import anki  # noqa: E402
+import data_handler  # noqa: E402
+from benchmarks.generate import build_dataset  # noqa: E402
+from sharded_backend import split_json  # noqa: E402
+from sqlite_backend import migrate_from_json  # noqa: E402
+
+
+def _time(func, repeat):
+    """Returns the best wall-clock time in milliseconds over `repeat` runs."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='bench-backends-')
+    os.chdir(workdir)
+    project_doc, anki_doc = build_dataset(args.projects, args.tasks, args.updates, args.cards)
+    data_handler.save_data(project_doc)
+    anki.save_anki_data(anki_doc)
+    sqlite = migrate_from_json(os.path.join(workdir, 'bench.db'), anki.ANKI_FILE)
+    sharded = split_json(os.path.join(workdir, 'shards'))
+
+    project_id = project_doc['projects'][len(project_doc['projects']) // 2]['id']
+    task_id = project_doc['projects'][len(project_doc['projects']) // 2]['tasks'][0]['id']
+    card_id = anki_doc['cards'][len(anki_doc['cards']) // 2]['id']
+
+    def cold(func):
+        # Measures the cost including a full re-parse of the JSON file
+        def wrapper():
+            data_handler.invalidate_cache()
+            anki.invalidate_cache()
+            func()
+        return wrapper
+
+    cases = [
+        ("get_project", lambda b: b.get_project(project_id)),
+        ("get_projects_by_category", lambda b: b.get_projects_by_category('active')),
+        ("get_all_tasks", lambda b: b.get_all_tasks('due_date', 'asc', ['active', 'ongoing'], ['active'])),
+        ("update_task", lambda b: b.update_task(project_id, task_id, "Task", "", "active", None, "2024-01-01", None)),
+        ("add_project_update", lambda b: b.add_project_update(project_id, "benchmark")),
+        ("get_due_cards", lambda b: b.get_due_cards()),
+        ("process_card_review", lambda b: b.process_card_review(card_id, 4)),
+    ]
+    print(f"{'operation':28} {'json cold':>12} {'json warm':>12} {'sqlite':>12} {'sharded':>12}"
+          f"   (best of {args.repeat}, ms)")
+    for name, case in cases:
+        json_cold = _time(cold(lambda: case(data_handler if hasattr(data_handler, name) else anki)), args.repeat)
+        json_warm = _time(lambda: case(data_handler if hasattr(data_handler, name) else anki), args.repeat)
+        sqlite_time = _time(lambda: case(sqlite), args.repeat)
+        # Flashcards aren't sharded; their row repeats the JSON timing
+        sharded_time = _time(lambda: case(sharded if hasattr(sharded, name) else anki), args.repeat)
+        print(f"{name:28} {json_cold:12.2f} {json_warm:12.2f} {sqlite_time:12.2f} {sharded_time:12.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--projects', type=int, default=1000)
+    parser.add_argument('--tasks', type=int, default=20)
+    parser.add_argument('--updates', type=int, default=10)
+    parser.add_argument('--cards', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
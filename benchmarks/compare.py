@@ -0,0 +1,56 @@
+"""Compares two saved benchmark runs and flags regressions.
+
+Usage: python -m benchmarks.compare BASELINE.json CANDIDATE.json [--threshold PERCENT]
+
+Compares median times. Exits with status 1 if any benchmark got slower by more than the threshold (default 10%).
+Warns when the runs used different scales, backends or settings, since their numbers aren't comparable then.
+"""
+import argparse
+import json
+import sys
+
+SETTINGS = ('suite', 'backend', 'journal', 'metrics', 'scale', 'seed')
+
+
+def compare(baseline, candidate, threshold):
+    """Prints a comparison table and returns the names of the regressed benchmarks."""
+    for setting in SETTINGS:
+        if baseline.get(setting) != candidate.get(setting):
+            print(f"WARNING: {setting} differs: {baseline.get(setting)} vs {candidate.get(setting)}")
+
+    regressions = []
+    print(f"{'benchmark':60} {'baseline':>10} {'candidate':>10} {'change':>9}   (median ms)")
+    for name, before in baseline['results'].items():
+        after = candidate['results'].get(name)
+        if after is None:
+            print(f"{name:60} {before['median_ms']:10.3f} {'-':>10}")
+            continue
+        change = (after['median_ms'] - before['median_ms']) / before['median_ms'] * 100 if before['median_ms'] else 0
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f"{name:60} {before['median_ms']:10.3f} {after['median_ms']:10.3f} {change:+8.1f}%{flag}")
+    for name in candidate['results'].keys() - baseline['results'].keys():
+        print(f"{name:60} {'-':>10} {candidate['results'][name]['median_ms']:10.3f}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=10.0, help="Allowed slowdown in percent")
+    args = parser.parse_args(argv)
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.candidate) as file:
+        candidate = json.load(file)
+    regressions = compare(baseline, candidate, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) slower than the {args.threshold:g}% threshold")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
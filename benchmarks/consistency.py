@@ -0,0 +1,132 @@
+"""Converts a journaled JSON store into the SQLite and sharded backends and checks all three serve the same data.
+
+Usage: python -m benchmarks.consistency [--projects N] [--tasks N] [--updates N] [--seed N] [--dir PATH]
+
+The JSON files are written with PROJECT_TRACKER_JOURNAL=1 and left with changes still in their journals and a project
+an interrupted archive move left in both tiers. After the conversion, and again after the same edits are made through
+every backend, load_data() must return the same projects and search() the same results, both in the same order.
+Exits with status 1 on any difference.
+"""
+import argparse
+import copy
+import os
+import random
+import sys
+import tempfile
+
+# The module-level functions must be the journaled JSON implementations regardless of the caller's environment
+os.environ['PROJECT_TRACKER_BACKEND'] = 'json'
+os.environ['PROJECT_TRACKER_JOURNAL'] = '1'
+
+import codec  # noqa: E402
+import data_handler  # noqa: E402
+from benchmarks.generate import build_dataset  # noqa: E402
+from sharded_backend import split_json  # noqa: E402
+from sqlite_backend import migrate_from_json  # noqa: E402
+
+
+def _write_store(directory, args):
+    """Writes the snapshots, with one project in both tiers, then makes journaled changes on top of them."""
+    document, _ = build_dataset(args.projects, args.tasks, args.updates, 0)
+    data_handler.save_data(document)
+    data_handler.invalidate_cache()
+    # An archive move interrupted between its two writes leaves the project in both files
+    with open(data_handler.ARCHIVE_FILE, 'rb') as file:
+        archive = codec.loads(file.read())
+    with open(data_handler.DATA_FILE, 'rb') as file:
+        hot = codec.loads(file.read())
+    archive['projects'].append(dict(hot['projects'][0]))
+    with open(data_handler.ARCHIVE_FILE, 'wb') as file:
+        file.write(codec.dumps(archive))
+    data_handler.invalidate_cache()
+
+    rng = random.Random(args.seed)
+    for i in range(3):
+        project_id = data_handler.create_project(f"Journaled {i}", "Not compacted yet", "2024-01-01", "2024-06-01")
+        data_handler.create_task(project_id, f"Journaled task {i}", "", "2024-01-01", "2024-03-01", None, "active")
+    _edit(data_handler, copy.deepcopy(data_handler.load_data()['projects']), rng)
+    return [path for path in (data_handler.DATA_FILE + '.journal', data_handler.ARCHIVE_FILE + '.journal')
+            if os.path.exists(path) and os.path.getsize(path)]
+
+
+def _edit(backend, projects, rng):
+    """Moves projects between statuses and edits tasks, choosing the same ones for every backend."""
+    for project in rng.sample(projects, min(6, len(projects))):
+        status = rng.choice(['active', 'complete', 'archived', 'on hold'])
+        backend.update_project(project['id'], project['title'], project['description'], status,
+                               project['start_date'], project['target_completion_date'],
+                               project['actual_completion_date'], project['updates'])
+    for project in rng.sample(projects, min(6, len(projects))):
+        for task in project['tasks'][:2]:
+            backend.update_task(project['id'], task['id'], task['description'], task['additional_info'],
+                                rng.choice(['active', 'complete']), task['start_date'], '2024-02-01', None)
+
+
+def _normalized(document):
+    """The projects of a load_data() document without revisions, which each backend counts its own way."""
+    return [{key: value for key, value in project.items() if key != 'revision'} for project in document['projects']]
+
+
+def _search_words(projects, rng):
+    """A few words from project titles, each matching projects in both tiers."""
+    return rng.sample(sorted({word for project in projects for word in project['title'].split()}), 5)
+
+
+def _compare(stage, backends, words):
+    problems = []
+    expected = _normalized(backends['json'].load_data())
+    for name, backend in backends.items():
+        found = _normalized(backend.load_data())
+        if len(found) != len(expected):
+            problems.append(f"{stage}: {name} has {len(found)} projects, json has {len(expected)}")
+        elif [p['id'] for p in found] != [p['id'] for p in expected]:
+            problems.append(f"{stage}: {name} lists the projects in a different order")
+        else:
+            problems.extend(f"{stage}: {name} differs on project {a['id']}: "
+                            f"{sorted(k for k in a.keys() | b.keys() if a.get(k) != b.get(k))}"
+                            for a, b in zip(found, expected) if a != b)
+    for word in words:
+        expected = backends['json'].search(word)
+        for name, backend in backends.items():
+            if backend.search(word) != expected:
+                problems.append(f"{stage}: {name} returns different search results for {word!r}")
+    return problems
+
+
+def run(args):
+    directory = args.dir or tempfile.mkdtemp(prefix='project-tracker-consistency-')
+    os.chdir(directory)
+    journals = _write_store(directory, args)
+    problems = [] if journals else ["setup: the journals are empty, the conversion isn't being tested"]
+
+    backends = {'json': data_handler,
+                'sqlite': migrate_from_json(os.path.join(directory, 'consistency.db'), 'anki.json'),
+                'sharded': split_json(os.path.join(directory, 'shards'))}
+    projects = copy.deepcopy(data_handler.load_data()['projects'])
+    words = _search_words(projects, random.Random(args.seed))
+    problems += _compare("converted", backends, words)
+
+    for backend in backends.values():
+        _edit(backend, projects, random.Random(args.seed + 1))
+    problems += _compare("edited", backends, words)
+
+    print(f"{len(projects)} projects, journals {', '.join(journals) or 'empty'} ({directory})")
+    for problem in problems:
+        print(f"MISMATCH: {problem}")
+    if not problems:
+        print(f"OK: {', '.join(backends)} serve the same projects and search results")
+    return 1 if problems else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--projects', type=int, default=200)
+    parser.add_argument('--tasks', type=int, default=5)
+    parser.add_argument('--updates', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dir', help="Directory for the data files (default: a new temporary directory)")
+    return run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,202 @@
+"""Writes synthetic project data and anki.json files at a chosen scale, for benchmarks and load tests.
+
+Usage: python -m benchmarks.generate [--preset NAME] [--projects N] [--tasks N] [--updates N] [--cards N]
+                                     [--seed N] [--today YYYY-MM-DD] [--dir PATH]
+
+The same arguments always produce the same files. Dates are spread around --today (default: the real today)
+so due cards, overdue tasks and the completion calendar look like a live tracker. Text is drawn from a fixed
+vocabulary with a skewed word frequency, so searches hit a realistic mix of common and rare words. Projects are
+written one at a time, so even the large preset doesn't need the whole document in memory.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import uuid
+from datetime import date, timedelta
+
+from data_handler import ARCHIVE_FILE, ARCHIVE_STATUSES, DATA_FILE
+
+PRESETS = {
+    'small': {'projects': 200, 'tasks': 10, 'updates': 5, 'cards': 2000},
+    'medium': {'projects': 1000, 'tasks': 20, 'updates': 10, 'cards': 10000},
+    'large': {'projects': 10000, 'tasks': 50, 'updates': 20, 'cards': 100000},
+}
+
+# (value, weight) pairs: most projects and tasks are active, as in a tracker that is actually used
+PROJECT_STATUSES = (("active", 40), ("on hold", 10), ("complete", 25), ("archived", 15), ("ongoing", 10))
+TASK_STATUSES = (("active", 45), ("on hold", 10), ("completed", 35), ("cancelled", 10))
+REVERSE_SHARE = 0.15  # Share of cards created with a reverse card
+
+_SYLLABLES = ("ka", "lo", "mi", "ne", "ru", "sa", "to", "vi", "ze", "po", "da", "fe", "gu", "hi", "jo", "be")
+
+
+def _vocabulary(size=3000):
+    words = (''.join(parts) for length in (2, 3, 4) for parts in itertools.product(_SYLLABLES, repeat=length))
+    return list(itertools.islice(words, size))
+
+
+class _Generator:
+    """Draws ids, dates, statuses and text from one seeded random stream."""
+
+    def __init__(self, seed, today):
+        self.rng = random.Random(seed)
+        self.today = today
+        self.words = _vocabulary()
+        # Zipf-like weights: the first words are common, the tail is rare
+        self.word_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(self.words))))
+
+    def id(self):
+        return uuid.UUID(int=self.rng.getrandbits(128)).hex
+
+    def date(self, start_days, end_days):
+        """An ISO date between today + start_days and today + end_days."""
+        return (self.today + timedelta(days=self.rng.randint(start_days, end_days))).isoformat()
+
+    def choice(self, weighted):
+        values, weights = zip(*weighted)
+        return self.rng.choices(values, weights)[0]
+
+    def text(self, min_words, max_words):
+        count = self.rng.randint(min_words, max_words)
+        return ' '.join(self.rng.choices(self.words, cum_weights=self.word_weights, k=count)).capitalize()
+
+    def task(self):
+        status = self.choice(TASK_STATUSES)
+        return {
+            "id": self.id(),
+            "description": self.text(3, 10),
+            "additional_info": self.text(0, 25) if self.rng.random() < 0.5 else "",
+            "start_date": self.date(-700, 30),
+            "target_completion_date": self.date(-60, 180) if self.rng.random() < 0.85 else "",
+            "actual_completion_date": self.date(-364, 0) if status == "completed" else None,
+            "status": status,
+            "updates": [],
+        }
+
+    def update(self):
+        return {"id": self.id(), "timestamp": f"{self.date(-700, 0)} {self.rng.randint(8, 19):02d}:00:00",
+                "description": self.text(5, 30)}
+
+    def project(self, num_tasks, num_updates):
+        status = self.choice(PROJECT_STATUSES)
+        return {
+            "id": self.id(),
+            "title": self.text(2, 6),
+            "description": self.text(10, 60),
+            "start_date": self.date(-1000, 0),
+            "target_completion_date": self.date(-90, 365),
+            "actual_completion_date": self.date(-364, 0) if status in ("complete", "archived") else None,
+            "status": status,
+            "updates": sorted((self.update() for _ in range(num_updates)), key=lambda u: u["timestamp"]),
+            "tasks": [self.task() for _ in range(num_tasks)],
+        }
+
+    def card(self, front, back, reverse):
+        repetitions = self.rng.choice((0, 0, 1, 2, 3, 5, 8))
+        return {
+            "id": self.id(),
+            "front": front,
+            "back": back,
+            "reverse": reverse,
+            "easiness_factor": round(self.rng.uniform(1.3, 2.8), 2),
+            "interval": 1 if repetitions < 2 else self.rng.randint(6, 120),
+            "repetitions": repetitions,
+            "review_date": self.date(-30, 60),
+            "created_date": self.date(-700, 0),
+        }
+
+    def cards(self, num_cards):
+        """Returns num_cards cards, REVERSE_SHARE of them in reverse pairs linked by pair_id."""
+        cards = []
+        while len(cards) < num_cards:
+            front, back = self.text(1, 6), self.text(1, 12)
+            if len(cards) + 1 < num_cards and self.rng.random() < REVERSE_SHARE:
+                card, reverse_card = self.card(front, back, True), self.card(back, front, False)
+                card["pair_id"], reverse_card["pair_id"] = reverse_card["id"], card["id"]
+                cards += [card, reverse_card]
+            else:
+                cards.append(self.card(front, back, False))
+        return cards
+
+
+def generate_projects(num_projects, tasks_per_project, updates_per_project, seed=0, today=None):
+    """Yields the projects of a synthetic dataset one at a time."""
+    generator = _Generator(seed, today or date.today())
+    for _ in range(num_projects):
+        yield generator.project(tasks_per_project, updates_per_project)
+
+
+def generate_cards(num_cards, seed=0, today=None):
+    """Returns the cards of a synthetic deck."""
+    return _Generator(seed + 1, today or date.today()).cards(num_cards)
+
+
+def build_dataset(num_projects, tasks_per_project, updates_per_project, num_cards, seed=0, today=None):
+    """Returns (project document, anki document) held in memory."""
+    projects = list(generate_projects(num_projects, tasks_per_project, updates_per_project, seed, today))
+    return {"projects": projects}, {"cards": generate_cards(num_cards, seed, today)}
+
+
+def write_dataset(directory, num_projects, tasks_per_project, updates_per_project, num_cards, seed=0, today=None):
+    """Writes project_data.json, project_archive.json and anki.json into directory. Returns their paths.
+
+    Projects are split between the first two files by status, the way data_handler keeps them.
+    """
+    os.makedirs(directory, exist_ok=True)
+    project_path = os.path.join(directory, DATA_FILE)
+    archive_path = os.path.join(directory, ARCHIVE_FILE)
+    anki_path = os.path.join(directory, "anki.json")
+    with open(project_path, 'w') as file, open(archive_path, 'w') as archive:
+        file.write('{"projects":[')
+        archive.write('{"projects":[')
+        written = {file: 0, archive: 0}
+        projects = generate_projects(num_projects, tasks_per_project, updates_per_project, seed, today)
+        for project in projects:
+            target = archive if project['status'] in ARCHIVE_STATUSES else file
+            target.write((',' if written[target] else '') + json.dumps(project, separators=(',', ':')))
+            written[target] += 1
+        file.write(']}')
+        archive.write(']}')
+    with open(anki_path, 'w') as file:
+        json.dump({"cards": generate_cards(num_cards, seed, today)}, file, separators=(',', ':'))
+    return project_path, archive_path, anki_path
+
+
+def add_scale_arguments(parser):
+    """Adds the dataset options shared by the benchmark scripts."""
+    parser.add_argument('--preset', choices=PRESETS, default='medium',
+                        help="Base scale; the options below override parts of it (default: medium)")
+    parser.add_argument('--projects', type=int)
+    parser.add_argument('--tasks', type=int, help="Tasks per project")
+    parser.add_argument('--updates', type=int, help="Updates per project")
+    parser.add_argument('--cards', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--today', type=date.fromisoformat, help="Date the dataset is built around (default: today)")
+
+
+def scale(args):
+    """Returns the {'projects', 'tasks', 'updates', 'cards'} sizes the arguments ask for."""
+    sizes = dict(PRESETS[args.preset])
+    for name in sizes:
+        if getattr(args, name) is not None:
+            sizes[name] = getattr(args, name)
+    return sizes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_scale_arguments(parser)
+    parser.add_argument('--dir', default='.', help="Where to write the files (default: the current directory)")
+    args = parser.parse_args(argv)
+    sizes = scale(args)
+    paths = write_dataset(args.dir, sizes['projects'], sizes['tasks'], sizes['updates'], sizes['cards'],
+                          args.seed, args.today)
+    for path in paths:
+        print(f"Wrote {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,100 @@
+"""Shared plumbing for the benchmark scripts: dataset setup, timing and the JSON results format."""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+import config
+from benchmarks.generate import scale, write_dataset
+
+
+def prepare(args):
+    """Generates the dataset the arguments describe into --dir (or a temporary directory) and moves there.
+
+    Call before the first data access. With PROJECT_TRACKER_BACKEND=sqlite or sharded the files are converted
+    into the database or shard directory too, so the module functions serve the same data whichever backend is configured.
+    """
+    directory = args.dir or tempfile.mkdtemp(prefix='project-tracker-bench-')
+    sizes = scale(args)
+    write_dataset(directory, sizes['projects'], sizes['tasks'], sizes['updates'], sizes['cards'], args.seed, args.today)
+    os.chdir(directory)
+    if config.STORAGE_BACKEND == 'sqlite':
+        from sqlite_backend import migrate_from_json
+        if os.path.exists(config.SQLITE_FILE):
+            os.remove(config.SQLITE_FILE)
+        migrate_from_json(config.SQLITE_FILE, 'anki.json')
+    elif config.STORAGE_BACKEND == 'sharded':
+        from sharded_backend import split_json
+        split_json(config.SHARD_DIR)
+    return directory
+
+
+def measure(func, repeat, warmup=1, setup=None):
+    """Calls func warmup + repeat times and returns timing statistics in milliseconds for the last repeat calls.
+
+    setup, if given, runs untimed before each call and its result is passed to func.
+    """
+    times = []
+    for i in range(warmup + repeat):
+        argument = setup() if setup else None
+        started = time.perf_counter()
+        func(argument) if setup else func()
+        elapsed = (time.perf_counter() - started) * 1000
+        if i >= warmup:
+            times.append(elapsed)
+    return {'runs': len(times), 'min_ms': min(times), 'median_ms': statistics.median(times),
+            'mean_ms': statistics.fmean(times), 'max_ms': max(times)}
+
+
+def print_table(results):
+    print(f"{'benchmark':60} {'min':>10} {'median':>10} {'mean':>10}   (ms)")
+    for name, stats in results.items():
+        print(f"{name:60} {stats['min_ms']:10.3f} {stats['median_ms']:10.3f} {stats['mean_ms']:10.3f}")
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(path, suite, args, results):
+    """Writes a run's results with what is needed to judge whether two runs are comparable."""
+    document = {
+        'suite': suite,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'backend': config.STORAGE_BACKEND,
+        'journal': config.JOURNAL_ENABLED,
+        'metrics': config.METRICS_ENABLED,
+        'scale': scale(args),
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'results': results,
+    }
+    with open(path, 'w') as file:
+        json.dump(document, file, indent=2)
+    print(f"Saved results to {path}")
+
+
+def parse_arguments(parser, argv):
+    """Parses the arguments, making --output absolute since prepare() changes directory."""
+    args = parser.parse_args(argv)
+    if args.output:
+        args.output = os.path.abspath(args.output)
+    return args
+
+
+def add_run_arguments(parser, repeat):
+    parser.add_argument('--repeat', type=int, default=repeat, help="Timed calls per benchmark")
+    parser.add_argument('--only', help="Run only the benchmarks whose name contains this text")
+    parser.add_argument('--output', help="Save the results to this JSON file (compare runs with benchmarks.compare)")
+    parser.add_argument('--dir', help="Directory for the generated data (default: a new temporary directory)")
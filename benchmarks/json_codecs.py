@@ -0,0 +1,68 @@
+"""Measures parse and dump throughput of every installed JSON codec on generated data files.
+
+Usage: python -m benchmarks.json_codecs [--preset small|medium|large] [--projects N] [--tasks N] [--updates N]
+                                        [--cards N] [--seed N] [--repeat N] [--only TEXT] [--output FILE] [--dir PATH]
+
+"json indent=4" is how the files used to be written and read; the codec rows are what the stores use now
+(see codec.py). "typed" rows parse straight into the codec dataclasses, validating the schema. MB/s is
+relative to the compact file size throughout, so the rows compare the time to move the same data.
+"""
+import argparse
+import json
+import sys
+
+import codec
+from benchmarks.generate import add_scale_arguments
+from benchmarks.harness import add_run_arguments, measure, parse_arguments, prepare, save_results
+
+FILES = (("project_data.json", codec.ProjectData), ("project_archive.json", codec.ProjectData),
+         ("anki.json", codec.Deck))
+
+
+def cases(raw, schema):
+    """Returns (name, func) pairs for one file's contents."""
+    document = json.loads(raw)
+    indented = json.dumps(document, indent=4)
+    result = [
+        ("loads json indent=4", lambda: json.loads(indented)),
+        ("dumps json indent=4", lambda: json.dumps(document, indent=4)),
+    ]
+    for name, (loads, dumps) in codec.CODECS.items():
+        result.append((f"loads {name}", lambda loads=loads: loads(raw)))
+        result.append((f"dumps {name}", lambda dumps=dumps: dumps(document)))
+    result.append((f"loads typed ({'msgspec' if codec.msgspec else 'dataclasses'})",
+                   lambda: codec.decode(raw, schema)))
+    return result
+
+
+def run(args):
+    prepare(args)
+    print(f"Stores use: {codec.NAME}")
+    print(f"{'benchmark':45} {'median ms':>10} {'MB/s':>10}")
+    results = {}
+    for file_name, schema in FILES:
+        with open(file_name, 'rb') as file:
+            raw = file.read()
+        megabytes = len(raw) / 1e6
+        print(f"{file_name} ({megabytes:.1f} MB)")
+        for name, func in cases(raw, schema):
+            name = f"{file_name} {name}"
+            if args.only and args.only not in name:
+                continue
+            stats = measure(func, args.repeat)
+            stats['mb_per_s'] = megabytes / (stats['median_ms'] / 1000)
+            results[name] = stats
+            print(f"  {name[len(file_name) + 1:]:43} {stats['median_ms']:10.1f} {stats['mb_per_s']:10.1f}")
+    if args.output:
+        save_results(args.output, 'json_codecs', args, results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_scale_arguments(parser)
+    add_run_arguments(parser, repeat=5)
+    run(parse_arguments(parser, argv))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,132 @@
+"""Times each data_handler and anki function on a generated dataset.
+
+Usage: python -m benchmarks.micro [--preset small|medium|large] [--projects N] [--tasks N] [--updates N]
+                                  [--cards N] [--seed N] [--repeat N] [--only TEXT] [--output FILE] [--dir PATH]
+
+Runs against whatever backend the environment selects (PROJECT_TRACKER_BACKEND, PROJECT_TRACKER_JOURNAL).
+"cold" cases drop the in-memory caches first, so they include parsing the JSON files they need. Mutations really
+write, so the dataset grows slightly over a run.
+"""
+import argparse
+import sys
+
+import config
+from benchmarks.generate import add_scale_arguments
+from benchmarks.harness import add_run_arguments, measure, parse_arguments, prepare, print_table, save_results
+
+HEAVY_REPEAT = 3  # Full rewrites of the data are timed at most this many times
+
+
+def cases(data_handler, anki):
+    """Returns (name, func, setup, heavy) for every benchmark, picking its targets from the loaded data."""
+    projects = data_handler.load_data()['projects']
+    project = max(projects[len(projects) // 2:], key=lambda p: (len(p['tasks']), len(p['updates'])))
+    project_id = project['id']
+    task = project['tasks'][0] if project['tasks'] else None
+    cards = anki.load_anki_data()['cards']
+    card_id = cards[len(cards) // 2]['id'] if cards else None
+    common_word = project['title'].split()[0].lower()
+    rare_prefix = (project['description'].split() or ['x'])[-1].lower()[:3]
+    reviews = [(card['id'], 4, None) for card in cards[:50]]
+
+    def fresh_update():
+        data_handler.add_project_update(project_id, "benchmark update")
+        return data_handler.get_project(project_id)['updates'][-1]['id']
+
+    def fresh_card():
+        return anki.create_card("benchmark front", "benchmark back")
+
+    def recent_revision(get_revision):
+        return lambda: max(get_revision() - 10, 1)
+
+    page = config.PAGE_SIZE + 1
+    return [
+        ("data_handler.load_data", lambda: data_handler.load_data(), None, False),
+        ("data_handler.load_data (cold)", lambda _: data_handler.load_data(), data_handler.invalidate_cache, False),
+        ("data_handler.save_data", lambda: data_handler.save_data(data_handler.load_data()), None, True),
+        ("data_handler.get_project", lambda: data_handler.get_project(project_id), None, False),
+        ("data_handler.get_project (all tasks)", lambda: data_handler.get_project(project_id, None), None, False),
+        ("data_handler.query_project (all tasks by due date)",
+         lambda: data_handler.query_project(project_id, None, 'due_date'), None, False),
+        ("data_handler.project_exists", lambda: data_handler.project_exists(project_id), None, False),
+        ("data_handler.get_projects_by_category", lambda: data_handler.get_projects_by_category('active'), None, False),
+        ("data_handler.get_projects_by_category (cold)", lambda _: data_handler.get_projects_by_category('active'),
+         data_handler.invalidate_cache, False),
+        ("data_handler.get_projects_by_category (page, by next due)",
+         lambda: data_handler.get_projects_by_category('active', 'next_task_due_date', limit=page), None, False),
+        ("data_handler.get_projects_by_category (complete, by target)",
+         lambda: data_handler.get_projects_by_category('complete', 'target_completion_date'), None, False),
+        ("data_handler.get_all_tasks",
+         lambda: data_handler.get_all_tasks('due_date', 'asc', ['active', 'ongoing'], ['active']), None, False),
+        ("data_handler.get_all_tasks (page)",
+         lambda: data_handler.get_all_tasks('due_date', 'asc', ['active', 'ongoing'], ['active'], limit=page),
+         None, False),
+        ("data_handler.get_all_tasks (every task)", lambda: data_handler.get_all_tasks(None), None, False),
+        ("data_handler.get_completion_data", lambda: data_handler.get_completion_data(), None, False),
+        ("data_handler.get_completion_calendar", lambda: data_handler.get_completion_calendar(), None, False),
+        ("data_handler.search (common word)", lambda: data_handler.search(common_word), None, False),
+        ("data_handler.search (rare prefix)", lambda: data_handler.search(rare_prefix), None, False),
+        ("data_handler.get_revision", lambda: data_handler.get_revision(), None, False),
+        ("data_handler.get_changes (recent)", lambda since: data_handler.get_changes(since),
+         recent_revision(data_handler.get_revision), False),
+        ("data_handler.create_project",
+         lambda: data_handler.create_project("Benchmark", "", "2024-01-01", "2024-12-31"), None, False),
+        ("data_handler.update_project",
+         lambda: data_handler.update_project(project_id, project['title'], project['description'], project['status'],
+                                             project['start_date'], project['target_completion_date'],
+                                             project['actual_completion_date'], project['updates']), None, False),
+        ("data_handler.create_task",
+         lambda: data_handler.create_task(project_id, "Benchmark task", "", None, "2024-06-01", None, "active"),
+         None, False),
+        ("data_handler.update_task",
+         lambda: data_handler.update_task(project_id, task['id'], task['description'], task['additional_info'],
+                                          task['status'], task['start_date'], task['target_completion_date'],
+                                          task['actual_completion_date']) if task else None, None, False),
+        ("data_handler.add_project_update", lambda: data_handler.add_project_update(project_id, "benchmark"),
+         None, False),
+        ("data_handler.delete_project_update", lambda update_id: data_handler.delete_project_update(project_id, update_id),
+         fresh_update, False),
+        ("anki.load_anki_data", lambda: anki.load_anki_data(), None, False),
+        ("anki.load_anki_data (cold)", lambda _: anki.load_anki_data(), anki.invalidate_cache, False),
+        ("anki.save_anki_data", lambda: anki.save_anki_data(anki.load_anki_data()), None, True),
+        ("anki.get_card", lambda: anki.get_card(card_id), None, False),
+        ("anki.list_cards (page)", lambda: anki.list_cards(limit=page, include_reverse=False), None, False),
+        ("anki.search_cards", lambda: anki.search_cards(common_word), None, False),
+        ("anki.get_due_cards", lambda: anki.get_due_cards(), None, False),
+        ("anki.get_review_forecast", lambda: anki.get_review_forecast(), None, False),
+        ("anki.get_card_revision", lambda: anki.get_card_revision(), None, False),
+        ("anki.get_card_changes (recent)", lambda since: anki.get_card_changes(since),
+         recent_revision(anki.get_card_revision), False),
+        ("anki.create_card", lambda: anki.create_card("benchmark front", "benchmark back"), None, False),
+        ("anki.update_card", lambda: anki.update_card(card_id, "benchmark front", "benchmark back"), None, False),
+        ("anki.process_card_review", lambda: anki.process_card_review(card_id, 4), None, False),
+        ("anki.process_card_reviews (50)", lambda: anki.process_card_reviews(reviews), None, False),
+        ("anki.delete_card", lambda new_card_id: anki.delete_card(new_card_id), fresh_card, False),
+    ]
+
+
+def run(args):
+    prepare(args)
+    import anki
+    import data_handler
+
+    results = {}
+    for name, func, setup, heavy in cases(data_handler, anki):
+        if args.only and args.only not in name:
+            continue
+        repeat = min(args.repeat, HEAVY_REPEAT) if heavy else args.repeat
+        results[name] = measure(func, repeat, setup=setup)
+    print_table(results)
+    if args.output:
+        save_results(args.output, 'micro', args, results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_scale_arguments(parser)
+    add_run_arguments(parser, repeat=20)
+    run(parse_arguments(parser, argv))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
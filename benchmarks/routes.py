@@ -0,0 +1,64 @@
+"""Times full page requests through the Flask test client on a generated dataset.
+
+Usage: python -m benchmarks.routes [--preset small|medium|large] [--projects N] [--tasks N] [--updates N]
+                                   [--cards N] [--seed N] [--repeat N] [--only TEXT] [--output FILE] [--dir PATH]
+
+Each request goes through routing, the data layer and template rendering, and its whole body is read, so
+streamed pages are timed to the end. Runs against whatever backend the environment selects. Pages in the page
+cache are served from it after the warm-up request; set PROJECT_TRACKER_PAGE_CACHE_MB=0 to time rendering.
+"""
+import argparse
+import sys
+
+from benchmarks.generate import add_scale_arguments
+from benchmarks.harness import add_run_arguments, measure, parse_arguments, prepare, print_table, save_results
+
+
+def routes(data_handler):
+    """Returns (name, url) for every benchmarked page."""
+    projects = data_handler.get_projects_by_category('active')
+    project_id = projects[len(projects) // 2]['id'] if projects else 'missing'
+    return [
+        ("GET /", "/"),  # Redirects to /projects, which is included in the time
+        ("GET /projects/complete", "/projects/complete"),
+        ("GET /tasks", "/tasks"),
+        ("GET /project/<id>", f"/project/{project_id}"),
+        ("GET /calendar", "/calendar"),
+        ("GET /anki", "/anki"),
+        ("GET /anki/manage", "/anki/manage"),
+    ]
+
+
+def run(args):
+    prepare(args)
+    import data_handler
+    from app import app
+
+    client = app.test_client()
+
+    def get(url):
+        response = client.get(url, follow_redirects=True)
+        response.get_data()
+        response.close()
+        if response.status_code != 200:
+            raise RuntimeError(f"{url} answered {response.status_code}")
+
+    results = {}
+    for name, url in routes(data_handler):
+        if args.only and args.only not in name:
+            continue
+        results[name] = measure(lambda: get(url), args.repeat)
+    print_table(results)
+    if args.output:
+        save_results(args.output, 'routes', args, results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_scale_arguments(parser)
+    add_run_arguments(parser, repeat=10)
+    run(parse_arguments(parser, argv))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
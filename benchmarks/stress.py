@@ -0,0 +1,123 @@
+"""Fires concurrent mutations at the storage layer from several processes and threads and checks none are lost.
+
+Usage: python -m benchmarks.stress [--processes N] [--threads N] [--ops N] [--dir PATH]
+
+Runs against whatever backend the environment selects (PROJECT_TRACKER_BACKEND, PROJECT_TRACKER_JOURNAL).
+Every worker adds tasks and updates to one shared project and creates and reviews cards in the shared deck,
+so any read-modify-write race shows up as a missing task, update or card, or a card that lost its review.
+Exits with status 1 if anything was lost.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+
+def _setup(directory):
+    os.chdir(directory)
+    import data_handler
+    return data_handler.create_project("Stress", "", "2024-01-01", "2024-12-31")
+
+
+def _worker(directory, worker, num_threads, num_ops, project_id):
+    """Runs num_threads threads in this process, each doing num_ops rounds of mutations and reads."""
+    os.chdir(directory)
+    import anki
+    import data_handler
+
+    failed = []
+
+    def mutate(thread):
+        try:
+            for op in range(num_ops):
+                tag = f"{worker}-{thread}-{op}"
+                data_handler.create_task(project_id, f"task {tag}", "", "2024-01-01", "2024-06-01", None, "active")
+                data_handler.add_project_update(project_id, f"update {tag}")
+                card_id = anki.create_card(f"front {tag}", f"back {tag}")
+                anki.process_card_review(card_id, 5)  # Takes repetitions from 0 to 1
+                # Reads in between so readers and writers contend too
+                data_handler.get_projects_by_category("active")
+                data_handler.get_all_tasks()
+                anki.get_due_cards()
+        except Exception:
+            failed.append(thread)
+            raise
+
+    threads = [threading.Thread(target=mutate, args=(thread,)) for thread in range(num_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if failed:
+        sys.exit(1)
+
+
+def _verify(directory, project_id, expected):
+    """Returns a list of problems found in a fresh read of the stores."""
+    os.chdir(directory)
+    import anki
+    import data_handler
+    data_handler.invalidate_cache()
+    anki.invalidate_cache()
+    project = data_handler.get_project(project_id, task_status=None)
+    cards = anki.load_anki_data()["cards"]
+    problems = []
+    checks = [
+        ("tasks", len({t["description"] for t in project["tasks"]}), expected),
+        ("project updates", len({u["description"] for u in project["updates"]}), expected),
+        ("cards", len({c["front"] for c in cards}), expected),
+        ("card reviews", sum(1 for c in cards if c["repetitions"] == 1), expected),
+        ("active task count", project["active_task_count"], expected),
+    ]
+    for name, found, wanted in checks:
+        if found != wanted:
+            problems.append(f"{name}: expected {wanted}, found {found}")
+    return problems
+
+
+def run(args):
+    directory = args.dir or tempfile.mkdtemp(prefix="project-tracker-stress-")
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1) as pool:
+        # Set up in a separate process so this one never caches the stores
+        project_id = pool.apply(_setup, (directory,))
+
+    started = time.perf_counter()
+    workers = [context.Process(target=_worker, args=(directory, worker, args.threads, args.ops, project_id))
+               for worker in range(args.processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    if any(worker.exitcode for worker in workers):
+        print("A worker failed; see its traceback above.")
+        return 1
+
+    expected = args.processes * args.threads * args.ops
+    with context.Pool(1) as pool:
+        problems = pool.apply(_verify, (directory, project_id, expected))
+    backend = os.environ.get("PROJECT_TRACKER_BACKEND", "json")
+    print(f"{args.processes} processes x {args.threads} threads x {args.ops} rounds on {backend} "
+          f"in {elapsed:.1f}s ({directory})")
+    for problem in problems:
+        print(f"LOST: {problem}")
+    if not problems:
+        print(f"OK: all {expected * 4} mutations survived")
+    return 1 if problems else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--ops', type=int, default=25)
+    parser.add_argument('--dir', help="Directory for the data files (default: a new temporary directory)")
+    return run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,191 @@
+"""JSON encoding for the stores, through the fastest library installed: orjson, then msgspec, then json.
+
+Every codec writes compact UTF-8 JSON that all of them read, so installing or removing one needs no migration.
+PROJECT_TRACKER_JSON_CODEC picks one explicitly. Parse errors are always ValueErrors (json.JSONDecodeError for
+the standard library).
+
+The dataclasses below describe the documents. decode(data, type=...) parses straight into them, through
+msgspec when it is installed, and validate() checks an already parsed document against them. The stores do
+that on every load when PROJECT_TRACKER_VALIDATE=1. Fields the schema doesn't list are ignored.
+"""
+import dataclasses
+import functools
+import json
+import typing
+from dataclasses import dataclass, field
+from typing import Optional
+
+import config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+def _json_dumps(obj):
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+
+# name -> (loads(bytes or str), dumps(obj) -> bytes) for every installed codec
+CODECS = {'json': (json.loads, _json_dumps)}
+if msgspec:
+    CODECS['msgspec'] = (msgspec.json.decode, msgspec.json.encode)
+if orjson:
+    CODECS['orjson'] = (orjson.loads, orjson.dumps)
+
+
+def _select(name):
+    if name == 'auto':
+        return 'orjson' if orjson else 'msgspec' if msgspec else 'json'
+    if name not in CODECS:
+        print(f"WARNING: JSON codec {name!r} is not installed; using the standard library.")
+        return 'json'
+    return name
+
+
+NAME = _select(config.JSON_CODEC)
+loads, dumps = CODECS[NAME]
+
+
+# --- Schema ---
+
+@dataclass
+class Update:
+    id: str
+    timestamp: Optional[str] = None
+    description: Optional[str] = None
+
+
+@dataclass
+class Task:
+    id: str
+    description: str
+    status: str
+    additional_info: Optional[str] = ''
+    start_date: Optional[str] = None
+    target_completion_date: Optional[str] = None
+    actual_completion_date: Optional[str] = None
+    updates: list[Update] = field(default_factory=list)
+
+
+@dataclass
+class Project:
+    id: str
+    title: str
+    status: str
+    description: Optional[str] = ''
+    start_date: Optional[str] = None
+    target_completion_date: Optional[str] = None
+    actual_completion_date: Optional[str] = None
+    updates: list[Update] = field(default_factory=list)
+    tasks: list[Task] = field(default_factory=list)
+    revision: int = 0
+
+
+@dataclass
+class ProjectData:
+    """project_data.json and project_archive.json"""
+    projects: list[Project] = field(default_factory=list)
+    revision: int = 0
+    archive_revision: int = 0
+    journal_seq: int = 0
+    project_order: dict = field(default_factory=dict)  # Project id -> position across both tiers
+
+
+@dataclass
+class Card:
+    id: str
+    front: str
+    back: str
+    easiness_factor: float = 2.5
+    interval: int = 1
+    repetitions: int = 0
+    review_date: Optional[str] = None
+    created_date: Optional[str] = None
+    reverse: bool = False
+    pair_id: Optional[str] = None
+    revision: int = 0
+
+
+@dataclass
+class Deck:
+    """anki.json"""
+    cards: list[Card] = field(default_factory=list)
+    revision: int = 0
+    deleted_cards: list = field(default_factory=list)
+    deleted_floor: int = 0
+
+
+class SchemaError(ValueError):
+    """A document doesn't match its schema. The message says where."""
+
+
+@functools.lru_cache(maxsize=None)
+def _fields(cls):
+    hints = typing.get_type_hints(cls)
+    return [(f.name, hints[f.name], f) for f in dataclasses.fields(cls)]
+
+
+def _convert(value, tp, path):
+    """Builds tp from parsed JSON the way msgspec.convert does, for when msgspec isn't installed."""
+    origin = typing.get_origin(tp)
+    if origin is typing.Union:
+        if value is None and type(None) in typing.get_args(tp):
+            return None
+        tp = next(arg for arg in typing.get_args(tp) if arg is not type(None))
+        origin = typing.get_origin(tp)
+    if dataclasses.is_dataclass(tp):
+        if not isinstance(value, dict):
+            raise SchemaError(f"Expected `object`, got `{type(value).__name__}` - at `{path}`")
+        kwargs = {}
+        for name, field_type, f in _fields(tp):
+            if name in value:
+                kwargs[name] = _convert(value[name], field_type, f"{path}.{name}")
+            elif f.default is dataclasses.MISSING and f.default_factory is dataclasses.MISSING:
+                raise SchemaError(f"Object missing required field `{name}` - at `{path}`")
+        return tp(**kwargs)
+    if origin is list or tp is list:
+        if not isinstance(value, list):
+            raise SchemaError(f"Expected `array`, got `{type(value).__name__}` - at `{path}`")
+        if tp is list:
+            return value
+        item_type = typing.get_args(tp)[0]
+        return [_convert(item, item_type, f"{path}[{i}]") for i, item in enumerate(value)]
+    if tp is float and isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    if not isinstance(value, tp) or (tp is int and isinstance(value, bool)):
+        raise SchemaError(f"Expected `{tp.__name__}`, got `{type(value).__name__}` - at `{path}`")
+    return value
+
+
+def convert(obj, type):
+    """Builds the dataclass `type` from a parsed document. Raises SchemaError if it doesn't fit."""
+    if msgspec:
+        try:
+            return msgspec.convert(obj, type)
+        except msgspec.ValidationError as e:
+            raise SchemaError(str(e)) from None
+    return _convert(obj, type, '$')
+
+
+def decode(data, type=None):
+    """Parses JSON bytes or text, into the dataclass `type` if one is given (validating it on the way)."""
+    if type is None:
+        return loads(data)
+    if msgspec:
+        try:
+            return msgspec.json.decode(data, type=type)
+        except msgspec.ValidationError as e:
+            raise SchemaError(str(e)) from None
+    return _convert(loads(data), type, '$')
+
+
+def validate(obj, type):
+    """Raises SchemaError if a parsed document doesn't match the dataclass `type`."""
+    convert(obj, type)
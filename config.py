@@ -0,0 +1,48 @@
+import os
+
+# --- Storage ---
+# Append each project mutation to a journal instead of rewriting project_data.json every time
+JOURNAL_ENABLED = os.environ.get('PROJECT_TRACKER_JOURNAL', '0') == '1'
+# Fold the journal back into the snapshot once it holds this many records
+JOURNAL_COMPACT_THRESHOLD = int(os.environ.get('PROJECT_TRACKER_JOURNAL_COMPACT_AT', '1000'))
+# Where projects and flashcards live: 'json' (project_data.json / anki.json), 'sqlite', or 'sharded'
+# (one file per project under SHARD_DIR; flashcards stay in anki.json)
+STORAGE_BACKEND = os.environ.get('PROJECT_TRACKER_BACKEND', 'json')
+SQLITE_FILE = os.environ.get('PROJECT_TRACKER_DB', 'project_tracker.db')
+SHARD_DIR = os.environ.get('PROJECT_TRACKER_SHARD_DIR', 'projects')
+# JSON library for the JSON files: 'auto' (orjson, then msgspec, then the standard library), 'orjson', 'msgspec' or 'json'
+JSON_CODEC = os.environ.get('PROJECT_TRACKER_JSON_CODEC', 'auto')
+# Check every document read from disk against the schema in codec.py and report mismatches
+VALIDATE_SCHEMA = os.environ.get('PROJECT_TRACKER_VALIDATE', '0') == '1'
+
+# --- Serving (serve.py) ---
+SERVE_HOST = os.environ.get('PROJECT_TRACKER_HOST', '127.0.0.1')
+SERVE_PORT = int(os.environ.get('PROJECT_TRACKER_PORT', '5000'))
+# Request threads per worker process
+SERVE_THREADS = int(os.environ.get('PROJECT_TRACKER_THREADS', '8'))
+# Worker processes sharing the listening socket (POSIX only); they coordinate through the store's file locks
+SERVE_WORKERS = int(os.environ.get('PROJECT_TRACKER_WORKERS', '1'))
+
+# --- Themes ---
+# Seconds between checks of static/ for added or removed stylesheets
+THEME_CHECK_INTERVAL = float(os.environ.get('PROJECT_TRACKER_THEME_CHECK_INTERVAL', '2'))
+
+# --- Pages ---
+# Items per page on /projects, /tasks and /anki/manage; ?per_page= overrides it up to MAX_PAGE_SIZE
+PAGE_SIZE = int(os.environ.get('PROJECT_TRACKER_PAGE_SIZE', '50'))
+MAX_PAGE_SIZE = int(os.environ.get('PROJECT_TRACKER_MAX_PAGE_SIZE', '500'))
+# Stream list pages to the browser while they render instead of building the whole response first
+STREAM_TEMPLATES = os.environ.get('PROJECT_TRACKER_STREAM', '0') == '1'
+# Megabytes of rendered pages (project lists, project pages, tasks, calendar, search, card list) kept in memory
+# per process and served until the data changes; 0 turns the cache off
+PAGE_CACHE_BYTES = int(float(os.environ.get('PROJECT_TRACKER_PAGE_CACHE_MB', '32')) * 1024 * 1024)
+# gzip (or brotli, if installed) HTML responses of at least COMPRESS_MIN_BYTES for browsers that accept it
+COMPRESS_HTML = os.environ.get('PROJECT_TRACKER_COMPRESS', '1') == '1'
+COMPRESS_MIN_BYTES = int(os.environ.get('PROJECT_TRACKER_COMPRESS_MIN_BYTES', '1024'))
+
+# --- Instrumentation (metrics.py) ---
+# Time requests, templates and data calls and count store I/O, shown at /metrics
+METRICS_ENABLED = os.environ.get('PROJECT_TRACKER_METRICS', '1') == '1'
+# Let ?profile=1 or an `X-Profile: 1` header dump a cProfile of that request into PROFILE_DIR
+PROFILING_ENABLED = os.environ.get('PROJECT_TRACKER_PROFILE', '0') == '1'
+PROFILE_DIR = os.environ.get('PROJECT_TRACKER_PROFILE_DIR', 'profiles')
@@ -1,69 +1,540 @@
-import json
-import os
+import heapq
 import uuid
-from datetime import datetime
+from bisect import bisect
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from operator import itemgetter
+
+import codec
+import config
+from backends import pluggable
+from indexes import NO_DUE_DATE, ProjectIndex, TextIndex, due_key, paginate
+from store import JsonStore
 
 DATA_FILE = "project_data.json"  # Moved to a constant
+# Projects with these statuses live in the archive file, which is only loaded when a read or write needs them
+ARCHIVE_FILE = "project_archive.json"
+ARCHIVE_STATUSES = ('complete', 'archived')
+
+# --- Tiers ---
+# project_data.json holds the working set and the revision counter; project_archive.json holds the finished
+# projects. Both are the same kind of document, changed through the same mutation records, and each gets its
+# own indexes. A project moves by being added to its new tier before it is removed from the old one, so a
+# crash in between leaves it in both: the copy in project_data.json is the live one and archive copies of
+# such projects are ignored until the next save_data() or compact_journal() drops them.
+#
+# Each tier's project_order maps its projects to their position in the single list they used to form: the
+# index in the list last given to save_data() (negative, so later projects sort after them) or, for newer
+# projects, the revision they were created at. A project keeps its position when it moves, and each tier keeps
+# its projects in position order, so merging the two tiers by position lists projects (and ties in sorted
+# views) in the same order as a single file would.
+
+# --- Mutation records ---
+# Every change to the document is described by a small record and applied by one of these functions, so the
+# same code path serves live writes and journal replay. Records must carry any generated ids and timestamps.
+
+_indexes = {}  # id(document) -> ProjectIndex
+_current = {}  # Tier name -> the document its store last loaded
+
+def _get_index(data):
+    """Returns the secondary indexes for a document, rebuilding them if the document was (re)loaded."""
+    index = _indexes.get(id(data))
+    if index is None or index.data is not data:
+        index = _indexes[id(data)] = ProjectIndex(data)
+    return index
+
+def _loaded(tier, data):
+    """on_load callback: indexes a freshly read document and forgets the indexes of the one it replaces."""
+    _current[tier] = data
+    _order(data)
+    for project in data['projects']:
+        project.setdefault('revision', 0)  # Projects not changed since before revisions existed, as the schema has it
+    live = {id(document) for document in _current.values()}
+    for key in [key for key in _indexes if key not in live]:
+        _indexes.pop(key, None)
+    for key in [key for key in _searches if key not in live]:
+        _searches.pop(key, None)
+    # Building the index on load means readers never build it concurrently; mutators keep it current after that
+    _get_index(data)
+
+def _order(data):
+    """Returns a tier's project_order, giving projects from files written before it existed their file order."""
+    order = data.get('project_order')
+    if order is None or len(order) < len(data['projects']):
+        projects = data['projects']
+        order = data['project_order'] = {p['id']: (order or {}).get(p['id'], i - len(projects))
+                                         for i, p in enumerate(projects)}
+    return order
+
+def _find_project(data, project_id):
+    return _get_index(data).projects_by_id.get(project_id)
+
+def _touch(data, project):
+    """Stamps a project with the document revision of the change being applied, for get_changes()."""
+    project['revision'] = data['revision']
+
+# --- Search ---
+# One TextIndex per kind of searchable item and document, built on the first search and then kept current by
+# the appliers. Keys: project id, task id, and (project id, update id) for updates.
+
+_searches = {}  # id(document) -> (document, {'project': TextIndex, 'task': ..., 'update': ...})
+
+def _text_indexes(data):
+    """Returns the search indexes if they were built for this document, else None."""
+    search = _searches.get(id(data))
+    if search is not None and search[0] is data:
+        return search[1]
+    return None
+
+def _index_update(text_indexes, project, update):
+    text_indexes['update'].set((project['id'], update['id']), update.get('description'))
 
+def _index_project_text(text_indexes, project):
+    text_indexes['project'].set(project['id'], project.get('title'), project.get('description'))
+    for task in project.get('tasks', []):
+        text_indexes['task'].set(task['id'], task.get('description'), task.get('additional_info'))
+    for update in project.get('updates', []):
+        _index_update(text_indexes, project, update)
+
+def _unindex_project_text(text_indexes, project):
+    text_indexes['project'].remove(project['id'])
+    for task in project.get('tasks', []):
+        text_indexes['task'].remove(task['id'])
+    for update in project.get('updates', []):
+        text_indexes['update'].remove((project['id'], update['id']))
+
+def _index_moved_project_text(text_indexes, data, project):
+    """Indexes a project moving in from the other tier where a single file would have it: ahead of the
+    projects after it, rather than after everything indexed so far."""
+    position = _order(data)
+    after = position[project['id']]
+    tasks_by_id = _get_index(data).tasks_by_id
+    text_indexes['project'].insert_before([(project['id'], project.get('title'), project.get('description'))],
+                                          lambda key: position[key] > after)
+    text_indexes['task'].insert_before(
+        [(t['id'], t.get('description'), t.get('additional_info')) for t in project.get('tasks', [])],
+        lambda key: position[tasks_by_id[key][0]['id']] > after)
+    text_indexes['update'].insert_before(
+        [((project['id'], u['id']), u.get('description')) for u in project.get('updates', [])],
+        lambda key: position[key[0]] > after)
+
+def _build_text_indexes(data):
+    projects = data['projects']
+    text_indexes = {'project': TextIndex(), 'task': TextIndex(), 'update': TextIndex()}
+    text_indexes['project'].add_many((p['id'], p.get('title'), p.get('description')) for p in projects)
+    text_indexes['task'].add_many((t['id'], t.get('description'), t.get('additional_info'))
+                                  for p in projects for t in p.get('tasks', []))
+    text_indexes['update'].add_many(((p['id'], u['id']), u.get('description'))
+                                    for p in projects for u in p.get('updates', []))
+    return text_indexes
+
+def _apply_create_project(data, record):
+    # Also adds projects moving in from the other tier, tasks and updates included; those carry their position
+    order = _order(data)
+    project = record['project']
+    projects = data['projects']
+    position = order[project['id']] = record.get('position', data['revision'])
+    _touch(data, project)
+    inserted = projects and order[projects[-1]['id']] > position
+    if inserted:
+        # A project moving back goes to its old place; positions shift, so the index is rebuilt like on removal
+        projects.insert(bisect(projects, position, key=lambda p: order[p['id']]), project)
+        _indexes.pop(id(data), None)
+        _get_index(data)
+    else:
+        index = _get_index(data)  # Before appending: during journal replay this may build it
+        projects.append(project)
+        index.add_project(project)
+    text_indexes = _text_indexes(data)
+    if text_indexes and inserted:
+        _index_moved_project_text(text_indexes, data, project)
+    elif text_indexes:
+        _index_project_text(text_indexes, project)
+    return project['id']
+
+def _apply_remove_projects(data, record):
+    """Drops projects that moved to the other tier."""
+    removed_ids = set(record['project_ids'])
+    removed = [p for p in data['projects'] if p['id'] in removed_ids]
+    if not removed:
+        return
+    order = _order(data)  # Before removing: a file from before project_order gets it from the full list
+    data['projects'] = [p for p in data['projects'] if p['id'] not in removed_ids]
+    for project_id in removed_ids:
+        order.pop(project_id, None)
+    # Positions moved, so the index is rebuilt; it only covers this tier, which keeps that cheap for the hot one
+    _indexes.pop(id(data), None)
+    _get_index(data)
+    text_indexes = _text_indexes(data)
+    if text_indexes:
+        for project in removed:
+            _unindex_project_text(text_indexes, project)
+    if record.get('to_archive'):
+        data['archive_revision'] = data['revision']
+
+def _apply_archive_changed(data, record):
+    """Moves the revision on for a change made to the archive, which has no counter of its own."""
+    data['archive_revision'] = data['revision']
+
+def _apply_update_project(data, record):
+    index = _get_index(data)
+    project = index.projects_by_id.get(record['project_id'])
+    if project:
+        old_status, old_completion = project['status'], project.get('actual_completion_date')
+        old_updates = project['updates']
+        project.update(record['fields'])
+        _touch(data, project)
+        if project['status'] != old_status:
+            index.project_status_changed(project, old_status)
+        index.completion_changed(old_completion, project.get('actual_completion_date'))
+        text_indexes = _text_indexes(data)
+        if text_indexes:
+            text_indexes['project'].set(project['id'], project['title'], project['description'])
+            if project['updates'] is not old_updates:
+                kept = {update['id'] for update in project['updates']}
+                for update in old_updates:
+                    if update['id'] not in kept:
+                        text_indexes['update'].remove((project['id'], update['id']))
+                # Updates already indexed keep their place in the results
+                for update in project['updates']:
+                    _index_update(text_indexes, project, update)
+
+def _apply_create_task(data, record):
+    index = _get_index(data)
+    project = index.projects_by_id.get(record['project_id'])
+    if project:
+        project['tasks'].append(record['task'])
+        _touch(data, project)
+        index.add_task(project, record['task'], len(project['tasks']) - 1)
+        text_indexes = _text_indexes(data)
+        if text_indexes:
+            text_indexes['task'].set(record['task']['id'], record['task']['description'],
+                                     record['task']['additional_info'])
+        return record['task']['id']
+
+def _apply_update_task(data, record):
+    index = _get_index(data)
+    project, task = index.tasks_by_id.get(record['task_id'], (None, None))
+    if task and project['id'] == record['project_id']:
+        old_status, old_due_key, old_completion = task['status'], due_key(task), task.get('actual_completion_date')
+        task.update(record['fields'])
+        _touch(data, project)
+        if task['status'] != old_status or due_key(task) != old_due_key:
+            # Also keeps the project's next_task_due_date and task counts current
+            index.task_changed(project, task, old_status, old_due_key)
+        index.completion_changed(old_completion, task.get('actual_completion_date'))
+        text_indexes = _text_indexes(data)
+        if text_indexes:
+            text_indexes['task'].set(task['id'], task['description'], task['additional_info'])
+
+def _apply_add_update(data, record):
+    project = _find_project(data, record['project_id'])
+    if project:
+        project['updates'].append(record['update'])
+        _touch(data, project)
+        text_indexes = _text_indexes(data)
+        if text_indexes:
+            _index_update(text_indexes, project, record['update'])
+
+def _apply_delete_update(data, record):
+    project = _find_project(data, record['project_id'])
+    if project:
+        project['updates'] = [u for u in project['updates'] if u['id'] != record['update_id']]
+        _touch(data, project)
+        text_indexes = _text_indexes(data)
+        if text_indexes:
+            text_indexes['update'].remove((project['id'], record['update_id']))
+
+_APPLIERS = {
+    'create_project': _apply_create_project,
+    'remove_projects': _apply_remove_projects,
+    'archive_changed': _apply_archive_changed,
+    'update_project': _apply_update_project,
+    'create_task': _apply_create_task,
+    'update_task': _apply_update_task,
+    'add_update': _apply_add_update,
+    'delete_update': _apply_delete_update,
+}
+
+def _apply(data, record):
+    """Applies one mutation record to the project document."""
+    applier = _APPLIERS.get(record['op'])
+    if applier is None:
+        print(f"Skipping unknown mutation record: {record['op']}")
+        return None
+    # Every record moves the revision on, replay included, so it is the same in every process. Archive records
+    # carry the project_data.json revision they were made at, since that file owns the counter.
+    data['revision'] = record['revision'] if 'revision' in record else data.get('revision', 0) + 1
+    return applier(data, record)
+
+# get_projects_by_category sort keys; the SQLite backend has matching ORDER BY expressions
+PROJECT_SORT_KEYS = {
+    'start_date': itemgetter('start_date'),
+    'target_completion_date': due_key,
+    'next_task_due_date': lambda p: p.get('next_task_due_date', NO_DUE_DATE),
+}
+
+# query_project task sort keys, as offered by the project pages; the SQLite backend has matching ORDER BY expressions
+TASK_STATUS_ORDER = {'active': 0, 'on hold': 1, 'complete': 2, 'archived': 3, 'ongoing': 4}
+TASK_SORT_KEYS = {
+    'due_date': due_key,
+    'start_date': lambda t: t.get('start_date') or NO_DUE_DATE,
+    'status': lambda t: TASK_STATUS_ORDER.get(t.get('status'), 999),
+}
+
+def project_view(project, task_statuses=None, sort_by=None, order='asc', fields=None):
+    """Builds query_project's result from a stored project. Shared with the sharded backend."""
+    view = {key: project[key] for key in (project if fields is None else fields) if key in project}
+    if 'tasks' in view:
+        tasks = (task for task in project['tasks'] if not task_statuses or task['status'] in task_statuses)
+        key = TASK_SORT_KEYS.get(sort_by)
+        view['tasks'] = sorted(tasks, key=key, reverse=(order == 'desc')) if key else list(tasks)
+    return view
+
+_store = JsonStore(DATA_FILE, lambda: {"projects": []}, apply=_apply, on_load=lambda data: _loaded('hot', data),
+                   journal=config.JOURNAL_ENABLED, compact_threshold=config.JOURNAL_COMPACT_THRESHOLD,
+                   schema=codec.ProjectData if config.VALIDATE_SCHEMA else None)
+_archive = JsonStore(ARCHIVE_FILE, lambda: {"projects": []}, apply=_apply,
+                     on_load=lambda data: _loaded('archive', data), journal=config.JOURNAL_ENABLED,
+                     compact_threshold=config.JOURNAL_COMPACT_THRESHOLD,
+                     schema=codec.ProjectData if config.VALIDATE_SCHEMA else None)
+
+# Locks are always taken in this order: project_data.json, then the archive. The archive is only written with
+# both write locks held, so holding project_data.json's read lock is enough to keep both documents still.
+
+@contextmanager
+def _reading(archive=True):
+    """Yields (working set document, archive document or None) and keeps writers out until the block exits."""
+    with _store.reading() as data:
+        if not archive:
+            yield data, None
+            return
+        with _archive.reading() as archived:
+            yield data, archived
+
+@contextmanager
+def _locating(project_id):
+    """Yields the project from whichever tier holds it, or None, and keeps writers out until the block exits."""
+    with _store.reading() as data:
+        project = _find_project(data, project_id)
+        if project is not None:
+            yield project
+            return
+        with _archive.reading() as archive:
+            yield _find_project(archive, project_id)
+
+def _archived(data, projects):
+    """Skips archive projects that the working set holds too, the leftovers of an interrupted move."""
+    live = _get_index(data).projects_by_id
+    return (project for project in projects if project['id'] not in live)
+
+def _position_key(data, archive):
+    """Sort key giving a project's position across both tiers (see project_order)."""
+    hot, archived = _order(data), _order(archive)
+    return lambda project: hot[project['id']] if project['id'] in hot else archived[project['id']]
+
+def _merge_tiers(data, archive, hot_projects, archive_projects):
+    """Merges projects of the two tiers, each in its tier's order, back into a single list's order."""
+    return heapq.merge(hot_projects, _archived(data, archive_projects), key=_position_key(data, archive))
+
+def _all_projects(data, archive):
+    return _merge_tiers(data, archive, data['projects'], archive['projects'])
+
+def _needs_archive(statuses):
+    return not statuses or any(status in ARCHIVE_STATUSES for status in statuses)
+
+def _commit_to_archive(data, record):
+    """Commits a record to the archive, moving the revision on in project_data.json first. Needs both write locks."""
+    _store.commit({"op": "archive_changed"})
+    return _archive.commit(dict(record, revision=data['revision']))
+
+def _rebalance(data):
+    """Moves every project whose status belongs to the other tier and drops leftovers of interrupted moves.
+
+    Runs with project_data.json's write lock held; picks up files written before tiering existed.
+    """
+    with _archive.writing() as archive:
+        live = _get_index(data).projects_by_id
+        leftovers = [p['id'] for p in archive['projects'] if p['id'] in live]
+        if leftovers:
+            _archive.commit({"op": "remove_projects", "project_ids": leftovers, "revision": data.get('revision', 0)})
+        leaving = [p for p in data['projects'] if p['status'] in ARCHIVE_STATUSES]
+        if leaving:
+            revision = data.get('revision', 0) + 1  # What the removal below moves project_data.json on to
+            with _archive.batch():
+                for project in leaving:
+                    _archive.commit({"op": "create_project", "project": dict(project), "revision": revision,
+                                     "position": _order(data)[project['id']]})
+            _store.commit({"op": "remove_projects", "project_ids": [p['id'] for p in leaving], "to_archive": True})
+        returning = [p for p in archive['projects'] if p['status'] not in ARCHIVE_STATUSES]
+        if returning:
+            with _store.batch():
+                for project in returning:
+                    _store.commit({"op": "create_project", "project": dict(project),
+                                   "position": _order(archive)[project['id']]})
+            _store.flush()  # Even inside a caller's batch: the archive copies go next
+            _archive.commit({"op": "remove_projects", "project_ids": [p['id'] for p in returning],
+                             "revision": data['revision']})
+
+def _commit(record, project_id, status=None):
+    """Commits a mutation of one project to the tier holding it. Returns whatever the applier returns.
+
+    `status` is the project's new status when the record may change it; if it belongs to the other tier the
+    project moves there, with the record's fields applied on the way.
+    """
+    with _store.writing() as data:
+        if any(_get_index(data).project_status.get(archived) for archived in ARCHIVE_STATUSES):
+            _rebalance(data)
+        project = _find_project(data, project_id)
+        if project is not None:
+            if status not in ARCHIVE_STATUSES:
+                return _store.commit(record)
+            moved = {**project, **record['fields']}
+            revision = data.get('revision', 0) + 1  # What the removal below moves project_data.json on to
+            with _archive.writing():
+                _archive.commit({"op": "create_project", "project": moved, "revision": revision,
+                                 "position": _order(data)[project_id]})
+            _store.commit({"op": "remove_projects", "project_ids": [project_id], "to_archive": True})
+            return None
+        with _archive.writing() as archive:
+            project = _find_project(archive, project_id)
+            if project is None:
+                # No such project: the record changes nothing, but still moves the revision on
+                return _store.commit(record)
+            if status is None or status in ARCHIVE_STATUSES:
+                return _commit_to_archive(data, record)
+            moved = {**project, **record['fields']}
+            _store.commit({"op": "create_project", "project": moved, "position": _order(archive)[project_id]})
+            _store.flush()  # Even inside a caller's batch: the archive copy goes next
+            _archive.commit({"op": "remove_projects", "project_ids": [project_id], "revision": data['revision']})
+            return None
+
+def read_json_data():
+    """load_data() of the JSON files whatever the configured backend, for converting them into another one."""
+    with _reading() as (data, archive):
+        return {"projects": list(_all_projects(data, archive)), "revision": data.get('revision', 0)}
+
+@pluggable
 def load_data():
-    """Loads project data from the JSON file."""
-    if not os.path.exists(DATA_FILE):
-        return {"projects": []}
-    try:
-        with open(DATA_FILE, 'r') as file:
-            return json.load(file)
-    except json.JSONDecodeError:
-        print(f"Error decoding JSON from {DATA_FILE}. Returning empty project list.")
-        return {"projects": []}
+    """Loads every project, from project_data.json and the archive, served from the in-memory caches.
 
+    The document is new but its projects are shared with the caches: treat them as read-only, or pass the
+    document to save_data(). Prefer the get_* functions, which read under the stores' locks and only load the
+    archive when they need it.
+    """
+    return read_json_data()
+
+@pluggable
 def save_data(data):
-    """Saves project data to the JSON file."""
-    with open(DATA_FILE, 'w') as file:
-        json.dump(data, file, indent=4)
+    """Saves project data, splitting the projects between project_data.json and the archive by status."""
+    with _store.writing() as current, _archive.writing() as archived:
+        # Past both, so saving an older copy still moves the revision forward (the page cache relies on it)
+        revision = max(data.get('revision', 0), current.get('revision', 0)) + 1
+        hot = {"projects": [p for p in data['projects'] if p['status'] not in ARCHIVE_STATUSES],
+               "revision": revision, "archive_revision": revision, "journal_seq": current.get('journal_seq', 0)}
+        archive = {"projects": [p for p in data['projects'] if p['status'] in ARCHIVE_STATUSES],
+                   "revision": revision, "journal_seq": archived.get('journal_seq', 0)}
+        positions = {p['id']: i - len(data['projects']) for i, p in enumerate(data['projects'])}
+        for document in (hot, archive):
+            document['project_order'] = {p['id']: positions[p['id']] for p in document['projects']}
+            for project in document['projects']:
+                _touch(document, project)
+        _loaded('hot', hot)
+        _loaded('archive', archive)
+        # The archive goes first, and projects leaving it stay there until project_data.json has them
+        hot_ids = {p['id'] for p in hot['projects']}
+        leaving = [p for p in archived['projects'] if p['id'] in hot_ids]
+        _archive.save(dict(archive, projects=archive['projects'] + leaving) if leaving else archive)
+        _store.save(hot)
+        if leaving:
+            _store.flush()  # Even inside a caller's batch
+            _archive.save(archive)
+
+@pluggable
+def invalidate_cache():
+    """Forces the next read to re-parse the JSON files."""
+    _store.invalidate()
+    _archive.invalidate()
+
+@pluggable
+def batch():
+    """Groups several mutations into a single write of project_data.json.
 
+    Usage: `with batch(): ...` - every save inside the block is flushed once when it exits. Changes to archived
+    projects are written as they happen.
+    """
+    return _store.batch()
+
+@pluggable
+def compact_journal():
+    """Folds the mutation journals back into project_data.json and the archive, moving misplaced projects first."""
+    with _store.writing() as data:
+        _rebalance(data)
+        _store.compact()
+        _archive.compact()
+
+@pluggable
 def get_project(project_id, task_status='active'):  # Add task_status parameter with 'active' as the default
     """Retrieves a specific project by ID with optional task filtering."""
-    data = load_data()
-    project = next((p for p in data['projects'] if p['id'] == project_id), None)
-
-    if project and task_status:
-        # Filter tasks based on status if provided
-        project['tasks'] = [task for task in project['tasks'] if task['status'] == task_status]
+    with _locating(project_id) as project:
+        if project:
+            # Copy so callers can filter and sort without touching the cached document
+            project = dict(project)
+            if task_status:
+                # Filter tasks based on status if provided
+                project['tasks'] = [task for task in project['tasks'] if task['status'] == task_status]
+            else:
+                project['tasks'] = list(project['tasks'])
 
     return project
 
-def get_projects_by_category(category):
-    """Filters projects based on their status category and adds next_task_due_date."""
-    data = load_data()
-    projects = []
-    for project in data['projects']:
-        if project['status'] == category:
-            # Get the active tasks for the project, handling missing dates
-            active_tasks = [
-                task for task in project.get('tasks', [])
-                if task['status'] == 'active' and task.get('target_completion_date')
-            ]
-
-            # Find the next task due date
-            if active_tasks:
-                next_task_due_date = min(
-                    task['target_completion_date'] for task in active_tasks
-                )
-            else:
-                # Use a far-off date if no active tasks with due dates
-                next_task_due_date = '9999-12-31'
+@pluggable
+def query_project(project_id, task_statuses=None, sort_by=None, order='asc', fields=None):
+    """Returns just the parts of a project a page needs, in one pass over its tasks, or None if there's no such project.
+
+    fields lists the project keys to return (all of them when None). Tasks, if included, are limited to
+    task_statuses (every task when empty) and sorted by one of TASK_SORT_KEYS; anything else keeps file order.
+    Only the dict and the task list are new: the values are shared with the cached document and must not be
+    changed.
+    """
+    with _locating(project_id) as project:
+        if project is None:
+            return None
+        return project_view(project, task_statuses, sort_by, order, fields)
 
-            project['next_task_due_date'] = next_task_due_date
-            projects.append(project)
+@pluggable
+def project_exists(project_id):
+    """True if there's a project with this id.
 
-    return projects
+    Answered from the id indexes; the archive is only loaded for ids project_data.json doesn't hold.
+    """
+    with _locating(project_id) as project:
+        return project is not None
 
+@pluggable
+def get_projects_by_category(category, sort_by=None, order='asc', offset=0, limit=None):
+    """Filters projects based on their status category, optionally sorted and paginated.
+
+    sort_by is one of PROJECT_SORT_KEYS; anything else keeps file order. Ties keep file order either way.
+    Only the requested page is copied. Each project carries its stored rollup: next_task_due_date
+    ('9999-12-31' when no active task has a due date), active_task_count and complete_task_count, so listing
+    a category never touches the tasks. Complete and archived projects come from the archive, loaded on first
+    use; the other categories never load it.
+    """
+    with _reading(category in ARCHIVE_STATUSES) as (data, archive):
+        projects = _get_index(data).projects_with_status(category)
+        if archive is not None:
+            projects = _merge_tiers(data, archive, projects, _get_index(archive).projects_with_status(category))
+        key = PROJECT_SORT_KEYS.get(sort_by)
+        if key:
+            projects = sorted(projects, key=key, reverse=(order == 'desc'))
+        return [dict(project) for project in paginate(projects, offset, limit)]
+
+@pluggable
 def create_project(title, description, start_date, target_completion_date, status="active"):  # Add status parameter
     """Creates a new project."""
-    data = load_data()
-    project_id = uuid.uuid4().hex
     new_project = {
-        "id": project_id,
+        "id": uuid.uuid4().hex,
         "title": title,
         "description": description,
         "start_date": start_date,
@@ -73,66 +544,95 @@ def create_project(title, description, start_date, target_completion_date, statu
         "updates": [],
         "tasks": []
     }
-    data["projects"].append(new_project)
-    save_data(data)
-    return project_id
+    if status in ARCHIVE_STATUSES:
+        with _store.writing() as data, _archive.writing():
+            return _commit_to_archive(data, {"op": "create_project", "project": new_project})
+    return _store.commit({"op": "create_project", "project": new_project})
 
+@pluggable
 def update_project(project_id, title, description, status, start_date, target_completion_date, actual_completion_date, updates):
-    """Updates an existing project."""
-    data = load_data()
-    project = next((p for p in data['projects'] if p['id'] == project_id), None)
-    if project:
-        project["title"] = title
-        project["description"] = description
-        project["status"] = status
-        project["start_date"] = start_date
-        project["target_completion_date"] = target_completion_date
-        project["actual_completion_date"] = actual_completion_date
-        project["updates"] = updates
-        save_data(data)
-
-def create_task(project_id, description, additional_info, start_date, target_completion_date, actual_completion_date, status):
-    """Creates a new task for a project."""
-    data = load_data()
-    project = next((p for p in data['projects'] if p['id'] == project_id), None)
-    if project:
-        task_id = uuid.uuid4().hex
-        new_task = {
-            "id": task_id,
+    """Updates an existing project, moving it to or from the archive if its status calls for it."""
+    _commit({
+        "op": "update_project",
+        "project_id": project_id,
+        "fields": {
+            "title": title,
             "description": description,
-            "additional_info": additional_info,
+            "status": status,
             "start_date": start_date,
             "target_completion_date": target_completion_date,
             "actual_completion_date": actual_completion_date,
-            "status": status,
-            "updates": []
+            "updates": updates
         }
-        project["tasks"].append(new_task)
-        save_data(data)
-        return task_id
+    }, project_id, status)
 
+@pluggable
+def create_task(project_id, description, additional_info, start_date, target_completion_date, actual_completion_date, status):
+    """Creates a new task for a project. Returns None if the project doesn't exist."""
+    new_task = {
+        "id": uuid.uuid4().hex,
+        "description": description,
+        "additional_info": additional_info,
+        "start_date": start_date,
+        "target_completion_date": target_completion_date,
+        "actual_completion_date": actual_completion_date,
+        "status": status,
+        "updates": []
+    }
+    return _commit({"op": "create_task", "project_id": project_id, "task": new_task}, project_id)
+
+@pluggable
 def update_task(project_id, task_id, description, additional_info, status, start_date, target_completion_date, actual_completion_date):
     """Updates an existing task."""
-    data = load_data()
-    project = next((p for p in data['projects'] if p['id'] == project_id), None)
-    if project:
-        task = next((t for t in project['tasks'] if t['id'] == task_id), None)
-        if task:
-            task["description"] = description
-            task["additional_info"] = additional_info
-            task["status"] = status
-            task["start_date"] = start_date
-            task["target_completion_date"] = target_completion_date
-            task["actual_completion_date"] = actual_completion_date
-            save_data(data)
-
-def get_all_tasks(sort_by='due_date', order='asc', selected_project_statuses=None, selected_task_statuses=None):
-    """Retrieves all tasks with optional sorting and filtering."""
-    data = load_data()
-    all_tasks = []
-    for project in data['projects']:
-        for task in project['tasks']:
-            task_data = {
+    _commit({
+        "op": "update_task",
+        "project_id": project_id,
+        "task_id": task_id,
+        "fields": {
+            "description": description,
+            "additional_info": additional_info,
+            "status": status,
+            "start_date": start_date,
+            "target_completion_date": target_completion_date,
+            "actual_completion_date": actual_completion_date
+        }
+    }, project_id)
+
+@pluggable
+def get_all_tasks(sort_by='due_date', order='asc', selected_project_statuses=None, selected_task_statuses=None,
+                  offset=0, limit=None):
+    """Retrieves all tasks with optional sorting, filtering and pagination.
+
+    Tasks are produced lazily, so a page costs the tasks up to its end rather than all of them. The archive is
+    only loaded when the project statuses include complete or archived ones (or aren't given).
+    """
+    with _reading(_needs_archive(selected_project_statuses)) as (data, archive):
+        if sort_by == 'due_date':
+            # The due-date index already holds the tasks of each status in order, so no sort is needed
+            descending = order == 'desc'
+            pairs = _get_index(data).tasks_by_due_date(selected_task_statuses or None, descending)
+            if archive is not None:
+                live = _get_index(data).projects_by_id
+                archived = ((project, task) for project, task
+                            in _get_index(archive).tasks_by_due_date(selected_task_statuses or None, descending)
+                            if project['id'] not in live)
+                # Ties go by project position, ascending in both directions like a stable sort leaves them
+                position = _position_key(data, archive)
+                sign = -1 if descending else 1
+                pairs = heapq.merge(pairs, archived, key=lambda pair: (due_key(pair[1]), sign * position(pair[0])),
+                                    reverse=descending)
+        else:
+            projects = data['projects'] if archive is None else _all_projects(data, archive)
+            pairs = ((project, task) for project in projects for task in project['tasks']
+                     if not selected_task_statuses or task['status'] in selected_task_statuses)
+
+        # Apply filtering
+        if selected_project_statuses:
+            pairs = ((project, task) for project, task in pairs if project['status'] in selected_project_statuses)
+
+        all_tasks = []
+        for project, task in paginate(pairs, offset, limit):
+            all_tasks.append({
                 'project_id': project['id'],
                 'project_title': project['title'],
                 'project_status': project['status'],
@@ -140,62 +640,135 @@ def get_all_tasks(sort_by='due_date', order='asc', selected_project_statuses=Non
                 'description': task['description'],
                 'target_completion_date': task.get('target_completion_date'),
                 'status': task['status']
-            }
-
-            # Apply filtering
-            if selected_project_statuses and task_data['project_status'] not in selected_project_statuses:
-                continue
-            if selected_task_statuses and task_data['status'] not in selected_task_statuses:
-                continue
-
-            all_tasks.append(task_data)
-
-    # Apply sorting
-    if sort_by == 'due_date':
-        all_tasks.sort(key=lambda x: x.get('target_completion_date') or '9999-12-31', reverse=(order == 'desc'))
+            })
 
     return all_tasks
 
+@pluggable
 def add_project_update(project_id, update_text):
     """Adds a new update to a project."""
-    data = load_data()
-    project = next((p for p in data['projects'] if p['id'] == project_id), None)
-    if project:
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        new_update = {
-            'id': uuid.uuid4().hex,
-            'timestamp': timestamp,
-            'description': update_text
-        }
-        project['updates'].append(new_update)
-        save_data(data)
+    new_update = {
+        'id': uuid.uuid4().hex,
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'description': update_text
+    }
+    _commit({"op": "add_update", "project_id": project_id, "update": new_update}, project_id)
 
+@pluggable
 def delete_project_update(project_id, update_id):
     """Deletes an update from a project."""
-    data = load_data()
-    project = next((p for p in data['projects'] if p['id'] == project_id), None)
-    if project:
-        project['updates'] = [u for u in project['updates'] if u['id'] != update_id]
-        save_data(data)
+    _commit({"op": "delete_update", "project_id": project_id, "update_id": update_id}, project_id)
 
+@pluggable
 def get_completion_data():
     """Returns all completion dates from projects and tasks"""
-    data = load_data()
     completions = []
 
-    for project in data['projects']:
-        if project['actual_completion_date']:
-            completions.append({
-                'type': 'project',
-                'date': project['actual_completion_date'],
-                'title': project['title']
-            })
-        for task in project['tasks']:
-            if task['actual_completion_date']:
+    with _reading() as (data, archive):
+        for project in _all_projects(data, archive):
+            if project['actual_completion_date']:
                 completions.append({
-                    'type': 'task',
-                    'date': task['actual_completion_date'],
-                    'title': task['description']
+                    'type': 'project',
+                    'date': project['actual_completion_date'],
+                    'title': project['title']
                 })
+            for task in project['tasks']:
+                if task['actual_completion_date']:
+                    completions.append({
+                        'type': 'task',
+                        'date': task['actual_completion_date'],
+                        'title': task['description']
+                    })
+
+    return completions
+
+@pluggable
+def get_completion_calendar(num_weeks=53, today=None):
+    """Returns (date, completion count) pairs for the num_weeks * 7 days ending today, oldest first.
+
+    Served from the completion histogram the index maintains, so the cost doesn't depend on history size.
+    """
+    today = today or datetime.today().date()
+    total_days = num_weeks * 7
+    start_date = today - timedelta(days=total_days - 1)
+    with _reading() as (data, archive):
+        counts = _get_index(data).completion_counts(start_date, total_days)
+        archived = _get_index(archive).completion_counts(start_date, total_days)
+        return [(day, count + archived_count) for (day, count), (_, archived_count) in zip(counts, archived)]
+
+@pluggable
+def search(query, limit=50):
+    """Finds projects, tasks and project updates containing every word of the query.
+
+    The last word also matches as a prefix. Returns up to limit results of each kind, projects first, each
+    as a dict with type ('project', 'task' or 'update'), id, project_id, project_title and text.
+    """
+    with _reading() as (data, archive):
+        live = _get_index(data).projects_by_id
+        # (project, result) pairs of each kind, one list per tier
+        hits = {kind: ([], []) for kind in ('project', 'task', 'update')}
+        for document in (data, archive):
+            text_indexes = _text_indexes(document)
+            if text_indexes is None:
+                # Readers hold the lock, so the document can't change while this is built
+                text_indexes = _build_text_indexes(document)
+                _searches[id(document)] = (document, text_indexes)
+            index = _get_index(document)
+            archived = document is archive
+
+            for project_id in text_indexes['project'].search(query, limit):
+                project = index.projects_by_id[project_id]
+                if not (archived and project_id in live):
+                    hits['project'][archived].append((project, {
+                        'type': 'project', 'id': project_id, 'project_id': project_id,
+                        'project_title': project['title'], 'text': project['description']}))
+            for task_id in text_indexes['task'].search(query, limit):
+                project, task = index.tasks_by_id[task_id]
+                if not (archived and project['id'] in live):
+                    hits['task'][archived].append((project, {
+                        'type': 'task', 'id': task_id, 'project_id': project['id'],
+                        'project_title': project['title'], 'text': task['description']}))
+            for project_id, update_id in text_indexes['update'].search(query, limit):
+                project = index.projects_by_id[project_id]
+                if not (archived and project_id in live):
+                    update = next(u for u in project['updates'] if u['id'] == update_id)
+                    hits['update'][archived].append((project, {
+                        'type': 'update', 'id': update_id, 'project_id': project_id,
+                        'project_title': project['title'], 'text': update['description']}))
+        # The tiers' hits interleave by project position, as they would come from a single file
+        position = _position_key(data, archive)
+        return [result for kind in ('project', 'task', 'update')
+                for _, result in paginate(heapq.merge(*hits[kind], key=lambda pair: position(pair[0])), 0, limit)]
+
+@pluggable
+def get_revision():
+    """Returns the project data's revision, a counter that moves on with every change."""
+    with _store.reading() as data:
+        return data.get('revision', 0)
+
+def _export_project(project):
+    # Copies down to the tasks and updates so the result can be serialized after the lock is released
+    exported = dict(project)
+    exported['tasks'] = [dict(task) for task in project['tasks']]
+    exported['updates'] = [dict(update) for update in project['updates']]
+    return exported
+
+@pluggable
+def get_changes(since=0):
+    """Returns the projects changed after revision `since`, for clients keeping a synced copy.
 
-    return completions
\ No newline at end of file
+    Result: {'revision': current revision, 'projects': [...]}, each project whole with all its tasks and
+    updates and its own 'revision'. A change to a task or an update counts as a change to its project.
+    since=0 returns every project. Projects are never deleted, so there are no tombstones. The archive is only
+    loaded when it changed after `since`.
+    """
+    with _store.reading() as data:
+        revision = data.get('revision', 0)
+        if since >= revision:
+            return {'revision': revision, 'projects': []}
+        projects = [_export_project(p) for p in data['projects'] if since <= 0 or p.get('revision', 0) > since]
+        if since < data.get('archive_revision', revision):
+            with _archive.reading() as archive:
+                projects.extend(_export_project(p) for p in _archived(data, archive['projects'])
+                                if since <= 0 or p.get('revision', 0) > since)
+        return {'revision': revision, 'projects': projects}
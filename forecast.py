@@ -0,0 +1,122 @@
+"""Review workload forecast for a flashcard deck: cards due per day and the load SM2 would generate.
+
+The deck is handled as columns (review dates, intervals, easiness factors, repetitions) rather than card
+dicts. With NumPy installed (`pip install numpy`) every step works on whole arrays; without it the same
+model runs card by card, fine for small decks but several times slower on large ones.
+
+The projection assumes every card is reviewed on the day it is due (overdue ones today) and answered with a
+rating drawn from `ratings`, then rescheduled by SM2 exactly as anki.apply_sm2 does, until its next review
+falls past the horizon. Draws come from a fixed seed, so a deck gives the same forecast every time.
+"""
+import bisect
+import random
+from datetime import date, timedelta
+from itertools import accumulate
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DEFAULT_DAYS = 30
+MAX_DAYS = 365
+# Assumed share of reviews getting each SM2 rating (0-5); below 3 counts as forgotten
+DEFAULT_RATINGS = {1: 0.1, 3: 0.2, 4: 0.45, 5: 0.25}
+DEFAULT_EASINESS = 2.5  # What new cards start with; used for cards missing the field
+SEED = 0
+
+
+def _forecast_numpy(review_dates, intervals, easiness, repetitions, today, days, ratings):
+    try:
+        due = numpy.array(review_dates, dtype='datetime64[D]')
+    except ValueError:
+        # Some date is malformed: parse them one by one instead, treating bad ones as due today
+        due = numpy.array([_parse(value, today) for value in review_dates], dtype='datetime64[D]')
+    due[numpy.isnat(due)] = numpy.datetime64(today, 'D')
+    offsets = (due - numpy.datetime64(today, 'D')).astype(numpy.int64)
+    overdue = int(numpy.count_nonzero(offsets < 0))
+    day = numpy.maximum(offsets, 0)
+    counts = numpy.bincount(day[day < days], minlength=days)
+
+    # Every card due within the horizon is reviewed in rounds: one SM2 step for all of them at once per round
+    window = day < days
+    day = day[window]
+    interval = numpy.array(intervals, dtype=numpy.float64)[window]
+    factor = numpy.array(easiness, dtype=numpy.float64)[window]
+    reps = numpy.array(repetitions, dtype=numpy.int64)[window]
+    values = numpy.array(list(ratings), dtype=numpy.float64)
+    weights = numpy.array(list(ratings.values()), dtype=numpy.float64)
+    rng = numpy.random.default_rng(SEED)
+    load = numpy.zeros(days, dtype=numpy.int64)
+    while day.size:
+        load += numpy.bincount(day, minlength=days)
+        rating = rng.choice(values, size=day.size, p=weights / weights.sum())
+        passed = rating >= 3
+        grown = numpy.where(reps == 0, 1, numpy.where(reps == 1, 6, numpy.round(interval * factor)))
+        interval = numpy.maximum(numpy.where(passed, grown, 1), 1)
+        reps = numpy.where(passed, reps + 1, 0)
+        factor = numpy.maximum(1.3, factor + (0.1 - (5 - rating) * (0.08 + (5 - rating) * 0.02)))
+        day = day + interval.astype(numpy.int64)
+        keep = day < days
+        day, interval, factor, reps = day[keep], interval[keep], factor[keep], reps[keep]
+    return counts.tolist(), load.tolist(), overdue
+
+
+def _forecast_python(review_dates, intervals, easiness, repetitions, today, days, ratings):
+    counts = [0] * days
+    load = [0] * days
+    overdue = 0
+    values = list(ratings)
+    cumulative = list(accumulate(ratings.values()))
+    rng = random.Random(SEED)
+    for review_date, interval, factor, reps in zip(review_dates, intervals, easiness, repetitions):
+        offset = (_parse(review_date, today) - today).days
+        if offset < 0:
+            overdue += 1
+        day = max(offset, 0)
+        if day >= days:
+            continue
+        counts[day] += 1
+        while day < days:
+            load[day] += 1
+            rating = values[bisect.bisect(cumulative, rng.random() * cumulative[-1])]
+            if rating < 3:
+                reps, interval = 0, 1
+            else:
+                interval = 1 if reps == 0 else 6 if reps == 1 else round(interval * factor)
+                reps += 1
+            factor = max(1.3, factor + (0.1 - (5 - rating) * (0.08 + (5 - rating) * 0.02)))
+            day += max(interval, 1)
+    return counts, load, overdue
+
+
+def _parse(value, today):
+    """Parses a review date; missing and malformed ones count as due today."""
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return today
+
+
+def review_forecast(review_dates, intervals, easiness, repetitions, today=None, days=DEFAULT_DAYS,
+                    ratings=DEFAULT_RATINGS):
+    """Forecasts the reviews of the next `days` days from the deck's columns (equal-length sequences).
+
+    Missing intervals, easiness factors and repetitions count as those of a new card. Returns
+    {'days': [{'date', 'due', 'projected'}, ...], 'overdue': cards due before today, 'cards': deck size,
+    'engine': 'numpy' or 'python'}. 'due' counts the cards whose current review date is that day (overdue
+    cards count today); 'projected' adds the reviews those reviews would schedule within the horizon.
+    """
+    today = today or date.today()
+    days = min(max(days, 1), MAX_DAYS)
+    intervals = [interval or 0 for interval in intervals]
+    easiness = [factor or DEFAULT_EASINESS for factor in easiness]
+    repetitions = [reps or 0 for reps in repetitions]
+    forecast = _forecast_numpy if numpy is not None else _forecast_python
+    counts, load, overdue = forecast(review_dates, intervals, easiness, repetitions, today, days, ratings)
+    return {
+        'days': [{'date': today + timedelta(days=i), 'due': counts[i], 'projected': load[i]} for i in range(days)],
+        'overdue': overdue,
+        'cards': len(review_dates),
+        'engine': 'numpy' if numpy is not None else 'python',
+    }
@@ -0,0 +1,399 @@
+import gc
+import heapq
+import re
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+from datetime import date, datetime, timedelta
+from itertools import groupby, islice
+from operator import itemgetter
+
+NO_DUE_DATE = '9999-12-31'  # Sort key for tasks without a target date, same as the old sort fallback
+
+
+def due_key(item):
+    """Sort key for a task's target date; missing dates sort last."""
+    return item.get('target_completion_date') or NO_DUE_DATE
+
+
+def parse_date(value):
+    """Parses a YYYY-MM-DD completion date, returning None for missing or malformed values."""
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)  # Fast path for well-formed dates
+    except (ValueError, TypeError):
+        pass
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (ValueError, TypeError):
+        print(f"Warning: Skipping invalid date format in calendar: {value}")
+        return None
+
+
+def paginate(items, offset=0, limit=None):
+    """Returns the items from offset on, at most limit of them (all when limit is None), without copying the rest."""
+    return islice(items, offset, None if limit is None else offset + limit)
+
+
+def task_rollup(tasks):
+    """Computes a project's stored task rollup (next active due date and task counts) from scratch."""
+    return {
+        'next_task_due_date': min((due_key(t) for t in tasks if t['status'] == 'active'), default=NO_DUE_DATE),
+        'active_task_count': sum(1 for t in tasks if t['status'] == 'active'),
+        'complete_task_count': sum(1 for t in tasks if t['status'] == 'completed'),
+    }
+
+
+def _count_task(project, status, delta):
+    if status == 'active':
+        project['active_task_count'] += delta
+    elif status == 'completed':
+        project['complete_task_count'] += delta
+
+
+def _remove(sorted_list, entry):
+    position = bisect_left(sorted_list, entry)
+    if position < len(sorted_list) and sorted_list[position] == entry:
+        del sorted_list[position]
+
+
+class ProjectIndex:
+    """Secondary indexes over a project document, kept up to date by the data_handler mutators.
+
+    Projects and tasks are never removed in place (data_handler rebuilds the index when projects move to the
+    other tier), so their positions in the document are stable and serve as compact references that also
+    preserve file order:
+      - projects_by_id: project id -> project dict
+      - tasks_by_id: task id -> (project dict, task dict)
+      - project_status: status -> sorted list of project positions
+      - task_due: task status -> sorted list of (due date key, project position, task position)
+      - completions: date -> number of projects and tasks with that actual_completion_date
+
+    It also owns the rollup fields stored on each project (see task_rollup). They are recomputed when the
+    index is built, so stale or missing values in the file heal on load, and adjusted per task mutation after.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.projects_by_id = {}
+        self.positions = {}
+        self.tasks_by_id = {}
+        self.task_positions = {}
+        self.project_status = {}
+        self.task_due = {}
+        self.completions = Counter()
+        for project in data['projects']:
+            self.add_project(project)
+
+    def add_project(self, project):
+        """Indexes a project just appended to the document, along with its tasks."""
+        position = len(self.positions)
+        self.projects_by_id[project['id']] = project
+        self.positions[project['id']] = position
+        self.project_status.setdefault(project['status'], []).append(position)
+        project.update(task_rollup(project.get('tasks', [])))
+        self.completion_changed(None, project.get('actual_completion_date'))
+        for task_position, task in enumerate(project.get('tasks', [])):
+            self._file_task(project, task, task_position)
+
+    def project_status_changed(self, project, old_status):
+        position = self.positions[project['id']]
+        _remove(self.project_status[old_status], position)
+        insort(self.project_status.setdefault(project['status'], []), position)
+
+    def _task_entry(self, project, task):
+        return (due_key(task), self.positions[project['id']], self.task_positions[task['id']])
+
+    def _file_task(self, project, task, task_position):
+        self.tasks_by_id[task['id']] = (project, task)
+        self.task_positions[task['id']] = task_position
+        insort(self.task_due.setdefault(task['status'], []), self._task_entry(project, task))
+        self.completion_changed(None, task.get('actual_completion_date'))
+
+    def add_task(self, project, task, task_position):
+        """Indexes a task just appended to a project and folds it into the project's rollup."""
+        self._file_task(project, task, task_position)
+        _count_task(project, task['status'], 1)
+        if task['status'] == 'active':
+            project['next_task_due_date'] = min(project['next_task_due_date'], due_key(task))
+
+    def task_changed(self, project, task, old_status, old_due_key):
+        """Re-files a task whose status or target date changed and adjusts the project's rollup."""
+        new_entry = self._task_entry(project, task)
+        _remove(self.task_due[old_status], (old_due_key,) + new_entry[1:])
+        insort(self.task_due.setdefault(task['status'], []), new_entry)
+
+        _count_task(project, old_status, -1)
+        _count_task(project, task['status'], 1)
+        if old_status == 'active' and old_due_key == project['next_task_due_date']:
+            # The task may have been the earliest one; only this project's tasks need rescanning
+            project['next_task_due_date'] = task_rollup(project['tasks'])['next_task_due_date']
+        elif task['status'] == 'active':
+            project['next_task_due_date'] = min(project['next_task_due_date'], due_key(task))
+
+    def completion_changed(self, old_value, new_value):
+        """Moves one completion in the per-day histogram from old_value's date to new_value's."""
+        if old_value == new_value:
+            return
+        for value, delta in ((old_value, -1), (new_value, 1)):
+            day = parse_date(value)
+            if day:
+                self.completions[day] += delta
+                if not self.completions[day]:
+                    del self.completions[day]
+
+    def completion_counts(self, start_date, num_days):
+        """Returns a dense list of (date, completions) pairs for num_days days from start_date."""
+        days = [start_date + timedelta(days=i) for i in range(num_days)]
+        return [(day, self.completions.get(day, 0)) for day in days]
+
+    def projects_with_status(self, status):
+        """Yields the projects with a status, in file order."""
+        projects = self.data['projects']
+        for position in self.project_status.get(status, ()):
+            yield projects[position]
+
+    def tasks_by_due_date(self, task_statuses=None, descending=False):
+        """Yields (project, task) pairs ordered by target date, optionally restricted to some task statuses.
+
+        Tasks sharing a date stay in file order in both directions, like a stable sort would leave them.
+        """
+        statuses = self.task_due.keys() if task_statuses is None else task_statuses
+        lists = [self.task_due[status] for status in statuses if status in self.task_due]
+        if descending:
+            merged = heapq.merge(*(reversed(entries) for entries in lists), reverse=True)
+            entries = (entry for _, group in groupby(merged, key=lambda e: e[0]) for entry in reversed(list(group)))
+        else:
+            entries = heapq.merge(*lists)
+        projects = self.data['projects']
+        for _, project_position, task_position in entries:
+            project = projects[project_position]
+            yield project, project['tasks'][task_position]
+
+
+_WORD = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Splits text into lowercase word tokens."""
+    return _WORD.findall(text.lower()) if text else []
+
+
+class TextIndex:
+    """An inverted index from word tokens to document keys, updated one document at a time.
+
+    Keys are any hashable values; each remembers when it was first indexed so results come back in that
+    order. Queries match documents containing every query word, with the last word also matching as a
+    prefix so results show up while the user is still typing it.
+    """
+
+    def __init__(self):
+        self.postings = {}  # token -> set of keys
+        self.vocabulary = []  # Sorted tokens, for prefix lookups
+        self.doc_tokens = {}  # key -> frozenset of its tokens
+        self.order = {}  # key -> insertion sequence number
+        self._next = 0
+
+    def set(self, key, *texts, order=None):
+        """Indexes (or re-indexes) a document made of one or more text fields.
+
+        A key indexed for the first time goes after every other key, or where order puts it among them.
+        """
+        tokens = frozenset(token for text in texts for token in tokenize(text))
+        old = self.doc_tokens.get(key, frozenset())
+        for token in old - tokens:
+            self._unpost(token, key)
+        for token in tokens - old:
+            keys = self.postings.get(token)
+            if keys is None:
+                keys = self.postings[token] = set()
+                insort(self.vocabulary, token)
+            keys.add(key)
+        self.doc_tokens[key] = tokens
+        if key not in self.order and order is not None:
+            self.order[key] = order
+        elif key not in self.order:
+            self.order[key] = self._next
+            self._next += 1
+
+    def insert_before(self, documents, later):
+        """Indexes new (key, text, ...) documents, in turn, ahead of the first key `later(key)` is true for."""
+        first_later = min((order for key, order in self.order.items() if later(key)), default=None)
+        if first_later is None:
+            for key, *texts in documents:
+                self.set(key, *texts)
+            return
+        previous = max((order for order in self.order.values() if order < first_later), default=first_later - 1)
+        step = (first_later - previous) / (len(documents) + 1)
+        for i, (key, *texts) in enumerate(documents, 1):
+            self.set(key, *texts, order=previous + i * step)
+
+    def add_many(self, documents):
+        """Indexes (key, text, ...) tuples for keys not indexed yet; much faster than set() for a full build."""
+        postings = self.postings
+        # Millions of small sets would trigger a garbage collection pass every few hundred allocations
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for key, *texts in documents:
+                tokens = frozenset(tokenize(' '.join(text for text in texts if text)))
+                self.doc_tokens[key] = tokens
+                self.order[key] = self._next
+                self._next += 1
+                for token in tokens:
+                    keys = postings.get(token)
+                    if keys is None:
+                        postings[token] = {key}
+                    else:
+                        keys.add(key)
+        finally:
+            if gc_enabled:
+                gc.enable()
+        self.vocabulary = sorted(postings)
+
+    def remove(self, key):
+        for token in self.doc_tokens.pop(key, ()):
+            self._unpost(token, key)
+        self.order.pop(key, None)
+
+    def _unpost(self, token, key):
+        keys = self.postings[token]
+        keys.discard(key)
+        if not keys:
+            del self.postings[token]
+            _remove(self.vocabulary, token)
+
+    def _prefix_matches(self, prefix):
+        start = bisect_left(self.vocabulary, prefix)
+        keys = set()
+        for token in self.vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            keys |= self.postings[token]
+        return keys
+
+    def search(self, query, limit=None):
+        """Returns the keys of the documents matching every word of the query, in insertion order."""
+        words = tokenize(query)
+        if not words:
+            return []
+        # Exact words first, rarest first, so the intersection shrinks as fast as possible
+        sets = sorted((self.postings.get(word, set()) for word in set(words[:-1])), key=len)
+        sets.append(self._prefix_matches(words[-1]))
+        keys = set(sets[0])
+        for other in sets[1:]:
+            keys &= other
+            if not keys:
+                return []
+        if limit is not None:
+            return heapq.nsmallest(limit, keys, key=self.order.__getitem__)
+        return sorted(keys, key=self.order.__getitem__)
+
+
+def link_reverse_pairs(cards, cards_by_id=None):
+    """Infers pair_id links for decks saved before cards recorded them. Returns the number of pairs linked.
+
+    A card created with reverse=True is linked to an unlinked card holding the same text swapped, which is
+    what the old front/back matching looked for.
+    """
+    cards_by_id = cards_by_id if cards_by_id is not None else {card['id']: card for card in cards}
+    needs_link = [card for card in cards if card.get('reverse') and card.get('pair_id') not in cards_by_id]
+    if not needs_link:
+        return 0
+    unlinked = {}
+    for card in cards:
+        if not card.get('reverse') and card.get('pair_id') not in cards_by_id:
+            unlinked.setdefault((card['front'], card['back']), []).append(card)
+    linked = 0
+    for card in needs_link:
+        candidates = unlinked.get((card['back'], card['front']))
+        if candidates:
+            partner = candidates.pop(0)
+            card['pair_id'] = partner['id']
+            partner['pair_id'] = card['id']
+            linked += 1
+    return linked
+
+
+class CardSchedule:
+    """An id -> card map plus the deck's cards ordered by review date, kept up to date by the anki mutators.
+
+    Cards created as a pair carry each other's id in pair_id, so cards_by_id resolves a reverse card in O(1);
+    links missing from older decks are inferred when the schedule is built.
+
+    The ordered list holds [review_date, card_id] entries and is stored in the deck itself as data['schedule'],
+    so it is saved with the cards. On load a stored schedule that still matches the cards is adopted as is,
+    which costs one linear check instead of a sort.
+
+    Card positions in data['cards'] are indexed on first use. Deleting a card only invalidates the positions
+    after it, which are refreshed when a lookup needs one of them.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.cards_by_id = {card['id']: card for card in data['cards']}
+        self._positions = {}  # card id -> index in data['cards'], valid below self._indexed
+        self._indexed = 0
+        link_reverse_pairs(data['cards'], self.cards_by_id)
+        entries = data.get('schedule')
+        if not self._matches(entries):
+            entries = sorted([card['review_date'], card['id']] for card in data['cards'])
+            data['schedule'] = entries
+        self.entries = entries
+
+    def _matches(self, entries):
+        """Checks that a stored schedule covers every card exactly once, with current dates, in order."""
+        if not isinstance(entries, list) or len(entries) != len(self.cards_by_id):
+            return False
+        seen = set()
+        previous = None
+        for entry in entries:
+            if not isinstance(entry, list) or len(entry) != 2:
+                return False
+            review_date, card_id = entry
+            card = self.cards_by_id.get(card_id)
+            if card is None or card['review_date'] != review_date or card_id in seen:
+                return False
+            if previous is not None and entry < previous:
+                return False
+            seen.add(card_id)
+            previous = entry
+        return True
+
+    def add(self, card):
+        self.cards_by_id[card['id']] = card
+        insort(self.entries, [card['review_date'], card['id']])
+
+    def partner(self, card):
+        """Returns the other card of a reverse pair, or None."""
+        return self.cards_by_id.get(card.get('pair_id'))
+
+    def position(self, card):
+        """Returns a card's index in data['cards']."""
+        position = self._positions.get(card['id'])
+        if position is None or position >= self._indexed:
+            cards = self.data['cards']
+            for i in range(self._indexed, len(cards)):
+                self._positions[cards[i]['id']] = i
+            self._indexed = len(cards)
+            position = self._positions[card['id']]
+        return position
+
+    def remove(self, card):
+        """Deletes a card from the deck and the schedule."""
+        position = self.position(card)
+        del self.data['cards'][position]
+        del self._positions[card['id']]
+        self._indexed = min(self._indexed, position)
+        del self.cards_by_id[card['id']]
+        _remove(self.entries, [card['review_date'], card['id']])
+
+    def reschedule(self, card, old_review_date):
+        """Moves a card whose review_date changed to its new place in the order."""
+        _remove(self.entries, [old_review_date, card['id']])
+        insort(self.entries, [card['review_date'], card['id']])
+
+    def due(self, today):
+        """Returns the cards with review_date on or before today, most overdue first."""
+        end = bisect_right(self.entries, today, key=itemgetter(0))
+        return [self.cards_by_id[card_id] for _, card_id in self.entries[:end]]
@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class RWLock:
+    """Lets any number of threads read at once while writers get exclusive access.
+
+    Both sides are reentrant per thread, and a thread holding the write lock may also read. Waiting writers
+    block new readers so a steady stream of reads can't starve them. Upgrading a read to a write would
+    deadlock against another reader doing the same, so it raises instead.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = None
+        self._write_depth = 0
+        self._waiting_writers = 0
+        self._local = threading.local()
+
+    def _read_depth(self):
+        return getattr(self._local, 'read_depth', 0)
+
+    def is_reading(self):
+        """True if the current thread holds the read or the write lock."""
+        return self._read_depth() > 0 or self.is_writing()
+
+    def is_writing(self):
+        return self._writer == threading.get_ident()
+
+    @contextmanager
+    def read(self):
+        depth = self._read_depth()
+        if depth or self.is_writing():
+            self._local.read_depth = depth + 1
+            try:
+                yield
+            finally:
+                self._local.read_depth = depth
+            return
+        with self._cond:
+            while self._writer is not None or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        self._local.read_depth = 1
+        try:
+            yield
+        finally:
+            self._local.read_depth = 0
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        if self.is_writing():
+            self._write_depth += 1
+            try:
+                yield
+            finally:
+                self._write_depth -= 1
+            return
+        if self._read_depth():
+            raise RuntimeError("Can't take the write lock while holding the read lock")
+        with self._cond:
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = threading.get_ident()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = None
+                self._cond.notify_all()
+
+
+class FileLock:
+    """An advisory lock on `<path>` shared by every process using the same file, plus a write counter.
+
+    Uses flock on POSIX and msvcrt byte locking on Windows, where shared requests are taken exclusively.
+    The lock file also stores a version number that writers bump, so a process can tell that another one
+    wrote the data even when the data file's mtime and size happen to come out the same.
+
+    Not thread safe on its own: callers serialize their threads first (JsonStore does it with its RWLock).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+        self._pid = None
+        self._depth = 0
+        self._exclusive = False
+
+    def _open(self):
+        if self._fd is None or self._pid != os.getpid():
+            # A descriptor inherited through fork() shares its flock with the parent, so each process opens its own
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._pid = os.getpid()
+            self._depth = 0
+        return self._fd
+
+    def _acquire(self, exclusive):
+        fd = self._open()
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            return
+        os.lseek(fd, 0, os.SEEK_SET)
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                return
+            except OSError:
+                time.sleep(0.01)
+
+    def _release(self):
+        if fcntl:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+
+    @contextmanager
+    def hold(self, exclusive=True):
+        """Holds the lock for the block. Nested holds reuse the outer one, which must be exclusive to nest one."""
+        if self._depth:
+            if exclusive and not self._exclusive:
+                raise RuntimeError(f"Can't upgrade the shared lock on {self.path}")
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+            return
+        self._acquire(exclusive)
+        self._depth, self._exclusive = 1, exclusive
+        try:
+            yield
+        finally:
+            self._depth = 0
+            self._release()
+
+    def read_version(self):
+        """Returns the write counter. Only meaningful while the lock is held."""
+        fd = self._open()
+        os.lseek(fd, 0, os.SEEK_SET)
+        try:
+            return int(os.read(fd, 32) or 0)
+        except ValueError:
+            return 0
+
+    def write_version(self, version):
+        """Stores a new write counter. Call with the lock held exclusively."""
+        fd = self._open()
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.write(fd, str(version).encode().ljust(20))
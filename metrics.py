@@ -0,0 +1,211 @@
+"""In-process instrumentation, exposed at /metrics in the Prometheus text format.
+
+Records how long each route, template render and data_handler/anki call takes, and how many bytes the JSON
+stores read and write along with their parse and serialize times. With PROJECT_TRACKER_PROFILE=1 a request
+sent with ?profile=1 or an `X-Profile: 1` header also dumps a cProfile of itself into PROFILE_DIR.
+
+Numbers are per process: with several serve.py workers each scrape sees the worker that answered it.
+"""
+import cProfile
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime
+
+from flask import before_render_template, g, request, template_rendered
+
+import config
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds in seconds; a sample lands in the first bucket it fits
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_metrics = []
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing total per combination of label values."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            yield f"{self.name}{_labels(self.labels, label_values)} {_number(value)}"
+
+
+class Histogram:
+    """Counts observations into BUCKETS and keeps their sum, per combination of label values."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}  # label values -> [per-bucket counts (the last one is +Inf), sum]
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+
+    def samples(self):
+        with self._lock:
+            values = sorted((label_values, (list(counts), total))
+                            for label_values, (counts, total) in self._values.items())
+        for label_values, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_labels(self.labels, label_values, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, label_values)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labels, label_values)} {cumulative}"
+
+
+REQUEST_SECONDS = Histogram('project_tracker_request_seconds', "Time to handle a request, including streaming "
+                            "the body", ('endpoint', 'method'))
+REQUESTS = Counter('project_tracker_requests_total', "Requests answered", ('endpoint', 'method', 'status'))
+TEMPLATE_SECONDS = Histogram('project_tracker_template_render_seconds', "Time to render a page template",
+                             ('template',))
+DATA_CALL_SECONDS = Histogram('project_tracker_data_call_seconds', "Time spent in data_handler/anki functions "
+                              "(the _count is the number of calls)", ('function',))
+STORE_LOADS = Counter('project_tracker_store_loads_total', "JSON store documents read from disk", ('store',))
+STORE_READ_BYTES = Counter('project_tracker_store_read_bytes_total', "Bytes of snapshot and journal read",
+                           ('store',))
+STORE_PARSE_SECONDS = Histogram('project_tracker_store_parse_seconds', "Time to parse a snapshot and replay "
+                                "its journal", ('store',))
+STORE_WRITES = Counter('project_tracker_store_writes_total', "Snapshot rewrites and journal appends", ('store', 'kind'))
+STORE_WRITTEN_BYTES = Counter('project_tracker_store_written_bytes_total', "Bytes of snapshot and journal written",
+                              ('store',))
+STORE_SERIALIZE_SECONDS = Histogram('project_tracker_store_serialize_seconds', "Time to serialize a snapshot",
+                                    ('store',))
+STORE_WRITE_SECONDS = Histogram('project_tracker_store_write_seconds', "Time to write and fsync a snapshot or "
+                                "journal append", ('store',))
+PAGE_CACHE_LOOKUPS = Counter('project_tracker_page_cache_lookups_total', "Cacheable page requests, by whether "
+                             "the rendered page was in the cache", ('endpoint', 'result'))
+PAGE_CACHE_EVICTIONS = Counter('project_tracker_page_cache_evictions_total', "Cached pages dropped to stay under "
+                               "the size cap")
+
+
+def render():
+    """Returns every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
+
+
+def timed(histogram, func, *label_values):
+    """Wraps func so every call is observed in histogram under label_values."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - started, *label_values)
+    return wrapper
+
+
+# --- Flask hooks ---
+
+_render_starts = threading.local()  # Stack of template render start times for the current thread
+
+
+def _template_started(app, template, context, **extra):
+    _render_starts.__dict__.setdefault('stack', []).append(time.perf_counter())
+
+
+def _template_finished(app, template, context, **extra):
+    stack = getattr(_render_starts, 'stack', None)
+    if stack:
+        TEMPLATE_SECONDS.observe(time.perf_counter() - stack.pop(), template.name or 'string')
+
+
+def _profile_requested():
+    return request.args.get('profile') == '1' or request.headers.get('X-Profile') == '1'
+
+
+def _start_request():
+    _render_starts.stack = []  # A render that raised never popped its start
+    g.metrics_started = time.perf_counter()
+    if config.PROFILING_ENABLED and _profile_requested():
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:  # Another profiler is already running in this process
+            print(f"Not profiling {request.path}: {e}")
+        else:
+            g.metrics_profiler = profiler
+
+
+def _finish_request(response):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return response
+    endpoint, method, status = request.endpoint or 'unmatched', request.method, response.status_code
+    profiler = g.pop('metrics_profiler', None)
+    if profiler:
+        os.makedirs(config.PROFILE_DIR, exist_ok=True)
+        path = os.path.join(config.PROFILE_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{endpoint}.prof")
+        response.headers['X-Profile-Output'] = path
+
+    def finished():
+        # Runs once the body is sent, so streamed pages are timed (and profiled) to the end
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(path)
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint, method)
+        REQUESTS.inc(endpoint, method, status)
+
+    response.call_on_close(finished)
+    return response
+
+
+def init_app(app):
+    """Times every request and template render of an app."""
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_finished, app)
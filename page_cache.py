@@ -0,0 +1,123 @@
+"""Rendered HTML pages kept in memory and served again until something they show changes.
+
+Pages are keyed by URL (path and query string), the theme selected in the session, today's date and a version
+(the project data and deck revisions, which every mutator moves on). A write changes the version, so older
+entries are never matched again and age out of the LRU. The revisions are read through the stores, which
+notice writes from other processes, so serve.py workers never serve each other's stale pages. Compressed
+copies of a page (see assets.py) are cached alongside it, so hits aren't compressed again.
+"""
+import functools
+import threading
+from collections import OrderedDict
+from datetime import date
+
+from flask import Response, make_response, request, session
+
+import assets
+import metrics
+
+
+class PageCache:
+    """An LRU of rendered pages holding at most `max_bytes` of HTML in total; 0 turns caching off.
+
+    Safe to share between threads. `hits`, `misses` and `evictions` count since start-up, and are also
+    reported per endpoint at /metrics.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0  # Bytes of HTML held
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> body, least recently used first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Returns the body stored under key, or None."""
+        body = self._lookup(key)
+        with self._lock:
+            if body is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return body
+
+    def _lookup(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def _encoded(self, key, body, encoding):
+        """Returns a page compressed with encoding, compressing and storing it on first use."""
+        encoded = self._lookup((key, encoding))
+        if encoded is None:
+            encoded = assets.compress(body, encoding)
+            self.put((key, encoding), encoded)
+        return encoded
+
+    def put(self, key, body):
+        """Stores a body, evicting the least recently used ones until everything fits."""
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+                metrics.PAGE_CACHE_EVICTIONS.inc()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _collect(self, key, chunks):
+        """Passes a streamed page through, storing it once it has been sent whole."""
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk.encode() if isinstance(chunk, str) else chunk)
+            yield chunk
+        self.put(key, b''.join(parts))
+
+    def page(self, version):
+        """Decorator caching the HTML a view answers GET requests with.
+
+        version() returns a hashable value covering all the data the page shows; it's called on every request,
+        so it must be cheap. Only 200 text/html responses are stored.
+        """
+        def decorate(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.max_bytes or request.method != 'GET':
+                    return view(*args, **kwargs)
+                # Read before rendering: a write during the render leaves the entry under the old version
+                key = (request.path, request.query_string, session.get('current_style'), date.today(), version())
+                body = self.get(key)
+                if body is not None:
+                    metrics.PAGE_CACHE_LOOKUPS.inc(request.endpoint, 'hit')
+                    encoding = assets.html_encoding(len(body))
+                    response = Response(self._encoded(key, body, encoding) if encoding else body, mimetype='text/html')
+                    if encoding:
+                        response.headers['Content-Encoding'] = encoding
+                    return response
+                metrics.PAGE_CACHE_LOOKUPS.inc(request.endpoint, 'miss')
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200 and response.mimetype == 'text/html':
+                    if response.is_streamed:
+                        response.response = self._collect(key, response.response)
+                    else:
+                        self.put(key, response.get_data())
+                return response
+            return wrapper
+        return decorate
@@ -0,0 +1,139 @@
+"""Production entry point: serves the app with debug off, templates compiled and the data caches loaded.
+
+Usage: python serve.py [--host HOST] [--port N] [--threads N] [--workers N]
+
+Uses waitress when it is installed, otherwise Werkzeug's server with a fixed pool of request threads. With
+--workers above 1 (POSIX only) that many processes share the listening socket. Other WSGI servers can use
+the factory instead, e.g. gunicorn -w 4 --threads 8 "serve:create_app()".
+"""
+import argparse
+import os
+import signal
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+import config
+
+try:
+    import waitress
+except ImportError:
+    waitress = None
+
+
+def warm_up(app):
+    """Compiles every template and loads the data so the first request isn't a cold start."""
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    # Reads through the public API so this works for every backend: the JSON stores parse their files and
+    # build their indexes, SQLite opens the database and pulls the hot pages into its cache
+    import anki
+    import data_handler
+    data_handler.get_projects_by_category('active')
+    anki.get_due_cards()
+
+
+def create_app():
+    """Returns the app configured for production use and warmed up."""
+    from app import app
+    app.debug = False
+    app.config['TEMPLATES_AUTO_RELOAD'] = False  # Don't stat every template on every render
+    if 'FLASK_SECRET_KEY' not in os.environ:
+        print("WARNING: FLASK_SECRET_KEY is not set; sessions are signed with the default key.")
+    warm_up(app)
+    return app
+
+
+class _RequestHandler(WSGIRequestHandler):
+    # One request per connection: an idle keep-alive connection would otherwise hold on to a pool thread
+    protocol_version = "HTTP/1.0"
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Werkzeug's server handing requests to a fixed pool of threads rather than a new thread each."""
+
+    multithread = True
+
+    def __init__(self, host, port, app, threads):
+        # Threads start on the first request, so a server created before fork() is safe to share
+        self._pool = ThreadPoolExecutor(threads, thread_name_prefix='request')
+        super().__init__(host, port, app, handler=_RequestHandler)
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=False)
+
+
+def _serve_forked(server, workers):
+    """Forks `workers` processes that all accept connections on the server's socket, then waits for them."""
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                os._exit(0)
+        children.append(pid)
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    finally:
+        server.server_close()
+
+
+def serve(host=config.SERVE_HOST, port=config.SERVE_PORT, threads=config.SERVE_THREADS, workers=config.SERVE_WORKERS):
+    """Runs the app until interrupted."""
+    app = create_app()
+    if workers > 1 and not hasattr(os, 'fork'):
+        print("WARNING: Multiple worker processes need fork(); running a single worker.")
+        workers = 1
+    if workers == 1 and waitress:
+        print(f"Serving on http://{host}:{port} with waitress ({threads} threads)")
+        waitress.serve(app, host=host, port=port, threads=threads)
+        return
+    server = PooledWSGIServer(host, port, app, threads)
+    print(f"Serving on http://{host}:{port} ({workers} worker(s) x {threads} threads)")
+    if workers > 1:
+        _serve_forked(server, workers)
+        return
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default=config.SERVE_HOST)
+    parser.add_argument('--port', type=int, default=config.SERVE_PORT)
+    parser.add_argument('--threads', type=int, default=config.SERVE_THREADS)
+    parser.add_argument('--workers', type=int, default=config.SERVE_WORKERS)
+    args = parser.parse_args(argv)
+    serve(args.host, args.port, args.threads, args.workers)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
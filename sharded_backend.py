@@ -0,0 +1,566 @@
+import hashlib
+import os
+import re
+import sys
+import threading
+import uuid
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+
+import codec
+import config
+import metrics
+from data_handler import PROJECT_SORT_KEYS, project_view, read_json_data
+from indexes import TextIndex, due_key, paginate, parse_date, task_rollup, tokenize
+from store import JsonStore, file_signature, write_atomic
+
+MANIFEST_FILE = "manifest.json"
+SHARD_LABEL = "shards"  # Store label for the shard files' metrics
+SHARD_CACHE_SIZE = 1000  # Parsed project files kept in memory, least recently used dropped first
+
+_SAFE_ID = re.compile(r'[\w-]+')
+
+# Task statuses whose per-project count the manifest carries, so task lists can skip projects without them
+_ROLLUP_COUNTS = {'active': 'active_task_count', 'completed': 'complete_task_count'}
+
+
+def _summary(project):
+    """The manifest entry for a project: every field but its tasks and updates, plus the task rollup."""
+    summary = {key: value for key, value in project.items() if key not in ('tasks', 'updates')}
+    summary.update(task_rollup(project.get('tasks', [])))
+    return summary
+
+
+def _find(items, item_id):
+    return next((item for item in items if item['id'] == item_id), None)
+
+
+class _CompletionIndex:
+    """Every project's and task's completion date, plus the per-day histogram the calendar reads."""
+
+    def __init__(self):
+        self.revisions = {}  # project id -> revision of the project file indexed
+        self.by_project = {}  # project id -> [(completion dict, date or None)]
+        self.counts = Counter()  # date -> completions
+
+    def build(self, projects):
+        for project in projects:
+            self.put(project)
+
+    def put(self, project):
+        self.drop(project['id'])
+        completions = [({'type': 'project', 'date': project['actual_completion_date'], 'title': project['title']},
+                        parse_date(project['actual_completion_date']))] if project['actual_completion_date'] else []
+        completions.extend(({'type': 'task', 'date': task['actual_completion_date'], 'title': task['description']},
+                            parse_date(task['actual_completion_date']))
+                           for task in project['tasks'] if task['actual_completion_date'])
+        for _, day in completions:
+            if day:
+                self.counts[day] += 1
+        self.by_project[project['id']] = completions
+        self.revisions[project['id']] = project.get('revision')
+
+    def drop(self, project_id):
+        self.revisions.pop(project_id, None)
+        for _, day in self.by_project.pop(project_id, ()):
+            if day:
+                self.counts[day] -= 1
+                if not self.counts[day]:
+                    del self.counts[day]
+
+
+class _SearchIndex:
+    """TextIndexes over every project, task and update.
+
+    Keys are the same as data_handler's: project id, task id, and (project id, update id) for updates.
+    """
+
+    def __init__(self):
+        self.revisions = {}
+        self.text = {'project': TextIndex(), 'task': TextIndex(), 'update': TextIndex()}
+        self.keys = {}  # project id -> (task ids, update keys) indexed for it
+        self.task_projects = {}  # task id -> project id
+
+    def build(self, projects):
+        projects = list(projects)
+        self.text['project'].add_many((p['id'], p.get('title'), p.get('description')) for p in projects)
+        self.text['task'].add_many((t['id'], t.get('description'), t.get('additional_info'))
+                                   for p in projects for t in p['tasks'])
+        self.text['update'].add_many(((p['id'], u['id']), u.get('description'))
+                                     for p in projects for u in p['updates'])
+        for project in projects:
+            self._remember(project)
+
+    def _remember(self, project):
+        tasks = [task['id'] for task in project['tasks']]
+        self.keys[project['id']] = (tasks, [(project['id'], update['id']) for update in project['updates']])
+        self.task_projects.update((task_id, project['id']) for task_id in tasks)
+        self.revisions[project['id']] = project.get('revision')
+
+    def put(self, project):
+        # Keys still present are re-indexed in place, so they keep their place in the results
+        old_tasks, old_updates = self.keys.get(project['id'], ((), ()))
+        self._forget(set(old_tasks) - {task['id'] for task in project['tasks']},
+                     set(old_updates) - {(project['id'], update['id']) for update in project['updates']})
+        self.text['project'].set(project['id'], project.get('title'), project.get('description'))
+        for task in project['tasks']:
+            self.text['task'].set(task['id'], task.get('description'), task.get('additional_info'))
+        for update in project['updates']:
+            self.text['update'].set((project['id'], update['id']), update.get('description'))
+        self._remember(project)
+
+    def drop(self, project_id):
+        self.revisions.pop(project_id, None)
+        self.text['project'].remove(project_id)
+        self._forget(*self.keys.pop(project_id, ((), ())))
+
+    def _forget(self, task_ids, update_keys):
+        for task_id in task_ids:
+            self.text['task'].remove(task_id)
+            self.task_projects.pop(task_id, None)
+        for key in update_keys:
+            self.text['update'].remove(key)
+
+
+_INDEX_TYPES = {'completions': _CompletionIndex, 'search': _SearchIndex}
+
+
+def _export_project(project):
+    exported = dict(project)
+    exported['tasks'] = [dict(task) for task in project['tasks']]
+    exported['updates'] = [dict(update) for update in project['updates']]
+    return exported
+
+
+class ShardedBackend:
+    """Stores each project in its own JSON file under a directory, behind the data_handler function API.
+
+    manifest.json lists every project's summary (see _summary) in file order along with the revision counter,
+    so list views filter, sort and page from it and read only the files of the projects they return. It is a
+    JsonStore in journal mode: a change appends one record to it and rewrites only the changed project's file.
+    Reading a project parses just its file, cached until the file changes on disk (up to SHARD_CACHE_SIZE of
+    them). Shards are written before their manifest record, and the manifest's locks cover both.
+
+    The calendar and search use indexes over every project, built from the files on first use. Writes in this
+    process update them as they go; when the manifest is reloaded (another process wrote), projects whose
+    revision differs from the indexed one are read again.
+
+    Every public method has the same name and signature as the data_handler function it replaces. Flashcards
+    stay in anki.json.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._manifest = JsonStore(os.path.join(directory, MANIFEST_FILE), lambda: {"projects": []},
+                                   apply=self._apply, journal=True,
+                                   compact_threshold=config.JOURNAL_COMPACT_THRESHOLD, on_load=self._positions)
+        self._index = None  # (manifest document, {project id: position})
+        self._shards = OrderedDict()  # project id -> (file signature, project), least recently used first
+        self._shards_lock = threading.Lock()
+        self._indexes = {}  # name in _INDEX_TYPES -> (index, manifest document it was last checked against)
+        self._indexes_lock = threading.Lock()
+
+    # --- Manifest ---
+
+    def _positions(self, manifest):
+        """Returns {project id: position in the manifest}, rebuilding it if the manifest was (re)loaded."""
+        if self._index is None or self._index[0] is not manifest:
+            self._index = (manifest, {summary['id']: i for i, summary in enumerate(manifest['projects'])})
+        return self._index[1]
+
+    def _apply(self, manifest, record):
+        """Applies a manifest record: {'op': 'put', 'project': summary} adds or replaces a project's entry."""
+        manifest['revision'] = manifest.get('revision', 0) + 1
+        if record['op'] != 'put':
+            print(f"Skipping unknown manifest record: {record['op']}")
+            return
+        summary = record['project']
+        summary['revision'] = manifest['revision']
+        positions = self._positions(manifest)
+        position = positions.get(summary['id'])
+        if position is None:
+            positions[summary['id']] = len(manifest['projects'])
+            manifest['projects'].append(summary)
+        else:
+            manifest['projects'][position] = summary
+
+    # --- Shards ---
+
+    def _shard_path(self, project_id):
+        name = project_id if _SAFE_ID.fullmatch(project_id) else hashlib.sha1(project_id.encode()).hexdigest()
+        return os.path.join(self.directory, name + '.json')
+
+    def _shard(self, project_id):
+        """Returns a project from its file, re-parsing it only if it changed. None if the file is missing."""
+        path = self._shard_path(project_id)
+        # Taken before reading, so a write racing with the read makes the next call read again
+        signature = file_signature(path)
+        with self._shards_lock:
+            cached = self._shards.get(project_id)
+            if cached is not None and cached[0] == signature:
+                self._shards.move_to_end(project_id)
+                return cached[1]
+        if signature is None:
+            print(f"WARNING: {path} is missing; skipping project {project_id}.")
+            return None
+        with open(path, 'rb') as file:
+            content = file.read()
+        project = codec.loads(content)
+        metrics.STORE_LOADS.inc(SHARD_LABEL)
+        metrics.STORE_READ_BYTES.inc(SHARD_LABEL, amount=len(content))
+        self._cache_shard(project_id, signature, project)
+        return project
+
+    def _cache_shard(self, project_id, signature, project):
+        with self._shards_lock:
+            self._shards[project_id] = (signature, project)
+            self._shards.move_to_end(project_id)
+            while len(self._shards) > SHARD_CACHE_SIZE:
+                self._shards.popitem(last=False)
+
+    def _forget_shard(self, project_id):
+        with self._shards_lock:
+            self._shards.pop(project_id, None)
+
+    def _shards_of(self, summaries):
+        return [self._shard(summary['id']) for summary in summaries]
+
+    def _projects(self, manifest, summaries=None):
+        """Yields the projects behind manifest entries (all of them by default), in manifest order."""
+        for summary in manifest['projects'] if summaries is None else summaries:
+            project = self._shard(summary['id'])
+            if project is not None:
+                yield project
+
+    def _write_shard(self, project):
+        path = self._shard_path(project['id'])
+        content = codec.dumps(project)
+        try:
+            write_atomic(path, content)
+        except BaseException:
+            self._forget_shard(project['id'])  # The cached copy may hold the change that wasn't written
+            raise
+        self._cache_shard(project['id'], file_signature(path), project)
+        with self._indexes_lock:
+            for index, _ in self._indexes.values():
+                index.put(project)
+        metrics.STORE_WRITES.inc(SHARD_LABEL, 'snapshot')
+        metrics.STORE_WRITTEN_BYTES.inc(SHARD_LABEL, amount=len(content))
+
+    def _synced(self, name, manifest):
+        """Returns the named index, built or brought up to date with the manifest.
+
+        Call with the manifest locked and self._indexes_lock held. Only projects whose revision in the manifest
+        differs from the one indexed are read.
+        """
+        index, checked = self._indexes.get(name, (None, None))
+        if index is None:
+            index = _INDEX_TYPES[name]()
+            index.build(self._projects(manifest))
+        elif checked is not manifest:
+            positions = self._positions(manifest)
+            for summary in manifest['projects']:
+                indexed = summary['id'] in index.revisions
+                if not indexed or index.revisions[summary['id']] != summary.get('revision'):
+                    project = self._shard(summary['id'])
+                    if project is None:
+                        index.drop(summary['id'])
+                    else:
+                        index.put(project)
+            for project_id in [project_id for project_id in index.revisions if project_id not in positions]:
+                index.drop(project_id)
+        self._indexes[name] = (index, manifest)
+        return index
+
+    def _save_project(self, manifest, project):
+        """Writes a project's file, then records its summary and the new revision. Needs the manifest's write lock."""
+        project['revision'] = manifest.get('revision', 0) + 1  # What the manifest record below moves it on to
+        self._write_shard(project)
+        self._manifest.commit({"op": "put", "project": _summary(project)})
+
+    def _change(self, project_id, change):
+        """Calls change(project) on one project and saves it. Returns change's result, or None for unknown ids."""
+        with self._manifest.writing() as manifest:
+            if project_id not in self._positions(manifest):
+                return None
+            project = self._shard(project_id)
+            if project is None:
+                return None
+            result = change(project)
+            self._save_project(manifest, project)
+            return result
+
+    # --- data_handler API ---
+
+    def load_data(self):
+        """Returns every project in the same shape as project_data.json. Reads every file."""
+        with self._manifest.reading() as manifest:
+            summaries = manifest['projects']
+            projects = [{**project, **summary} for summary, project in zip(summaries, self._shards_of(summaries))
+                        if project is not None]
+            return {"projects": projects, "revision": manifest.get('revision', 0)}
+
+    def save_data(self, data):
+        """Replaces every project with the contents of a project_data.json style document."""
+        with self._manifest.writing() as manifest:
+            revision = max(data.get('revision', 0), manifest.get('revision', 0)) + 1
+            projects = data.get('projects', [])
+            for project in projects:
+                project['revision'] = revision
+                self._write_shard(project)
+            kept = {project['id'] for project in projects}
+            for summary in manifest['projects']:
+                if summary['id'] not in kept:
+                    self._forget_shard(summary['id'])
+                    try:
+                        os.remove(self._shard_path(summary['id']))
+                    except FileNotFoundError:
+                        pass  # Already gone; the manifest below drops it all the same
+            self._manifest.save({"projects": [_summary(project) for project in projects], "revision": revision,
+                                 "journal_seq": manifest.get('journal_seq', 0)})
+
+    def invalidate_cache(self):
+        self._manifest.invalidate()
+        with self._shards_lock:
+            self._shards.clear()
+
+    def batch(self):
+        """Groups several mutations into a single append to the manifest; project files are written as they change."""
+        return self._manifest.batch()
+
+    def compact_journal(self):
+        """Folds the manifest's journal back into manifest.json."""
+        self._manifest.compact()
+
+    def get_project(self, project_id, task_status='active'):
+        with self._manifest.reading() as manifest:
+            if project_id not in self._positions(manifest):
+                return None
+            project = self._shard(project_id)
+            if project is None:
+                return None
+            # The manifest entry holds the current task rollup
+            project = {**project, **manifest['projects'][self._positions(manifest)[project_id]]}
+            if task_status:
+                project['tasks'] = [task for task in project['tasks'] if task['status'] == task_status]
+            else:
+                project['tasks'] = list(project['tasks'])
+            return project
+
+    def query_project(self, project_id, task_statuses=None, sort_by=None, order='asc', fields=None):
+        with self._manifest.reading() as manifest:
+            position = self._positions(manifest).get(project_id)
+            if position is None:
+                return None
+            project = self._shard(project_id)
+            if project is None:
+                return None
+            # The manifest entry holds the current task rollup
+            return project_view({**project, **manifest['projects'][position]}, task_statuses, sort_by, order, fields)
+
+    def project_exists(self, project_id):
+        """Answered from the manifest without reading the project's file."""
+        with self._manifest.reading() as manifest:
+            return project_id in self._positions(manifest)
+
+    def get_projects_by_category(self, category, sort_by=None, order='asc', offset=0, limit=None):
+        """Filtered, sorted and paged from the manifest; only the projects on the page are read from their files."""
+        with self._manifest.reading() as manifest:
+            summaries = (summary for summary in manifest['projects'] if summary['status'] == category)
+            key = PROJECT_SORT_KEYS.get(sort_by)
+            if key:
+                summaries = sorted(summaries, key=key, reverse=(order == 'desc'))
+            page = list(paginate(summaries, offset, limit))
+            return [{**project, **summary} for summary, project in zip(page, self._shards_of(page))
+                    if project is not None]
+
+    def create_project(self, title, description, start_date, target_completion_date, status="active"):
+        project = {
+            "id": uuid.uuid4().hex,
+            "title": title,
+            "description": description,
+            "start_date": start_date,
+            "target_completion_date": target_completion_date,
+            "actual_completion_date": None,
+            "status": status,
+            "updates": [],
+            "tasks": []
+        }
+        with self._manifest.writing() as manifest:
+            self._save_project(manifest, project)
+        return project['id']
+
+    def update_project(self, project_id, title, description, status, start_date, target_completion_date,
+                       actual_completion_date, updates):
+        self._change(project_id, lambda project: project.update({
+            "title": title,
+            "description": description,
+            "status": status,
+            "start_date": start_date,
+            "target_completion_date": target_completion_date,
+            "actual_completion_date": actual_completion_date,
+            "updates": updates
+        }))
+
+    def create_task(self, project_id, description, additional_info, start_date, target_completion_date,
+                    actual_completion_date, status):
+        task = {
+            "id": uuid.uuid4().hex,
+            "description": description,
+            "additional_info": additional_info,
+            "start_date": start_date,
+            "target_completion_date": target_completion_date,
+            "actual_completion_date": actual_completion_date,
+            "status": status,
+            "updates": []
+        }
+
+        def add(project):
+            project['tasks'].append(task)
+            return task['id']
+        return self._change(project_id, add)
+
+    def update_task(self, project_id, task_id, description, additional_info, status, start_date,
+                    target_completion_date, actual_completion_date):
+        def update(project):
+            task = next((t for t in project['tasks'] if t['id'] == task_id), None)
+            if task:
+                task.update({
+                    "description": description,
+                    "additional_info": additional_info,
+                    "status": status,
+                    "start_date": start_date,
+                    "target_completion_date": target_completion_date,
+                    "actual_completion_date": actual_completion_date
+                })
+        self._change(project_id, update)
+
+    def get_all_tasks(self, sort_by='due_date', order='asc', selected_project_statuses=None,
+                      selected_task_statuses=None, offset=0, limit=None):
+        """Reads only the files of projects the manifest says can have matching tasks."""
+        counts = None
+        if selected_task_statuses and all(status in _ROLLUP_COUNTS for status in selected_task_statuses):
+            counts = [_ROLLUP_COUNTS[status] for status in selected_task_statuses]
+        with self._manifest.reading() as manifest:
+            summaries = [summary for summary in manifest['projects']
+                         if (not selected_project_statuses or summary['status'] in selected_project_statuses)
+                         and (counts is None or any(summary.get(count) for count in counts))]
+            pairs = [(project, task) for project in self._projects(manifest, summaries) for task in project['tasks']
+                     if not selected_task_statuses or task['status'] in selected_task_statuses]
+            if sort_by == 'due_date':
+                # Stable in both directions, so tasks sharing a date keep file order
+                pairs.sort(key=lambda pair: due_key(pair[1]), reverse=(order == 'desc'))
+            return [{
+                'project_id': project['id'],
+                'project_title': project['title'],
+                'project_status': project['status'],
+                'task_id': task['id'],
+                'description': task['description'],
+                'target_completion_date': task.get('target_completion_date'),
+                'status': task['status']
+            } for project, task in paginate(pairs, offset, limit)]
+
+    def add_project_update(self, project_id, update_text):
+        update = {
+            'id': uuid.uuid4().hex,
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'description': update_text
+        }
+        self._change(project_id, lambda project: project['updates'].append(update))
+
+    def delete_project_update(self, project_id, update_id):
+        def delete(project):
+            project['updates'] = [u for u in project['updates'] if u['id'] != update_id]
+        self._change(project_id, delete)
+
+    def get_completion_data(self):
+        with self._manifest.reading() as manifest, self._indexes_lock:
+            index = self._synced('completions', manifest)
+            return [dict(completion) for summary in manifest['projects']
+                    for completion, _ in index.by_project.get(summary['id'], ())]
+
+    def get_completion_calendar(self, num_weeks=53, today=None):
+        today = today or datetime.today().date()
+        total_days = num_weeks * 7
+        start_date = today - timedelta(days=total_days - 1)
+        with self._manifest.reading() as manifest, self._indexes_lock:
+            counts = self._synced('completions', manifest).counts
+            return [(start_date + timedelta(days=i), counts.get(start_date + timedelta(days=i), 0))
+                    for i in range(total_days)]
+
+    def search(self, query, limit=50):
+        """Looks the query up in the search index and reads only the files of the projects it matched."""
+        if not tokenize(query):
+            return []
+        with self._manifest.reading() as manifest:
+            with self._indexes_lock:
+                index = self._synced('search', manifest)
+                project_ids = index.text['project'].search(query, limit)
+                task_keys = [(index.task_projects[task_id], task_id)
+                             for task_id in index.text['task'].search(query, limit)]
+                update_keys = index.text['update'].search(query, limit)
+            results = []
+            for kind, keys in (('project', [(project_id, project_id) for project_id in project_ids]),
+                               ('task', task_keys), ('update', update_keys)):
+                for project_id, item_id in keys:
+                    project = self._shard(project_id)
+                    if project is None:
+                        continue
+                    item = project if kind == 'project' else _find(project[kind + 's'], item_id)
+                    if item is not None:
+                        results.append({'type': kind, 'id': item_id, 'project_id': project_id,
+                                        'project_title': project['title'], 'text': item['description']})
+            return results
+
+    def get_revision(self):
+        with self._manifest.reading() as manifest:
+            return manifest.get('revision', 0)
+
+    def get_changes(self, since=0):
+        with self._manifest.reading() as manifest:
+            revision = manifest.get('revision', 0)
+            if since >= revision:
+                return {'revision': revision, 'projects': []}
+            changed = [summary for summary in manifest['projects'] if since <= 0 or summary['revision'] > since]
+            return {'revision': revision, 'projects': [_export_project(p) for p in self._projects(manifest, changed)]}
+
+
+def split_json(directory):
+    """One-shot conversion of data_handler's JSON files into a shard directory.
+
+    Read as the JSON backend serves them: journals replayed and both tiers merged in order.
+    """
+    backend = ShardedBackend(directory)
+    backend.save_data({"projects": read_json_data()['projects']})
+    return backend
+
+
+def join_to_json(directory, data_file, archive_file=None):
+    """Writes every project of a shard directory back into a single project_data.json. Returns the document.
+
+    Journals and the archive left from before the split would be replayed or merged on top of it, so they are
+    removed; data_handler moves complete and archived projects back into the archive on its first write.
+    """
+    data = ShardedBackend(directory).load_data()
+    write_atomic(data_file, codec.dumps(data))
+    for path in (data_file + '.journal', archive_file, archive_file and archive_file + '.journal'):
+        if path and os.path.exists(path):
+            os.remove(path)
+    return data
+
+
+if __name__ == "__main__":
+    # Usage: python sharded_backend.py split|join [directory]
+    from data_handler import ARCHIVE_FILE, DATA_FILE
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ('split', 'join'):
+        print("Usage: python sharded_backend.py split|join [directory]")
+        sys.exit(1)
+    shard_dir = sys.argv[2] if len(sys.argv) > 2 else config.SHARD_DIR
+    if sys.argv[1] == 'split':
+        converted = split_json(shard_dir)
+        print(f"Split {len(converted.load_data()['projects'])} projects into {shard_dir}.")
+    else:
+        joined = join_to_json(shard_dir, DATA_FILE, ARCHIVE_FILE)
+        print(f"Joined {len(joined['projects'])} projects from {shard_dir} into {DATA_FILE}.")
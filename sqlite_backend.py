@@ -0,0 +1,813 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import uuid
+from contextlib import contextmanager
+from collections import Counter
+from datetime import datetime, timedelta
+
+import codec
+import forecast
+from anki import TOMBSTONE_LIMIT, apply_sm2, parse_reviewed_at
+from data_handler import read_json_data
+from indexes import link_reverse_pairs, parse_date, tokenize
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    id TEXT PRIMARY KEY,
+    title TEXT,
+    description TEXT,
+    start_date TEXT,
+    target_completion_date TEXT,
+    actual_completion_date TEXT,
+    status TEXT,
+    revision INTEGER NOT NULL DEFAULT 0,
+    next_task_due_date TEXT NOT NULL DEFAULT '9999-12-31',
+    active_task_count INTEGER NOT NULL DEFAULT 0,
+    complete_task_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_projects_status ON projects(status);
+CREATE INDEX IF NOT EXISTS idx_projects_target ON projects(target_completion_date);
+CREATE INDEX IF NOT EXISTS idx_projects_actual ON projects(actual_completion_date);
+
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    project_id TEXT NOT NULL REFERENCES projects(id),
+    description TEXT,
+    additional_info TEXT,
+    start_date TEXT,
+    target_completion_date TEXT,
+    actual_completion_date TEXT,
+    status TEXT,
+    updates TEXT NOT NULL DEFAULT '[]'
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_project ON tasks(project_id);
+CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status);
+CREATE INDEX IF NOT EXISTS idx_tasks_target ON tasks(target_completion_date);
+CREATE INDEX IF NOT EXISTS idx_tasks_actual ON tasks(actual_completion_date);
+
+CREATE TABLE IF NOT EXISTS updates (
+    seq INTEGER PRIMARY KEY,
+    id TEXT NOT NULL,
+    project_id TEXT NOT NULL REFERENCES projects(id),
+    timestamp TEXT,
+    description TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_updates_project ON updates(project_id);
+
+CREATE TABLE IF NOT EXISTS cards (
+    id TEXT PRIMARY KEY,
+    front TEXT,
+    back TEXT,
+    reverse INTEGER NOT NULL DEFAULT 0,
+    easiness_factor REAL,
+    interval INTEGER,
+    repetitions INTEGER,
+    review_date TEXT,
+    created_date TEXT,
+    pair_id TEXT,
+    revision INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_cards_review_date ON cards(review_date);
+"""
+
+PROJECT_COLUMNS = ('id', 'title', 'description', 'start_date', 'target_completion_date',
+                   'actual_completion_date', 'status')
+ROLLUP_COLUMNS = ('next_task_due_date', 'active_task_count', 'complete_task_count')
+TASK_COLUMNS = ('id', 'description', 'additional_info', 'start_date', 'target_completion_date',
+                'actual_completion_date', 'status')
+CARD_COLUMNS = ('id', 'front', 'back', 'reverse', 'easiness_factor', 'interval', 'repetitions',
+                'review_date', 'created_date', 'pair_id')
+
+
+def _due_date(task):
+    """Mirrors the "or '9999-12-31'" fallback the JSON code uses for missing due dates."""
+    return f"COALESCE(NULLIF({task}.target_completion_date, ''), '9999-12-31')"
+
+
+DUE_DATE_KEY = _due_date('t')
+
+# ORDER BY expressions matching data_handler.PROJECT_SORT_KEYS
+PROJECT_SORT_KEYS = {
+    'start_date': "p.start_date",
+    'target_completion_date': "COALESCE(NULLIF(p.target_completion_date, ''), '9999-12-31')",
+    'next_task_due_date': "p.next_task_due_date",
+}
+
+# ORDER BY expressions matching data_handler.TASK_SORT_KEYS
+TASK_SORT_KEYS = {
+    'due_date': DUE_DATE_KEY,
+    'start_date': "COALESCE(NULLIF(t.start_date, ''), '9999-12-31')",
+    'status': "CASE t.status WHEN 'active' THEN 0 WHEN 'on hold' THEN 1 WHEN 'complete' THEN 2 "
+              "WHEN 'archived' THEN 3 WHEN 'ongoing' THEN 4 ELSE 999 END",
+}
+
+
+# task_rollup's fields are stored on each project and kept current by triggers, like the search tables. Like
+# ProjectIndex, they count tasks in and out and only rescan a project's tasks when its earliest active task moves.
+def _next_due_scan(project_id):
+    return (f"(SELECT COALESCE(MIN({DUE_DATE_KEY}), '9999-12-31') FROM tasks t "
+            f"WHERE t.project_id = {project_id} AND t.status = 'active')")
+
+
+def _rollup_schema():
+    return f"""
+CREATE INDEX IF NOT EXISTS idx_projects_next_due ON projects(status, next_task_due_date);
+CREATE TRIGGER IF NOT EXISTS tasks_rollup_insert AFTER INSERT ON tasks BEGIN
+    UPDATE projects SET
+        next_task_due_date = CASE WHEN new.status IS 'active' THEN MIN(next_task_due_date, {_due_date('new')})
+                             ELSE next_task_due_date END,
+        active_task_count = active_task_count + (new.status IS 'active'),
+        complete_task_count = complete_task_count + (new.status IS 'completed')
+    WHERE id = new.project_id;
+END;
+CREATE TRIGGER IF NOT EXISTS tasks_rollup_update AFTER UPDATE OF status, target_completion_date ON tasks BEGIN
+    UPDATE projects SET
+        next_task_due_date = CASE
+            WHEN new.status IS 'active' AND {_due_date('new')} < next_task_due_date THEN {_due_date('new')}
+            WHEN old.status IS 'active' AND {_due_date('old')} = next_task_due_date THEN {_next_due_scan('new.project_id')}
+            ELSE next_task_due_date END,
+        active_task_count = active_task_count + (new.status IS 'active') - (old.status IS 'active'),
+        complete_task_count = complete_task_count + (new.status IS 'completed') - (old.status IS 'completed')
+    WHERE id = new.project_id;
+END;
+CREATE TRIGGER IF NOT EXISTS tasks_rollup_delete AFTER DELETE ON tasks BEGIN
+    UPDATE projects SET
+        next_task_due_date = CASE WHEN old.status IS 'active' AND {_due_date('old')} = next_task_due_date
+                             THEN {_next_due_scan('old.project_id')} ELSE next_task_due_date END,
+        active_task_count = active_task_count - (old.status IS 'active'),
+        complete_task_count = complete_task_count - (old.status IS 'completed')
+    WHERE id = old.project_id;
+END;
+"""
+
+# Fills in the stored rollup of databases created before it existed
+ROLLUP_BACKFILL = (f"UPDATE projects SET next_task_due_date = {_next_due_scan('projects.id')}, "
+                   "active_task_count = (SELECT COUNT(*) FROM tasks t "
+                   "WHERE t.project_id = projects.id AND t.status = 'active'), "
+                   "complete_task_count = (SELECT COUNT(*) FROM tasks t "
+                   "WHERE t.project_id = projects.id AND t.status = 'completed')")
+
+
+# Searchable columns. Each table gets an external-content FTS5 index kept in sync by triggers, so every write
+# path (including save_data's bulk replace) updates it without the methods having to.
+SEARCH_COLUMNS = {
+    'projects': ('title', 'description'),
+    'tasks': ('description', 'additional_info'),
+    'updates': ('description',),
+    'cards': ('front', 'back'),
+}
+
+
+def _search_schema(table, columns):
+    fts = f"{table}_fts"
+    names = ', '.join(columns)
+    new = ', '.join(f"new.{column}" for column in columns)
+    old = ', '.join(f"old.{column}" for column in columns)
+    return f"""
+CREATE VIRTUAL TABLE {fts} USING fts5({names}, content='{table}');
+CREATE TRIGGER {fts}_insert AFTER INSERT ON {table} BEGIN
+    INSERT INTO {fts}(rowid, {names}) VALUES (new.rowid, {new});
+END;
+CREATE TRIGGER {fts}_delete AFTER DELETE ON {table} BEGIN
+    INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.rowid, {old});
+END;
+CREATE TRIGGER {fts}_update AFTER UPDATE OF {names} ON {table} BEGIN
+    INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.rowid, {old});
+    INSERT INTO {fts}(rowid, {names}) VALUES (new.rowid, {new});
+END;
+INSERT INTO {fts}({fts}) VALUES ('rebuild');
+"""
+
+
+# Change tracking for get_changes()/get_card_changes(), done by triggers for the same reason as search: every
+# written row moves its store's counter in `revisions` on and stamps the project (for tasks and updates, their
+# project) or card with it. Deleted cards leave a row in card_tombstones; deleted_floor is the newest revision
+# whose tombstones were dropped.
+REVISION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS revisions (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO revisions (name, value) VALUES ('projects', 0), ('cards', 0), ('deleted_floor', 0);
+CREATE TABLE IF NOT EXISTS card_tombstones (revision INTEGER NOT NULL, id TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS idx_card_tombstones_revision ON card_tombstones(revision);
+CREATE INDEX IF NOT EXISTS idx_projects_revision ON projects(revision);
+CREATE INDEX IF NOT EXISTS idx_cards_revision ON cards(revision);
+"""
+
+
+def _revision_trigger(name, event, table, store, statement):
+    return f"""
+CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON {table} BEGIN
+    UPDATE revisions SET value = value + 1 WHERE name = '{store}';
+    {statement}
+END;
+"""
+
+
+def _revision_schema():
+    current = "(SELECT value FROM revisions WHERE name = '{}')".format
+    stamp_project = f"UPDATE projects SET revision = {current('projects')} WHERE "
+    stamp_card = f"UPDATE cards SET revision = {current('cards')} WHERE rowid = new.rowid;"
+    return REVISION_SCHEMA + ''.join([
+        _revision_trigger('projects_revision_insert', 'INSERT', 'projects', 'projects',
+                          stamp_project + "rowid = new.rowid;"),
+        _revision_trigger('projects_revision_update', f"UPDATE OF {', '.join(PROJECT_COLUMNS)}", 'projects',
+                          'projects', stamp_project + "rowid = new.rowid;"),
+        _revision_trigger('tasks_revision_insert', 'INSERT', 'tasks', 'projects', stamp_project + "id = new.project_id;"),
+        _revision_trigger('tasks_revision_update', 'UPDATE', 'tasks', 'projects', stamp_project + "id = new.project_id;"),
+        _revision_trigger('tasks_revision_delete', 'DELETE', 'tasks', 'projects', stamp_project + "id = old.project_id;"),
+        _revision_trigger('updates_revision_insert', 'INSERT', 'updates', 'projects',
+                          stamp_project + "id = new.project_id;"),
+        _revision_trigger('updates_revision_delete', 'DELETE', 'updates', 'projects',
+                          stamp_project + "id = old.project_id;"),
+        _revision_trigger('cards_revision_insert', 'INSERT', 'cards', 'cards', stamp_card),
+        _revision_trigger('cards_revision_update', f"UPDATE OF {', '.join(CARD_COLUMNS)}", 'cards', 'cards', stamp_card),
+        _revision_trigger('cards_revision_delete', 'DELETE', 'cards', 'cards',
+                          f"INSERT INTO card_tombstones (revision, id) VALUES ({current('cards')}, old.id);"),
+    ])
+
+
+def _page_clause(offset, limit):
+    return f"LIMIT {-1 if limit is None else int(limit)} OFFSET {int(offset)}"
+
+
+class SqliteBackend:
+    """Stores projects, tasks, updates and flashcards in SQLite behind the data_handler/anki function API.
+
+    Every public method has the same name and signature as the module function it replaces.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()  # sqlite3 connections can't be shared between threads
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        card_columns = [row['name'] for row in conn.execute("PRAGMA table_info(cards)")]
+        project_columns = [row['name'] for row in conn.execute("PRAGMA table_info(projects)")]
+        if 'revision' not in card_columns:
+            # Databases created before change tracking; their rows start at revision 0
+            conn.execute("ALTER TABLE projects ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+            conn.execute("ALTER TABLE cards ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+        if 'pair_id' not in card_columns:
+            # Databases created before reverse cards were linked
+            conn.execute("ALTER TABLE cards ADD COLUMN pair_id TEXT")
+        if 'next_task_due_date' not in project_columns:
+            # Databases created before the task rollup was stored
+            conn.execute("ALTER TABLE projects ADD COLUMN next_task_due_date TEXT NOT NULL DEFAULT '9999-12-31'")
+            conn.execute("ALTER TABLE projects ADD COLUMN active_task_count INTEGER NOT NULL DEFAULT 0")
+            conn.execute("ALTER TABLE projects ADD COLUMN complete_task_count INTEGER NOT NULL DEFAULT 0")
+            conn.execute(ROLLUP_BACKFILL)
+        conn.executescript(_revision_schema())
+        conn.executescript(_rollup_schema())
+        if 'pair_id' not in card_columns:
+            self.migrate_reverse_pairs()
+        self._fts = self._create_search_tables(conn)
+
+    @staticmethod
+    def _create_search_tables(conn):
+        """Adds any missing full-text tables, indexing the existing rows. Returns False if FTS5 isn't available."""
+        existing = {row['name'] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        try:
+            for table, columns in SEARCH_COLUMNS.items():
+                if f"{table}_fts" not in existing:
+                    conn.executescript(_search_schema(table, columns))
+        except sqlite3.OperationalError as e:
+            print(f"Full-text search unavailable ({e}); falling back to substring matching.")
+            return False
+        return True
+
+    def _match(self, table, alias, query):
+        """Returns (JOIN + WHERE clause, params) selecting the rows of a table that match a search query.
+
+        Every word must match and the last one also matches as a prefix, like the JSON backend's TextIndex.
+        """
+        words = tokenize(query)
+        if self._fts:
+            match = ' '.join(f'"{word}"' for word in words) + '*'
+            return f"JOIN {table}_fts f ON f.rowid = {alias}.rowid WHERE {table}_fts MATCH ?", [match]
+        columns = SEARCH_COLUMNS[table]
+        clause = ' AND '.join('(' + ' OR '.join(f"{alias}.{column} LIKE ?" for column in columns) + ')'
+                              for _ in words)
+        return f"WHERE {clause}", [f"%{word}%" for word in words for _ in columns]
+
+    # --- Connection handling ---
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            # A connection must not be used across fork(), so a forked worker opens its own
+            conn = sqlite3.connect(self.path, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._local.depth = 0
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Runs the block in a write transaction, joining the enclosing one inside batch()."""
+        conn = self._connection()
+        if self._local.depth == 0:
+            conn.execute("BEGIN IMMEDIATE")
+        self._local.depth += 1
+        try:
+            yield conn
+        except BaseException:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                conn.execute("ROLLBACK")
+            raise
+        self._local.depth -= 1
+        if self._local.depth == 0:
+            conn.execute("COMMIT")
+
+    def batch(self):
+        """Groups several mutations into a single transaction."""
+        return self._transaction()
+
+    def invalidate_cache(self):
+        """Nothing is cached in-process; SQLite always serves current data."""
+
+    def compact_journal(self):
+        """SQLite manages its own write-ahead log."""
+        self._connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    @staticmethod
+    def _revision(conn, name):
+        return conn.execute("SELECT value FROM revisions WHERE name = ?", (name,)).fetchone()[0]
+
+    @staticmethod
+    def _prune_tombstones(conn):
+        """Keeps the newest TOMBSTONE_LIMIT card tombstones, moving deleted_floor past the dropped ones."""
+        row = conn.execute("SELECT revision FROM card_tombstones ORDER BY rowid DESC LIMIT 1 OFFSET ?",
+                           (TOMBSTONE_LIMIT,)).fetchone()
+        if row:
+            conn.execute("DELETE FROM card_tombstones WHERE revision <= ?", (row[0],))
+            conn.execute("UPDATE revisions SET value = MAX(value, ?) WHERE name = 'deleted_floor'", (row[0],))
+
+    # --- Row conversion ---
+
+    def _project_dicts(self, conn, where='', params=(), order_by='p.rowid', offset=0, limit=None):
+        """Loads a page of the projects matching a WHERE clause together with their tasks and updates."""
+        selected = f"SELECT p.* FROM projects p {where} ORDER BY {order_by} {_page_clause(offset, limit)}"
+        rows = conn.execute(selected, params).fetchall()
+        projects = []
+        by_id = {}
+        for row in rows:
+            project = {column: row[column] for column in PROJECT_COLUMNS}
+            project['revision'] = row['revision']
+            project['updates'] = []
+            project['tasks'] = []
+            project.update((column, row[column]) for column in ROLLUP_COLUMNS)
+            projects.append(project)
+            by_id[project['id']] = project
+        if not projects:
+            return projects
+
+        if limit is None and not offset:
+            # Children are fetched with the same filter so a category listing never touches other projects
+            children = f"JOIN projects p ON p.id = c.project_id {where}"
+        else:
+            children = f"WHERE c.project_id IN (SELECT id FROM ({selected}))"
+        for row in conn.execute(f"SELECT c.* FROM updates c {children} ORDER BY c.seq", params):
+            by_id[row['project_id']]['updates'].append(
+                {'id': row['id'], 'timestamp': row['timestamp'], 'description': row['description']})
+        for row in conn.execute(f"SELECT c.* FROM tasks c {children} ORDER BY c.rowid", params):
+            by_id[row['project_id']]['tasks'].append(self._task_dict(row))
+        return projects
+
+    @staticmethod
+    def _task_dict(row):
+        task = {column: row[column] for column in TASK_COLUMNS}
+        task['updates'] = json.loads(row['updates'])
+        return task
+
+    @staticmethod
+    def _card_dict(row):
+        card = {column: row[column] for column in CARD_COLUMNS}
+        card['reverse'] = bool(card['reverse'])
+        card['revision'] = row['revision']
+        if card['pair_id'] is None:
+            del card['pair_id']  # Matches the JSON deck, where unpaired cards have no pair_id
+        return card
+
+    @staticmethod
+    def _insert_project(conn, project):
+        conn.execute("INSERT INTO projects (id, title, description, start_date, target_completion_date, "
+                     "actual_completion_date, status) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     [project.get(column) for column in PROJECT_COLUMNS])
+        SqliteBackend._insert_updates(conn, project['id'], project.get('updates', []))
+        for task in project.get('tasks', []):
+            SqliteBackend._insert_task(conn, project['id'], task)
+
+    @staticmethod
+    def _insert_task(conn, project_id, task):
+        conn.execute("INSERT INTO tasks (id, project_id, description, additional_info, start_date, "
+                     "target_completion_date, actual_completion_date, status, updates) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                     [task['id'], project_id] + [task.get(column) for column in TASK_COLUMNS[1:]]
+                     + [json.dumps(task.get('updates', []))])
+
+    @staticmethod
+    def _insert_updates(conn, project_id, updates):
+        conn.executemany("INSERT INTO updates (id, project_id, timestamp, description) VALUES (?, ?, ?, ?)",
+                         [(u['id'], project_id, u.get('timestamp'), u.get('description')) for u in updates])
+
+    @staticmethod
+    def _insert_card(conn, card):
+        conn.execute("INSERT INTO cards (id, front, back, reverse, easiness_factor, interval, repetitions, "
+                     "review_date, created_date, pair_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                     [card.get(column) for column in CARD_COLUMNS])
+
+    # --- data_handler API ---
+
+    def load_data(self):
+        """Returns every project in the same shape as project_data.json."""
+        return {"projects": self._project_dicts(self._connection())}
+
+    def save_data(self, data):
+        """Replaces every project with the contents of a project_data.json style document."""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM updates")
+            conn.execute("DELETE FROM tasks")
+            conn.execute("DELETE FROM projects")
+            for project in data.get('projects', []):
+                self._insert_project(conn, project)
+
+    def get_project(self, project_id, task_status='active'):
+        projects = self._project_dicts(self._connection(), "WHERE p.id = ?", (project_id,))
+        if not projects:
+            return None
+        project = projects[0]
+        if task_status:
+            project['tasks'] = [task for task in project['tasks'] if task['status'] == task_status]
+        return project
+
+    def query_project(self, project_id, task_statuses=None, sort_by=None, order='asc', fields=None):
+        """Only queries the child tables the requested fields need; tasks are filtered and sorted in SQL."""
+        conn = self._connection()
+        row = conn.execute("SELECT * FROM projects WHERE id = ?", (project_id,)).fetchone()
+        if row is None:
+            return None
+
+        def wanted(key):
+            return fields is None or key in fields
+        project = {column: row[column] for column in PROJECT_COLUMNS + ('revision',) if wanted(column)}
+        if wanted('updates'):
+            project['updates'] = [dict(update) for update in conn.execute(
+                "SELECT id, timestamp, description FROM updates WHERE project_id = ? ORDER BY seq", (project_id,))]
+        if wanted('tasks'):
+            where, params = "WHERE t.project_id = ?", [project_id]
+            if task_statuses:
+                where += f" AND t.status IN ({', '.join('?' * len(task_statuses))})"
+                params.extend(task_statuses)
+            # Ties keep file order, matching the stable sort of the JSON backend
+            order_by = "t.rowid"
+            if sort_by in TASK_SORT_KEYS:
+                order_by = f"{TASK_SORT_KEYS[sort_by]} {'DESC' if order == 'desc' else 'ASC'}, {order_by}"
+            project['tasks'] = [self._task_dict(task) for task in
+                                conn.execute(f"SELECT t.* FROM tasks t {where} ORDER BY {order_by}", params)]
+        project.update((column, row[column]) for column in ROLLUP_COLUMNS if wanted(column))
+        return project
+
+    def project_exists(self, project_id):
+        return self._connection().execute("SELECT 1 FROM projects WHERE id = ?", (project_id,)).fetchone() is not None
+
+    def get_projects_by_category(self, category, sort_by=None, order='asc', offset=0, limit=None):
+        # Ties keep file order, matching the stable sort of the JSON backend
+        order_by = 'p.rowid'
+        if sort_by in PROJECT_SORT_KEYS:
+            order_by = f"{PROJECT_SORT_KEYS[sort_by]} {'DESC' if order == 'desc' else 'ASC'}, {order_by}"
+        return self._project_dicts(self._connection(), "WHERE p.status = ?", (category,), order_by, offset, limit)
+
+    def create_project(self, title, description, start_date, target_completion_date, status="active"):
+        project_id = uuid.uuid4().hex
+        with self._transaction() as conn:
+            self._insert_project(conn, {
+                "id": project_id,
+                "title": title,
+                "description": description,
+                "start_date": start_date,
+                "target_completion_date": target_completion_date,
+                "actual_completion_date": None,
+                "status": status,
+            })
+        return project_id
+
+    def update_project(self, project_id, title, description, status, start_date, target_completion_date,
+                       actual_completion_date, updates):
+        with self._transaction() as conn:
+            cursor = conn.execute("UPDATE projects SET title = ?, description = ?, status = ?, start_date = ?, "
+                                  "target_completion_date = ?, actual_completion_date = ? WHERE id = ?",
+                                  (title, description, status, start_date, target_completion_date,
+                                   actual_completion_date, project_id))
+            if not cursor.rowcount:
+                return
+            current = [dict(row) for row in conn.execute(
+                "SELECT id, timestamp, description FROM updates WHERE project_id = ? ORDER BY seq", (project_id,))]
+            # Unchanged updates keep their rows, and so their place in search results
+            if current != [{'id': u['id'], 'timestamp': u.get('timestamp'), 'description': u.get('description')}
+                           for u in updates]:
+                conn.execute("DELETE FROM updates WHERE project_id = ?", (project_id,))
+                self._insert_updates(conn, project_id, updates)
+
+    def create_task(self, project_id, description, additional_info, start_date, target_completion_date,
+                    actual_completion_date, status):
+        with self._transaction() as conn:
+            if not conn.execute("SELECT 1 FROM projects WHERE id = ?", (project_id,)).fetchone():
+                return None
+            task_id = uuid.uuid4().hex
+            self._insert_task(conn, project_id, {
+                "id": task_id,
+                "description": description,
+                "additional_info": additional_info,
+                "start_date": start_date,
+                "target_completion_date": target_completion_date,
+                "actual_completion_date": actual_completion_date,
+                "status": status,
+                "updates": []
+            })
+        return task_id
+
+    def update_task(self, project_id, task_id, description, additional_info, status, start_date,
+                    target_completion_date, actual_completion_date):
+        with self._transaction() as conn:
+            conn.execute("UPDATE tasks SET description = ?, additional_info = ?, status = ?, start_date = ?, "
+                         "target_completion_date = ?, actual_completion_date = ? WHERE id = ? AND project_id = ?",
+                         (description, additional_info, status, start_date, target_completion_date,
+                          actual_completion_date, task_id, project_id))
+
+    def get_all_tasks(self, sort_by='due_date', order='asc', selected_project_statuses=None,
+                      selected_task_statuses=None, offset=0, limit=None):
+        clauses, params = [], []
+        if selected_project_statuses:
+            clauses.append(f"p.status IN ({', '.join('?' * len(selected_project_statuses))})")
+            params.extend(selected_project_statuses)
+        if selected_task_statuses:
+            clauses.append(f"t.status IN ({', '.join('?' * len(selected_task_statuses))})")
+            params.extend(selected_task_statuses)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        # Ties keep file order, matching the stable sort of the JSON backend
+        order_by = "p.rowid, t.rowid"
+        if sort_by == 'due_date':
+            order_by = f"{DUE_DATE_KEY} {'DESC' if order == 'desc' else 'ASC'}, {order_by}"
+        rows = self._connection().execute(
+            "SELECT p.id AS project_id, p.title AS project_title, p.status AS project_status, t.id AS task_id, "
+            "t.description, t.target_completion_date, t.status "
+            f"FROM tasks t JOIN projects p ON p.id = t.project_id {where} ORDER BY {order_by} "
+            f"{_page_clause(offset, limit)}", params)
+        return [dict(row) for row in rows]
+
+    def add_project_update(self, project_id, update_text):
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM projects WHERE id = ?", (project_id,)).fetchone():
+                self._insert_updates(conn, project_id, [{
+                    'id': uuid.uuid4().hex,
+                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    'description': update_text
+                }])
+
+    def delete_project_update(self, project_id, update_id):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM updates WHERE project_id = ? AND id = ?", (project_id, update_id))
+
+    def get_completion_data(self):
+        rows = self._connection().execute(
+            "SELECT 'project' AS type, actual_completion_date AS date, title FROM projects "
+            "WHERE actual_completion_date != '' "
+            "UNION ALL SELECT 'task', actual_completion_date, description FROM tasks "
+            "WHERE actual_completion_date != ''")
+        return [dict(row) for row in rows]
+
+    def get_completion_calendar(self, num_weeks=53, today=None):
+        today = today or datetime.today().date()
+        total_days = num_weeks * 7
+        start_date = today - timedelta(days=total_days - 1)
+        # Range scans on the completion date indexes; the string bounds are widened slightly so that
+        # non zero-padded dates the JSON backend accepts are still picked up and parsed below
+        bounds = (start_date.isoformat()[:5], today.isoformat()[:5] + '\uffff')
+        rows = self._connection().execute(
+            "SELECT actual_completion_date, COUNT(*) FROM projects WHERE actual_completion_date BETWEEN ? AND ? "
+            "GROUP BY actual_completion_date UNION ALL "
+            "SELECT actual_completion_date, COUNT(*) FROM tasks WHERE actual_completion_date BETWEEN ? AND ? "
+            "GROUP BY actual_completion_date", bounds + bounds)
+        counts = Counter()
+        for value, count in rows:
+            day = parse_date(value)
+            if day:
+                counts[day] += count
+        return [(start_date + timedelta(days=i), counts.get(start_date + timedelta(days=i), 0))
+                for i in range(total_days)]
+
+    def search(self, query, limit=50):
+        if not tokenize(query):
+            return []
+        conn = self._connection()
+        results = []
+        for kind, table, alias, select, joins in (
+            ('project', 'projects', 'p', "p.id, p.id AS project_id, p.title AS project_title, p.description AS text", ''),
+            ('task', 'tasks', 't', "t.id, p.id AS project_id, p.title AS project_title, t.description AS text",
+             "JOIN projects p ON p.id = t.project_id"),
+            ('update', 'updates', 'u', "u.id, p.id AS project_id, p.title AS project_title, u.description AS text",
+             "JOIN projects p ON p.id = u.project_id"),
+        ):
+            match, params = self._match(table, alias, query)
+            rows = conn.execute(f"SELECT {select} FROM {table} {alias} {joins} {match} ORDER BY {alias}.rowid LIMIT ?",
+                                params + [limit])
+            results.extend({'type': kind, **dict(row)} for row in rows)
+        return results
+
+    def get_revision(self):
+        return self._revision(self._connection(), 'projects')
+
+    def get_changes(self, since=0):
+        conn = self._connection()
+        # Revision first: a write landing in between is sent again next time rather than missed
+        revision = self._revision(conn, 'projects')
+        if since <= 0:
+            projects = self._project_dicts(conn)
+        elif since >= revision:
+            projects = []
+        else:
+            projects = self._project_dicts(conn, "WHERE p.revision > ?", (since,))
+        return {'revision': revision, 'projects': projects}
+
+    # --- anki API ---
+
+    def load_anki_data(self):
+        """Returns every card in the same shape as anki.json."""
+        rows = self._connection().execute("SELECT * FROM cards ORDER BY rowid")
+        return {"cards": [self._card_dict(row) for row in rows]}
+
+    def save_anki_data(self, data):
+        """Replaces every card with the contents of an anki.json style document."""
+        cards = data.get('cards', [])
+        link_reverse_pairs(cards)
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM cards")
+            for card in cards:
+                self._insert_card(conn, card)
+            # Like the JSON deck, a bulk replace sends synced clients back to a full copy
+            conn.execute("DELETE FROM card_tombstones")
+            conn.execute("UPDATE revisions SET value = (SELECT value FROM revisions WHERE name = 'cards') "
+                         "WHERE name = 'deleted_floor'")
+
+    def create_card(self, front, back, reverse=False):
+        today = datetime.now().strftime("%Y-%m-%d")
+        card = self._new_card(uuid.uuid4().hex, front, back, reverse, today)
+        with self._transaction() as conn:
+            self._insert_card(conn, card)
+            if reverse:
+                self._insert_reverse_card(conn, card, today)
+        return card['id']
+
+    @staticmethod
+    def _new_card(card_id, front, back, reverse, today):
+        return {"id": card_id, "front": front, "back": back, "reverse": reverse, "easiness_factor": 2.5,
+                "interval": 1, "repetitions": 0, "review_date": today, "created_date": today}
+
+    def _insert_reverse_card(self, conn, card, today):
+        reverse_card = self._new_card(uuid.uuid4().hex, card['back'], card['front'], False, today)
+        reverse_card['pair_id'] = card['id']
+        self._insert_card(conn, reverse_card)
+        conn.execute("UPDATE cards SET pair_id = ? WHERE id = ?", (reverse_card['id'], card['id']))
+
+    def get_card(self, card_id):
+        row = self._connection().execute("SELECT * FROM cards WHERE id = ?", (card_id,)).fetchone()
+        return self._card_dict(row) if row else None
+
+    def list_cards(self, offset=0, limit=None, include_reverse=True):
+        where = '' if include_reverse else "WHERE reverse = 0"
+        rows = self._connection().execute(f"SELECT * FROM cards {where} ORDER BY rowid {_page_clause(offset, limit)}")
+        return [self._card_dict(row) for row in rows]
+
+    def search_cards(self, query, limit=50):
+        if not tokenize(query):
+            return []
+        match, params = self._match('cards', 'c', query)
+        rows = self._connection().execute(f"SELECT c.* FROM cards c {match} ORDER BY c.rowid LIMIT ?", params + [limit])
+        return [self._card_dict(row) for row in rows]
+
+    def get_review_forecast(self, days=forecast.DEFAULT_DAYS, today=None, ratings=forecast.DEFAULT_RATINGS):
+        rows = self._connection().execute(
+            "SELECT review_date, interval, easiness_factor, repetitions FROM cards").fetchall()
+        columns = tuple(zip(*rows)) or ((), (), (), ())
+        return forecast.review_forecast(*columns, today=today, days=days, ratings=ratings)
+
+    def get_card_revision(self):
+        return self._revision(self._connection(), 'cards')
+
+    def get_card_changes(self, since=0):
+        conn = self._connection()
+        revision = self._revision(conn, 'cards')
+        full = since <= 0 or since < self._revision(conn, 'deleted_floor')
+        if full:
+            return {'revision': revision, 'full': True, 'cards': self.load_anki_data()['cards'], 'deleted': []}
+        if since >= revision:
+            return {'revision': revision, 'full': False, 'cards': [], 'deleted': []}
+        rows = conn.execute("SELECT * FROM cards WHERE revision > ? ORDER BY rowid", (since,))
+        cards = [self._card_dict(row) for row in rows]
+        deleted = [row[0] for row in conn.execute("SELECT id FROM card_tombstones WHERE revision > ? ORDER BY rowid",
+                                                  (since,))]
+        return {'revision': revision, 'full': False, 'cards': cards, 'deleted': deleted}
+
+    def update_card(self, card_id, front, back, reverse=False):
+        with self._transaction() as conn:
+            card = self.get_card(card_id)
+            if not card:
+                return
+            reverse_card = self.get_card(card['pair_id']) if card['reverse'] and card.get('pair_id') else None
+            conn.execute("UPDATE cards SET front = ?, back = ?, reverse = ? WHERE id = ?",
+                         (front, back, reverse, card_id))
+            if reverse and not reverse_card:
+                card.update(front=front, back=back)
+                self._insert_reverse_card(conn, card, datetime.now().strftime("%Y-%m-%d"))
+            elif not reverse and reverse_card:
+                conn.execute("DELETE FROM cards WHERE id = ?", (reverse_card['id'],))
+                conn.execute("UPDATE cards SET pair_id = NULL WHERE id = ?", (card_id,))
+                self._prune_tombstones(conn)
+            elif reverse and reverse_card:
+                conn.execute("UPDATE cards SET front = ?, back = ? WHERE id = ?", (back, front, reverse_card['id']))
+
+    def delete_card(self, card_id):
+        with self._transaction() as conn:
+            card = self.get_card(card_id)
+            if not card:
+                return
+            conn.execute("DELETE FROM cards WHERE id = ?", (card_id,))
+            if card.get('pair_id') and card['reverse']:
+                conn.execute("DELETE FROM cards WHERE id = ?", (card['pair_id'],))
+            elif card.get('pair_id'):
+                conn.execute("UPDATE cards SET pair_id = NULL, reverse = 0 WHERE id = ?", (card['pair_id'],))
+            self._prune_tombstones(conn)
+
+    def migrate_reverse_pairs(self):
+        with self._transaction() as conn:
+            cards = self.load_anki_data()['cards']
+            link_reverse_pairs(cards)
+            conn.executemany("UPDATE cards SET pair_id = ? WHERE id = ?",
+                             [(card['pair_id'], card['id']) for card in cards if card.get('pair_id')])
+        return sum(1 for card in cards if card.get('reverse') and card.get('pair_id'))
+
+    def get_due_cards(self):
+        today = datetime.now().strftime("%Y-%m-%d")
+        rows = self._connection().execute("SELECT * FROM cards WHERE review_date <= ? ORDER BY review_date, id", (today,))
+        return [self._card_dict(row) for row in rows]
+
+    def process_card_review(self, card_id, rating):
+        with self._transaction() as conn:
+            card = self.get_card(card_id)
+            if card:
+                apply_sm2(card, rating)
+                conn.execute("UPDATE cards SET easiness_factor = ?, interval = ?, repetitions = ?, review_date = ? "
+                             "WHERE id = ?", (card['easiness_factor'], card['interval'], card['repetitions'],
+                                              card['review_date'], card_id))
+
+    def process_card_reviews(self, reviews):
+        reviews = [(card_id, rating, parse_reviewed_at(reviewed_at)) for card_id, rating, reviewed_at in reviews]
+        applied = 0
+        with self._transaction() as conn:
+            for card_id, rating, reviewed_at in reviews:
+                card = self.get_card(card_id)
+                if card:
+                    apply_sm2(card, rating, reviewed_at)
+                    conn.execute("UPDATE cards SET easiness_factor = ?, interval = ?, repetitions = ?, "
+                                 "review_date = ? WHERE id = ?", (card['easiness_factor'], card['interval'],
+                                                                  card['repetitions'], card['review_date'], card_id))
+                    applied += 1
+        return applied
+
+
+def migrate_from_json(db_path, anki_file):
+    """One-shot import of data_handler's JSON files and anki.json into a SQLite database.
+
+    Projects are read as the JSON backend serves them: journals replayed, both tiers merged in order and
+    projects an interrupted archive move left in both files imported once.
+    """
+    backend = SqliteBackend(db_path)
+    with backend.batch():
+        projects = read_json_data()['projects']
+        if projects:
+            backend.save_data({"projects": projects})
+        if os.path.exists(anki_file):
+            with open(anki_file, 'rb') as file:
+                backend.save_anki_data(codec.loads(file.read()))
+    return backend
+
+
+if __name__ == "__main__":
+    # Usage: python sqlite_backend.py migrate [db_path]
+    import config
+    from anki import ANKI_FILE
+
+    if len(sys.argv) < 2 or sys.argv[1] != 'migrate':
+        print("Usage: python sqlite_backend.py migrate [db_path]")
+        sys.exit(1)
+    db_path = sys.argv[2] if len(sys.argv) > 2 else config.SQLITE_FILE
+    migrated = migrate_from_json(db_path, ANKI_FILE)
+    print(f"Migrated {len(migrated.load_data()['projects'])} projects and "
+          f"{len(migrated.load_anki_data()['cards'])} cards into {db_path}.")
@@ -0,0 +1,311 @@
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import codec
+import metrics
+from locks import FileLock, RWLock
+
+
+def file_signature(path):
+    """Returns an (mtime, size) signature for a file, or None if it doesn't exist."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def write_atomic(path, content):
+    """Replaces a file with bytes so readers see the old or the new content, never a mix, even after a crash.
+
+    Writes a temp file, fsyncs it, then renames it over the target.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    if hasattr(os, 'O_DIRECTORY'):
+        # Persist the rename itself (not supported on Windows)
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class JsonStore:
+    """Keeps a parsed JSON document in memory and only re-reads the file when it changes on disk.
+
+    Mutations can be committed as records: `apply(data, record)` performs the change in memory. In journal
+    mode the record is appended to `<path>.journal` instead of rewriting the whole file, and the journal is
+    replayed on load and folded back into the snapshot once it grows past `compact_threshold` records.
+    Files are read and written through codec, and checked against `schema` (a codec dataclass) on load if given.
+
+    Access is safe across threads and processes. Readers share an in-process read lock (see reading()), while
+    writes hold the write lock plus an exclusive lock on `<path>.lock`, and reload the document first if
+    another process changed it, so concurrent read-modify-writes never drop each other's changes.
+    """
+
+    def __init__(self, path, empty, apply=None, journal=False, compact_threshold=1000, on_load=None, schema=None):
+        self.path = path
+        self.empty = empty  # Callable returning a fresh empty document
+        self.apply = apply
+        self.journal = journal
+        self.compact_threshold = compact_threshold
+        self._data = None
+        self._signature = None
+        self._batch_depth = 0
+        self._dirty = False  # The snapshot itself needs rewriting
+        self._pending = []  # Serialized journal records not yet appended
+        self._journal_length = 0
+        self.on_load = on_load  # Called with every document read from disk, before anyone else sees it
+        self.schema = schema
+        self._lock = RWLock()
+        self._file_lock = FileLock(path + '.lock')
+        self._version = None  # The lock file's write counter as of our last read or write
+        self._name = os.path.basename(path)  # Label for the store's metrics
+
+    @property
+    def journal_path(self):
+        return self.path + '.journal'
+
+    def _stat(self):
+        """Returns a signature covering every file the document is built from."""
+        if self.journal:
+            return (file_signature(self.path), file_signature(self.journal_path))
+        return file_signature(self.path)
+
+    def _read(self):
+        """Parses the snapshot from disk and replays the journal on top of it."""
+        started = time.perf_counter()
+        data = self._read_snapshot()
+        if self.journal:
+            self._replay_journal(data)
+        metrics.STORE_LOADS.inc(self._name)
+        metrics.STORE_PARSE_SECONDS.observe(time.perf_counter() - started, self._name)
+        if self.schema:
+            try:
+                codec.validate(data, self.schema)
+            except codec.SchemaError as e:
+                print(f"WARNING: {self.path} doesn't match its schema: {e}")
+        return data
+
+    def _read_snapshot(self):
+        if not os.path.exists(self.path):
+            return self.empty()
+        try:
+            with open(self.path, 'rb') as file:
+                text = file.read()
+            metrics.STORE_READ_BYTES.inc(self._name, amount=len(text))
+            return codec.loads(text)
+        except ValueError:
+            # Move the damaged file aside so the next save can't silently overwrite it
+            backup = f"{self.path}.corrupt-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            os.replace(self.path, backup)
+            print(f"Error decoding JSON from {self.path}. Moved it to {backup} and started with an empty document.")
+            return self.empty()
+
+    def _replay_journal(self, data):
+        """Applies journal records newer than the snapshot."""
+        self._journal_length = 0
+        if not os.path.exists(self.journal_path):
+            return
+        good_offset = 0
+        with open(self.journal_path, 'rb') as file:
+            for line in file:
+                try:
+                    record = codec.loads(line)
+                except ValueError:
+                    # A torn write from a crash: drop it and everything after it
+                    print(f"Discarding damaged journal tail in {self.journal_path} at byte {good_offset}.")
+                    break
+                good_offset += len(line)
+                self._journal_length += 1
+                # Records up to journal_seq were already folded into the snapshot
+                if record['seq'] > data.get('journal_seq', 0):
+                    self.apply(data, record)
+                    data['journal_seq'] = record['seq']
+        metrics.STORE_READ_BYTES.inc(self._name, amount=good_offset)
+        if good_offset != os.path.getsize(self.journal_path):
+            os.truncate(self.journal_path, good_offset)
+
+    def _write(self, data):
+        """Atomically replaces the file with the serialized document."""
+        started = time.perf_counter()
+        text = codec.dumps(data)
+        metrics.STORE_SERIALIZE_SECONDS.observe(time.perf_counter() - started, self._name)
+        started = time.perf_counter()
+        write_atomic(self.path, text)
+        metrics.STORE_WRITE_SECONDS.observe(time.perf_counter() - started, self._name)
+        metrics.STORE_WRITES.inc(self._name, 'snapshot')
+        metrics.STORE_WRITTEN_BYTES.inc(self._name, amount=len(text))
+
+    def _write_snapshot(self):
+        self._write(self._data)
+        if self.journal and os.path.exists(self.journal_path):
+            # Safe to drop: the snapshot's journal_seq marks every record as already applied
+            os.remove(self.journal_path)
+        self._journal_length = 0
+
+    def _append_journal(self, lines):
+        started = time.perf_counter()
+        text = b''.join(line + b'\n' for line in lines)
+        with open(self.journal_path, 'ab') as file:
+            file.write(text)
+            file.flush()
+            os.fsync(file.fileno())
+        self._journal_length += len(lines)
+        metrics.STORE_WRITE_SECONDS.observe(time.perf_counter() - started, self._name)
+        metrics.STORE_WRITES.inc(self._name, 'journal')
+        metrics.STORE_WRITTEN_BYTES.inc(self._name, amount=len(text))
+
+    def _is_stale(self):
+        return self._data is None or self._stat() != self._signature
+
+    def _reload(self):
+        """Re-reads the document. Call with the write lock and the file lock held."""
+        # Take the signature before reading so a write racing with the read forces another reload
+        self._signature = self._stat()
+        self._version = self._file_lock.read_version()
+        self._data = self._read()
+        if self.on_load:
+            self.on_load(self._data)
+
+    def _refresh(self):
+        """Reloads the document if it changed on disk, taking the locks only when it has to."""
+        if self._dirty or self._pending or not self._is_stale():
+            # Unflushed batch changes are newer than anything on disk
+            return
+        with self._lock.write(), self._file_lock.hold(exclusive=False):
+            if self._is_stale():  # Another thread may have reloaded it while we waited
+                self._reload()
+
+    def _can_refresh(self):
+        # Inside reading() the document has to stay put until the block exits
+        return self._lock.is_writing() or not self._lock.is_reading()
+
+    def load(self):
+        """Returns the cached document, reloading it if the files were changed outside this process.
+
+        Iterating the result while other threads write is only safe inside reading() or writing().
+        """
+        if self._can_refresh():
+            self._refresh()
+        return self._data
+
+    @contextmanager
+    def reading(self):
+        """Yields the current document and keeps writers out until the block exits."""
+        while True:
+            if self._can_refresh():
+                self._refresh()
+            with self._lock.read():
+                # An invalidate() between the refresh and the lock means loading again
+                if self._data is not None or not self._can_refresh():
+                    yield self._data
+                    return
+
+    @contextmanager
+    def writing(self):
+        """Yields the current document with the write lock and the inter-process file lock held.
+
+        Use it around a load-modify-save so no other thread or process can write in between. Changes other
+        processes made are loaded first: the file lock's counter catches writes the file signature misses.
+        """
+        with self._lock.write(), self._file_lock.hold():
+            if not (self._dirty or self._pending) and (
+                    self._is_stale() or self._file_lock.read_version() != self._version):
+                self._reload()
+            yield self._data
+
+    def save(self, data):
+        """Makes the document the cached copy and writes it to disk, or defers the write inside a batch."""
+        with self.writing():
+            self._data = data
+            self._dirty = True
+            if self._batch_depth == 0:
+                self.flush()
+
+    def commit(self, record):
+        """Applies a mutation record to the document and persists it. Returns whatever `apply` returns."""
+        with self.writing() as data:
+            if not self.journal:
+                result = self.apply(data, record)
+                self.save(data)
+                return result
+            record['seq'] = data.get('journal_seq', 0) + 1
+            # Serialize before applying: the record's objects become part of the document and may change later
+            line = codec.dumps(record)
+            result = self.apply(data, record)
+            data['journal_seq'] = record['seq']
+            self._pending.append(line)
+            if self._batch_depth == 0:
+                self.flush()
+            return result
+
+    def flush(self):
+        """Writes pending changes to disk."""
+        if not self._dirty and not self._pending:
+            return
+        with self.writing():
+            try:
+                if self._dirty:
+                    # A full rewrite already contains any pending journal records
+                    self._write_snapshot()
+                else:
+                    self._append_journal(self._pending)
+                    if self._journal_length >= self.compact_threshold:
+                        self._write_snapshot()
+                # Tell other processes their copy is out of date
+                self._version = self._file_lock.read_version() + 1
+                self._file_lock.write_version(self._version)
+            except Exception:
+                # The in-memory copy holds changes that never reached the disk
+                self.invalidate()
+                raise
+            self._dirty = False
+            self._pending = []
+            self._signature = self._stat()
+
+    def compact(self):
+        """Folds the journal into a fresh snapshot."""
+        with self.writing():
+            self._dirty = True
+            if self._batch_depth == 0:
+                self.flush()
+
+    @contextmanager
+    def batch(self):
+        """Coalesces every save made inside the block into a single write when the outermost block exits.
+
+        The block holds the write lock throughout, so keep it short.
+        """
+        with self.writing():
+            self._batch_depth += 1
+            try:
+                yield self
+            finally:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    self.flush()
+
+    def invalidate(self):
+        """Drops the cached document so the next load re-reads the file."""
+        with self._lock.write():
+            self._data = None
+            self._signature = None
+            self._dirty = False
+            self._pending = []
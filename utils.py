@@ -1,14 +1,75 @@
 import os
+import time
 from flask import session
 
+import config
+
+
+class ThemeRegistry:
+    """The stylesheets in a static folder, scanned once and rescanned only when the folder's mtime changes.
+
+    The mtime itself is checked at most every `check_interval` seconds, so most renders make no syscalls.
+    Each theme is a dict with the css `file`, its `name` (the file name without .css) and a display `label`.
+    """
+
+    def __init__(self, folder, check_interval=config.THEME_CHECK_INTERVAL):
+        self.folder = folder
+        self.check_interval = check_interval
+        self._mtime = None
+        self._checked = None
+        self._state = ((), {})  # (themes, file -> theme), swapped as one so readers never see a mix
+
+    def _scan(self):
+        themes = tuple(
+            {'file': f, 'name': f[:-4], 'label': f[:-4].upper()}
+            for f in sorted(os.listdir(self.folder)) if f.endswith('.css')
+        )
+        self._state = (themes, {theme['file']: theme for theme in themes})
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._checked is not None and now - self._checked < self.check_interval:
+            return
+        self._checked = now
+        try:
+            mtime = os.stat(self.folder).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._mtime:
+            self._mtime = mtime
+            if mtime is None:
+                self._state = ((), {})
+            else:
+                self._scan()
+
+    def themes(self):
+        """Returns the themes sorted by file name."""
+        self._refresh()
+        return self._state[0]
+
+    def get(self, css_file):
+        """Returns the theme for a css file name, or None if there is no such stylesheet."""
+        self._refresh()
+        return self._state[1].get(css_file)
+
+
+_registries = {}
+
+def get_theme_registry(STATIC_FOLDER):
+    """Returns the shared theme registry for a static folder."""
+    registry = _registries.get(STATIC_FOLDER)
+    if registry is None:
+        registry = _registries.setdefault(STATIC_FOLDER, ThemeRegistry(STATIC_FOLDER))
+    return registry
+
 def inject_css_files(STATIC_FOLDER):
-    """Injects a list of CSS files into the template context."""
-    css_files = [f for f in os.listdir(STATIC_FOLDER) if f.endswith('.css')]
-    return {'css_files': css_files}
+    """Injects the available themes (and their css file names) into the template context."""
+    themes = get_theme_registry(STATIC_FOLDER).themes()
+    return {'themes': themes, 'css_files': [theme['file'] for theme in themes]}
 
 def set_style(request, STATIC_FOLDER):
     """Sets the selected stylesheet in the session."""
     selected_style = request.form.get('selected_style')
-    if selected_style in [f for f in os.listdir(STATIC_FOLDER) if f.endswith('.css')]:
+    if get_theme_registry(STATIC_FOLDER).get(selected_style):
         session['current_style'] = selected_style
-    return selected_style
\ No newline at end of file
+    return selected_style